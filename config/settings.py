@@ -23,6 +23,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "internship_b24.metrics.MetricsMiddleware",
+    "internship_b24.profiling.RestProfilerMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -45,12 +47,122 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "internship_b24.profiling.rest_profile",
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = "config.wsgi.application"
+ASGI_APPLICATION = "config.asgi.application"
+
+# default — кэш процесса; shared — общий для всех воркеров на хосте (состояние
+# фоновых задач internship_b24/jobs.py: статус опрашивает любой воркер)
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "shared": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get("SHARED_CACHE_DIR", "/tmp/internship_b24_cache"),
+    },
+}
+
+# Async REST-клиент (internship_b24/aio.py): параллельных запросов к порталу
+BITRIX_ASYNC_CONCURRENCY = 8
+
+# Профилирование REST-вызовов (internship_b24/profiling.py):
+# заголовок Server-Timing, оверлей в base.html, лог для manage.py bx_profile_report
+BITRIX_PROFILER = DEBUG
+BITRIX_PROFILER_OVERLAY = DEBUG
+BITRIX_PROFILER_LOG = BASE_DIR / "bx_profile.jsonl"
+
+# Метрики Prometheus на /metrics (internship_b24/metrics.py).
+# Для нескольких воркеров gunicorn укажите общий каталог METRICS_MULTIPROC_DIR.
+# Скрейпер передаёт Authorization: Bearer <METRICS_TOKEN>; без токена — 403.
+METRICS_ENABLED = True
+METRICS_MULTIPROC_DIR = os.environ.get("METRICS_MULTIPROC_DIR")
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Импорт контактов: сколько живут индексы портала в кэше процесса (для
+# предпросмотра и следующего за ним импорта) и файлы плана предпросмотра
+CONTACTS_INDEX_TTL = 300
+CONTACTS_PLAN_TTL = 3600
+
+# Загрузка файлов импорта по частям (internship_b24/contacts/uploads.py):
+# каталог (по умолчанию во временном), срок жизни незавершённых загрузок,
+# максимальный размер файла и одной части
+CONTACTS_UPLOAD_DIR = os.environ.get("CONTACTS_UPLOAD_DIR")
+CONTACTS_UPLOAD_TTL = 24 * 3600
+CONTACTS_UPLOAD_MAX_SIZE = 2 * 1024 ** 3
+CONTACTS_UPLOAD_MAX_CHUNK = 8 * 1024 * 1024
+
+# CSV с диска от этого размера разбирается пулом процессов
+# (internship_b24/contacts/parallel_parse.py); None — по числу ядер
+CONTACTS_PARSE_WORKERS = None
+CONTACTS_PARALLEL_PARSE_MIN_SIZE = 16 * 1024 * 1024
+
+# Дисковый кэш столбцов контактов (internship_b24/contacts/snapshots.py):
+# разобранные файлы импорта и снимки экспорта за период. Снимок моложе
+# CONTACTS_EXPORT_SNAPSHOT_TTL отдаётся без запросов, старше — докачиваются
+# изменения по DATE_MODIFY; раз в CONTACTS_EXPORT_FULL_REFRESH — целиком
+# (так пропадают удалённые в портале контакты)
+CONTACTS_CACHE_DIR = os.environ.get("CONTACTS_CACHE_DIR")
+CONTACTS_PARSE_CACHE_TTL = 3600
+CONTACTS_EXPORT_SNAPSHOT_TTL = 300
+CONTACTS_EXPORT_FULL_REFRESH = 7 * 24 * 3600
+
+# Общий лимитер запросов к порталу (internship_b24/ratelimit.py): запросов/с, запас
+BITRIX_RATE_LIMIT = (2.0, 50)
+# Потоков для фоновых задач (internship_b24/jobs.py) и отдельно — для мелкой
+# фоновой работы вроде предзагрузки страниц (run_in_background)
+BACKGROUND_JOB_WORKERS = 2
+BACKGROUND_LIGHT_WORKERS = 2
+
+# application_token исходящих событий Bitrix24 (internship_b24/bx_events.py);
+# пока пусто, обработчики событий отвечают 403
+BITRIX_EVENTS_APPLICATION_TOKEN = os.environ.get("BITRIX_EVENTS_APPLICATION_TOKEN", "")
+# Кэш авторизации main_auth(on_cookies=True) (internship_b24/bx_auth.py):
+# сколько секунд и сколько разных пользователей помнит процесс; по каким
+# cookies узнавать пользователя. None — по тем, что прочитал сам main_auth
+# (до первой успешной авторизации — по всем cookies запроса); кортеж имён
+# задаёт их явно. Запрос без этих cookies идёт в обычный main_auth без кэша
+BITRIX_AUTH_CACHE_TTL = 60
+BITRIX_AUTH_CACHE_SIZE = 1024
+BITRIX_AUTH_COOKIES = None
+# Сделки (internship_b24/services.py): сколько секунд кэшируются справочники
+# (crm.deal.fields, стадии, типы, валюты)
+DEAL_MANUALS_TTL = 600
+# Таблица последних сделок (internship_b24/deals_snapshot.py): строк по
+# умолчанию и максимум для ?n=; через сколько секунд локальная копия
+# докачивает изменения и как часто перечитывается целиком
+DEALS_TOP_N = 10
+DEALS_TOP_MAX_N = 100
+DEALS_SNAPSHOT_TTL = 60
+DEALS_SNAPSHOT_FULL_REFRESH = 24 * 3600
+# Постраничный список сделок (internship_b24/deals_list.py): сколько секунд
+# живёт закэшированная страница crm.deal.list
+DEALS_PAGE_TTL = 30
+# Локальный каталог товаров для автокомплита (internship_b24/qr/catalog.py):
+# как часто процесс проверяет, не изменилась ли таблица, секунд
+PRODUCT_INDEX_CHECK_INTERVAL = 5
+# сколько разных запросов автокомплита помнит индекс и сколько секунд
+# браузер может повторно использовать ответ (Cache-Control: max-age)
+PRODUCT_SEARCH_CACHE_SIZE = 1024
+PRODUCT_SEARCH_BROWSER_TTL = 60
+# Массовая генерация QR (internship_b24/qr/bulk.py): процессов отрисовки
+# (None — по числу ядер) и предел товаров за один запрос
+QR_BULK_WORKERS = None
+QR_BULK_MAX_PRODUCTS = 10000
+# TrueType-шрифт с кириллицей для подписей PDF-этикеток; None — поискать
+# DejaVu Sans / Liberation Sans в системе, не нашёлся — подписи без названий
+QR_LABEL_FONT = None
+# Сколько секунд публичная страница товара доверяет *_cached полям ссылки
+# после refresh_product_links (запускать по расписанию чаще этого срока)
+PRODUCT_LINK_FRESH_TTL = 15 * 60
+# Счётчики сканирований QR копятся в памяти процесса и пишутся в
+# ProductLinkStats раз в столько секунд (internship_b24/qr/scans.py);
+# пока БД недоступна, буфер держит не больше QR_SCAN_MAX_PENDING пар (ссылка, день)
+QR_SCAN_FLUSH_INTERVAL = 5
+QR_SCAN_MAX_PENDING = 100_000
 
 # По умолчанию SQLite, можно переопределить в local_settings.py для PostgreSQL
 DATABASES = {
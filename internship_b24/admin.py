@@ -0,0 +1,23 @@
+from django.contrib import admin
+
+from internship_b24.qr.models import ProductLink, ProductLinkStats
+
+
+@admin.register(ProductLinkStats)
+class ProductLinkStatsAdmin(admin.ModelAdmin):
+    list_display = ("day", "link", "product_id", "scans")
+    list_filter = ("day",)
+    search_fields = ("link__title_cached", "=link__product_id")
+    date_hierarchy = "day"
+    list_select_related = ("link",)
+    ordering = ("-day", "-scans")
+
+    @admin.display(ordering="link__product_id", description="ID товара")
+    def product_id(self, obj):
+        return obj.link.product_id
+
+
+@admin.register(ProductLink)
+class ProductLinkAdmin(admin.ModelAdmin):
+    list_display = ("id", "product_id", "title_cached", "created_at", "refreshed_at")
+    search_fields = ("title_cached", "=product_id")
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import asyncio
+import weakref
+from functools import wraps
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .bx_auth import main_auth
+from .bx_batch import http_build_query
+from .profiling import profile_rest_call_async
+
+PAGE_SIZE = 50  # размер страницы списочных методов Bitrix
+
+# один пул соединений на event loop: httpx.AsyncClient нельзя делить между циклами
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=getattr(settings, "BITRIX_ASYNC_TIMEOUT", 30),
+            limits=httpx.Limits(
+                max_connections=getattr(settings, "BITRIX_ASYNC_MAX_CONNECTIONS", 100),
+                max_keepalive_connections=20,
+            ),
+        )
+        _clients[loop] = client
+    return client
+
+
+class BitrixAsyncError(Exception):
+    def __init__(self, method: str, error: str, description: str = ""):
+        super().__init__(f"{method}: {error} {description}".strip())
+        self.method = method
+        self.error = error
+
+
+class AsyncBitrixClient:
+    """
+    Асинхронный REST-клиент поверх токена из main_auth.
+    Независимые вызовы можно запускать конкурентно через asyncio.gather;
+    число одновременных запросов к порталу ограничено семафором.
+    """
+
+    def __init__(self, but, concurrency: Optional[int] = None, base_url: Optional[str] = None):
+        self.but = but
+        self._base_url = base_url
+        self._sem = asyncio.Semaphore(
+            concurrency or getattr(settings, "BITRIX_ASYNC_CONCURRENCY", 8)
+        )
+
+    @property
+    def base_url(self) -> str:
+        if self._base_url:
+            return self._base_url.rstrip("/")
+        domain = getattr(self.but, "domain", None) or settings.APP_SETTINGS.portal_domain
+        return f"https://{domain}/rest"
+
+    @profile_rest_call_async
+    async def call(self, method: str, params: Optional[dict] = None) -> dict:
+        """Сырой ответ метода: {"result": ..., "total": ..., "next": ...}."""
+        params = params or {}
+        data = await self._post(method, params)
+        if data.get("error") in ("expired_token", "invalid_token"):
+            # токен обновляет синхронный код integration_utils
+            await sync_to_async(self.but.refresh)()
+            data = await self._post(method, params)
+        if "error" in data:
+            raise BitrixAsyncError(method, data.get("error"), data.get("error_description", ""))
+        return data
+
+    async def _post(self, method: str, params: dict) -> dict:
+        url = f"{self.base_url}/{method}.json"
+        async with self._sem:
+            resp = await get_http_client().post(url, json={**params, "auth": self.but.auth_token})
+        try:
+            return resp.json()
+        except ValueError:
+            resp.raise_for_status()
+            raise
+
+    async def call_method(self, method: str, params: Optional[dict] = None) -> Any:
+        return (await self.call(method, params)).get("result")
+
+    async def call_list(self, method: str, params: Optional[dict] = None) -> List[Any]:
+        """
+        Аналог call_list_method: первая страница, затем все остальные
+        страницы параллельно (start = 50, 100, ...).
+        """
+        params = params or {}
+        first = await self.call(method, params)
+        items = _as_list(first.get("result"))
+        total = int(first.get("total") or 0)
+        if not first.get("next") or total <= len(items):
+            return items
+
+        pages = await asyncio.gather(*(
+            self.call(method, {**params, "start": start})
+            for start in range(PAGE_SIZE, total, PAGE_SIZE)
+        ))
+        for page in pages:
+            items.extend(_as_list(page.get("result")))
+        return items
+
+    async def batch(self, calls: Dict[str, Tuple[str, Optional[dict]]]) -> Dict[str, Any]:
+        """
+        Один batch-запрос: {key: (method, params)} -> {key: result}.
+        Команды с ошибкой в ответ не попадают.
+        """
+        cmd = {}
+        for key, (method, params) in calls.items():
+            query = http_build_query(params or {})
+            cmd[key] = f"{method}?{query}" if query else method
+        data = await self.call_method("batch", {"halt": 0, "cmd": cmd})
+        result = (data or {}).get("result") or {}
+        return result if isinstance(result, dict) else {}
+
+
+def _as_list(value: Any) -> List[Any]:
+    if isinstance(value, list):
+        return value
+    if isinstance(value, dict):
+        # некоторые методы отдают {"items": [...]} или {"ID": {...}}
+        return list(value.get("items", value.values()))
+    return []
+
+
+def async_main_auth(**auth_kwargs):
+    """
+    main_auth для async-вьюх: авторизация (работа с БД и cookies)
+    выполняется синхронно в потоке, сама вьюха — в event loop.
+    """
+    def decorator(view):
+        @main_auth(**auth_kwargs)
+        def _authorize(request, *args, **kwargs):
+            return None
+
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            denied = await sync_to_async(_authorize)(request, *args, **kwargs)
+            if denied is not None:
+                return denied
+            return await view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
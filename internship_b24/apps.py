@@ -4,3 +4,10 @@ class InternshipB24Config(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "internship_b24"
     verbose_name = "Internship Bitrix24"
+
+    def ready(self):
+        from . import bx_auth, metrics, profiling
+
+        profiling.install()
+        metrics.install()
+        bx_auth.install()
@@ -0,0 +1,900 @@
+"""
+Сценарии бенчмарков для `manage.py bench`.
+
+Каждый сценарий готовит данные (симулированный портал, файлы) и возвращает
+Prepared: run() — измеряемая часть, cleanup() — уборка после замера.
+Время подготовки в результаты не входит.
+
+Сценарии пишут в БД и кэш, поэтому `manage.py bench` гоняет их внутри
+isolated_environment(): на тестовой БД (как `manage.py test`) и на
+отдельных LocMem-кэшах — рабочие данные не трогаются.
+"""
+from __future__ import annotations
+
+import csv
+import gc
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from .bx_simulator import SimulatedPortal, SimulatedToken, patch_webhook
+
+
+@dataclass
+class BenchOptions:
+    latency: float = 0.0
+    workdir: str = field(default_factory=lambda: os.path.join(tempfile.gettempdir(), "b24_bench"))
+    seed: int = 0
+
+
+@dataclass
+class Prepared:
+    run: Callable[[], Optional[Dict[str, Any]]]
+    portal: Optional[SimulatedPortal] = None
+    cleanup: Callable[[], None] = lambda: None
+
+
+@dataclass
+class Scenario:
+    name: str
+    sizes: List[int]
+    prepare: Callable[[int, BenchOptions], Prepared]
+    description: str = ""
+
+
+SCENARIOS: Dict[str, Scenario] = {}
+
+
+def scenario(name: str, sizes: List[int]):
+    def decorator(fn: Callable[[int, BenchOptions], Prepared]):
+        SCENARIOS[name] = Scenario(name, sizes, fn, (fn.__doc__ or "").strip())
+        return fn
+    return decorator
+
+
+def _request(but, path: str = "/"):
+    """GET-запрос с токеном, как после main_auth."""
+    from django.test import RequestFactory
+
+    request = RequestFactory().get(path)
+    request.bitrix_user_token = but
+    return request
+
+
+@contextmanager
+def isolated_environment():
+    """Тестовая БД и свои кэши на время прогона; после — всё удаляется."""
+    from django.test.utils import override_settings, setup_databases, teardown_databases
+
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        with override_settings(CACHES={
+            name: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": f"b24-bench-{name}"}
+            for name in ("default", "shared")
+        }):
+            yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+
+def run_scenario(sc: Scenario, size: int, opts: BenchOptions, memory: bool = True) -> Dict[str, Any]:
+    result: Dict[str, Any] = {"scenario": sc.name, "size": size}
+
+    prepared = sc.prepare(size, opts)
+    try:
+        if prepared.portal is not None:
+            prepared.portal.reset_stats()
+        gc.collect()
+        t0 = time.perf_counter()
+        extra = prepared.run() or {}
+        result["wall_s"] = round(time.perf_counter() - t0, 4)
+        result.update(extra)
+        if prepared.portal is not None:
+            result["rest_requests"] = prepared.portal.requests
+            result["rest_calls"] = dict(sorted(prepared.portal.calls.items()))
+            result["rest_bytes"] = prepared.portal.bytes_sent
+    finally:
+        prepared.cleanup()
+
+    if memory:
+        # отдельный прогон: tracemalloc заметно замедляет код и исказил бы время
+        prepared = sc.prepare(size, opts)
+        try:
+            gc.collect()
+            tracemalloc.start()
+            extra = prepared.run() or {}
+            _, peak = tracemalloc.get_traced_memory()
+            # метрики, которые сценарий считает только под tracemalloc
+            for key, value in extra.items():
+                result.setdefault(key, value)
+            tracemalloc.stop()
+            result["peak_mem_mb"] = round(peak / 2 ** 20, 2)
+        finally:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            prepared.cleanup()
+
+    return result
+
+
+# --------- генерация файлов ---------
+
+HEADER = ["имя", "фамилия", "номер телефона", "почта", "компания"]
+
+
+def _fake_rows(size: int, seed: int, companies: int = 1000):
+    rnd = random.Random(seed)
+    first = ["Иван", "Анна", "Олег", "Мария", "Пётр", ""]
+    last = ["Иванов", "Петрова", "Сидоров", "Смирнова", ""]
+    for i in range(size):
+        # ~5% дублей внутри файла и немного пустых строк
+        n = rnd.randrange(i) if i and rnd.random() < 0.05 else i
+        yield [
+            rnd.choice(first),
+            rnd.choice(last),
+            f"8 (9{n % 100:02d}) {n:07d}"[:18],
+            f"person{n}@example.org",
+            f"ООО Ромашка {rnd.randint(1, companies)}",
+        ]
+
+
+def ensure_csv(size: int, opts: BenchOptions) -> str:
+    os.makedirs(opts.workdir, exist_ok=True)
+    path = os.path.join(opts.workdir, f"contacts_{size}_{opts.seed}.csv")
+    if not os.path.exists(path):
+        with open(path + ".tmp", "w", encoding="utf-8-sig", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(HEADER)
+            w.writerows(_fake_rows(size, opts.seed))
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def ensure_xlsx(size: int, opts: BenchOptions) -> str:
+    from openpyxl import Workbook
+
+    os.makedirs(opts.workdir, exist_ok=True)
+    path = os.path.join(opts.workdir, f"contacts_{size}_{opts.seed}.xlsx")
+    if not os.path.exists(path):
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(HEADER)
+        for row in _fake_rows(size, opts.seed):
+            ws.append(row)
+        wb.save(path + ".tmp")
+        os.replace(path + ".tmp", path)
+    return path
+
+
+class _NamedFile:
+    """Открытый файл с .name, как у UploadedFile."""
+
+    def __init__(self, path: str):
+        self._f = open(path, "rb")
+        self.name = os.path.basename(path)
+
+    def __getattr__(self, item):
+        return getattr(self._f, item)
+
+
+# --------- сценарии ---------
+
+def _portal(opts: BenchOptions, **kwargs) -> SimulatedPortal:
+    kwargs.setdefault("contacts", 0)
+    kwargs.setdefault("companies", 0)
+    kwargs.setdefault("deals", 0)
+    kwargs.setdefault("users", 0)
+    kwargs.setdefault("departments", 0)
+    kwargs.setdefault("products", 0)
+    return SimulatedPortal(latency=opts.latency, seed=opts.seed, **kwargs)
+
+
+def _isolated_contacts_cache(opts: BenchOptions) -> Callable[[], None]:
+    """
+    Свой каталог дискового кэша столбцов на прогон: снимки экспорта с
+    прошлых замеров не подменяют холодный экспорт. Возвращает уборку.
+    """
+    from django.test import override_settings
+
+    os.makedirs(opts.workdir, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix="contacts_cache_", dir=opts.workdir)
+    override = override_settings(CONTACTS_CACHE_DIR=directory)
+    override.enable()
+
+    def cleanup():
+        override.disable()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return cleanup
+
+
+def _import_prepared(path: str, size: int, opts: BenchOptions) -> Prepared:
+    from .contacts.services import import_contacts, parse_uploaded_file
+
+    portal = _portal(opts, contacts=max(1000, size // 10), companies=1000)
+    but = SimulatedToken(portal)
+
+    def run():
+        upload = _NamedFile(path)
+        try:
+            rows = parse_uploaded_file(upload)
+        finally:
+            upload.close()
+        stats = import_contacts(but, rows)
+        return {"rows": len(rows), **stats}
+
+    return Prepared(run, portal)
+
+
+@scenario("import_preview", sizes=[1_000, 100_000])
+def bench_import_preview(size: int, opts: BenchOptions) -> Prepared:
+    """Предпросмотр импорта CSV: разбор, нормализация, дубли, компании — без записи."""
+    from .contacts import preview
+    from .contacts.services import parse_uploaded_file
+
+    path = ensure_csv(size, opts)
+    portal = _portal(opts, contacts=max(1000, size // 10), companies=1000)
+    but = SimulatedToken(portal)
+
+    def run():
+        upload = _NamedFile(path)
+        try:
+            rows = parse_uploaded_file(upload)
+        finally:
+            upload.close()
+        result = preview.preview_import(but, rows, create_companies=True)
+        return {"rows": len(rows), **result["counts"]}
+
+    def cleanup():
+        # индексы портала не должны переживать сценарий
+        preview._indexes.clear()
+
+    return Prepared(run, portal, cleanup)
+
+
+@scenario("import_csv", sizes=[1_000, 100_000, 1_000_000])
+def bench_import_csv(size: int, opts: BenchOptions) -> Prepared:
+    """Импорт контактов из CSV: парсинг, дедупликация, batch-создание."""
+    return _import_prepared(ensure_csv(size, opts), size, opts)
+
+
+@scenario("import_xlsx", sizes=[1_000, 100_000, 1_000_000])
+def bench_import_xlsx(size: int, opts: BenchOptions) -> Prepared:
+    """Импорт контактов из XLSX."""
+    return _import_prepared(ensure_xlsx(size, opts), size, opts)
+
+
+@scenario("export_csv", sizes=[10_000, 100_000])
+def bench_export_csv(size: int, opts: BenchOptions) -> Prepared:
+    """Экспорт контактов в CSV за весь период."""
+    from .contacts.services import export_contacts_to_csv
+
+    portal = _portal(opts, contacts=size, companies=1000)
+    but = SimulatedToken(portal)
+
+    def run():
+        data = export_contacts_to_csv(but, None, None)
+        return {"bytes": len(data)}
+
+    return Prepared(run, portal, _isolated_contacts_cache(opts))
+
+
+@scenario("export_csv_repeat", sizes=[10_000, 100_000])
+def bench_export_csv_repeat(size: int, opts: BenchOptions) -> Prepared:
+    """Повторный экспорт того же периода: второй раз — из снимка на диске."""
+    from .contacts.services import export_contacts_to_csv
+
+    portal = _portal(opts, contacts=size, companies=1000)
+    but = SimulatedToken(portal)
+
+    def run():
+        t0 = time.perf_counter()
+        cold = export_contacts_to_csv(but, None, None)
+        cold_s = time.perf_counter() - t0
+        requests = portal.requests
+        t0 = time.perf_counter()
+        warm = export_contacts_to_csv(but, None, None)
+        warm_s = time.perf_counter() - t0
+        if warm != cold:
+            raise AssertionError("export from snapshot differs")
+        return {
+            "cold_s": round(cold_s, 4),
+            "warm_s": round(warm_s, 4),
+            "warm_rest_requests": portal.requests - requests,
+            "bytes": len(warm),
+        }
+
+    return Prepared(run, portal, _isolated_contacts_cache(opts))
+
+
+@scenario("export_csv_incremental", sizes=[10_000, 100_000])
+def bench_export_csv_incremental(size: int, opts: BenchOptions) -> Prepared:
+    """Ежедневный экспорт: 1% контактов изменился, докачиваются только они."""
+    from django.test import override_settings
+
+    from .contacts.services import export_contacts_to_csv
+
+    portal = _portal(opts, contacts=size, companies=1000)
+    but = SimulatedToken(portal)
+    changed = [str(i) for i in range(1, size + 1, 100)]
+
+    def run():
+        with override_settings(CONTACTS_EXPORT_SNAPSHOT_TTL=0):
+            t0 = time.perf_counter()
+            export_contacts_to_csv(but, None, None)
+            full_s = time.perf_counter() - t0
+            full_requests = portal.requests
+
+            portal.touch(portal.contacts, changed, NAME="Изменён")
+            t0 = time.perf_counter()
+            data = export_contacts_to_csv(but, None, None)
+            delta_s = time.perf_counter() - t0
+            delta_requests = portal.requests - full_requests
+            changes = export_contacts_to_csv(but, None, None, changes_only=True)
+        if data.count("Изменён") != len(changed):
+            raise AssertionError("incremental export missed changes")
+        return {
+            "full_s": round(full_s, 4),
+            "delta_s": round(delta_s, 4),
+            "full_rest_requests": full_requests,
+            "delta_rest_requests": delta_requests,
+            "changed": len(changed),
+            "changes_file_rows": changes.count("\n") - 1,
+        }
+
+    return Prepared(run, portal, _isolated_contacts_cache(opts))
+
+
+@scenario("export_xlsx", sizes=[10_000])
+def bench_export_xlsx(size: int, opts: BenchOptions) -> Prepared:
+    """Экспорт контактов в XLSX за весь период."""
+    from .contacts.services import export_contacts_to_xlsx
+
+    portal = _portal(opts, contacts=size, companies=1000)
+    but = SimulatedToken(portal)
+
+    def run():
+        data = export_contacts_to_xlsx(but, None, None)
+        return {"bytes": len(data)}
+
+    return Prepared(run, portal, _isolated_contacts_cache(opts))
+
+
+@scenario("employees_list", sizes=[50, 500, 5_000])
+def bench_employees_list(size: int, opts: BenchOptions) -> Prepared:
+    """employees_list_view: пользователи, отделы, звонки за 24 часа, рендер."""
+    from django.template.loader import render_to_string
+
+    from .employees.services import collect_employee_rows
+
+    portal = _portal(opts, users=size, departments=max(5, size // 20), calls_per_user=3)
+    request = _request(SimulatedToken(portal))
+
+    def run():
+        rows = collect_employee_rows(request)
+        html = render_to_string("employees/list.html", {"rows": rows}, request)
+        return {"rows": len(rows), "html_bytes": len(html)}
+
+    return Prepared(run, portal)
+
+
+def _clear_deals(but) -> None:
+    """Копия сделок, справочники и страницы списка — только портала сценария."""
+    from django.core.cache import cache
+
+    from .deals_list import invalidate_pages
+    from .models import DealSnapshot, OpenDeal
+    from .ratelimit import portal_key
+
+    portal = portal_key(but)
+    cache.delete(f"deal_manuals:{portal}")
+    invalidate_pages(portal)
+    OpenDeal.objects.filter(portal=portal).delete()
+    DealSnapshot.objects.filter(portal=portal).delete()
+
+
+@scenario("deal_create", sizes=[1_000, 10_000])
+def bench_deal_create(size: int, opts: BenchOptions) -> Prepared:
+    """Создание сделки и редирект на топ-10: REST-запросы при холодном и тёплом кэше."""
+    from django.test import RequestFactory
+
+    from .services import get_manuals
+    from .views import deal_create, deals_top10
+
+    portal = _portal(opts, deals=size)
+    but = SimulatedToken(portal)
+
+    def create_and_follow(n: int) -> int:
+        request = RequestFactory().post("/", {"title": f"bench {n}", "opportunity": "100"})
+        request.bitrix_user_token = but
+        request._dont_enforce_csrf_checks = True
+        requests = portal.requests
+        deal_create(request)
+        deals_top10(_request(but))
+        return portal.requests - requests
+
+    def run():
+        _clear_deals(but)
+        cold = create_and_follow(0)
+        warm = [create_and_follow(n) for n in range(1, 21)]
+        get_manuals(but)
+        return {"cold_rest_requests": cold, "warm_rest_requests": max(warm)}
+
+    return Prepared(run, portal, cleanup=lambda: _clear_deals(but))
+
+
+@scenario("deals_top", sizes=[1_000, 10_000])
+def bench_deals_top(size: int, opts: BenchOptions) -> Prepared:
+    """Таблица последних сделок: первая загрузка, повтор из копии и докачка 1% изменений."""
+    from django.test import override_settings
+
+    from .views import deals_top10
+
+    portal = _portal(opts, deals=size)
+    but = SimulatedToken(portal)
+    changed = [str(i) for i in range(1, size + 1, 100)]
+
+    def timed(request) -> tuple:
+        requests = portal.requests
+        t0 = time.perf_counter()
+        deals_top10(request)
+        return time.perf_counter() - t0, portal.requests - requests
+
+    def run():
+        _clear_deals(but)
+        cold_s, cold_requests = timed(_request(but))
+        warm = [timed(_request(but, f"/?n={n}")) for n in (10, 50, 100)]
+        portal.touch(portal.deals, changed, TITLE="Изменена")
+        with override_settings(DEALS_SNAPSHOT_TTL=0):
+            delta_s, delta_requests = timed(_request(but))
+        return {
+            "cold_s": round(cold_s, 4),
+            "cold_rest_requests": cold_requests,
+            "warm_ms": round(max(w[0] for w in warm) * 1e3, 2),
+            "warm_rest_requests": max(w[1] for w in warm),
+            "delta_s": round(delta_s, 4),
+            "delta_rest_requests": delta_requests,
+        }
+
+    return Prepared(run, portal, cleanup=lambda: _clear_deals(but))
+
+
+@scenario("deals_pages", sizes=[1_000, 100_000])
+def bench_deals_pages(size: int, opts: BenchOptions) -> Prepared:
+    """Постраничный список сделок: REST-запросы и время страницы при листании вперёд."""
+    from .views import deals_list
+
+    portal = _portal(opts, deals=size)
+    but = SimulatedToken(portal)
+    pages = 10
+
+    def run():
+        _clear_deals(but)
+        timings = []
+        for page in range(1, pages + 1):
+            t0 = time.perf_counter()
+            deals_list(_request(but, f"/?page={page}&sort=opportunity&dir=desc"))
+            timings.append(time.perf_counter() - t0)
+            time.sleep(max(opts.latency, 0.01) * 2)  # пользователь смотрит страницу
+        # на каждую страницу — один crm.deal.list (плюс предзагрузка страницы pages + 1)
+        return {
+            "pages": pages,
+            "first_page_ms": round(timings[0] * 1e3, 2),
+            "next_pages_ms": round(max(timings[1:]) * 1e3, 2),
+        }
+
+    return Prepared(run, portal, cleanup=lambda: _clear_deals(but))
+
+
+@scenario("companies_map", sizes=[10_000])
+def bench_companies_map(size: int, opts: BenchOptions) -> Prepared:
+    """companies_map_view: компании + адреса, склейка и рендер."""
+    from django.template.loader import render_to_string
+
+    from .map.views import collect_map_context
+
+    portal = _portal(opts, companies=size)
+    request = _request(SimulatedToken(portal))
+
+    def run():
+        context = collect_map_context(request)
+        html = render_to_string("map/map.html", context, request)
+        return {"html_bytes": len(html)}
+
+    return Prepared(run, portal)
+
+
+@scenario("product_public", sizes=[200])
+def bench_product_public(size: int, opts: BenchOptions) -> Prepared:
+    """Публичная страница товара: size запросов подряд, считаем RPS."""
+    from django.test import RequestFactory
+
+    from .qr.models import ProductLink
+    from .qr.refresh import refresh_links
+    from .qr.views import product_public_view
+
+    portal = _portal(opts, products=100)
+    link = ProductLink.objects.create(product_id=1, title_cached="bench")
+    factory = RequestFactory()
+
+    def measure() -> float:
+        t0 = time.perf_counter()
+        for _ in range(size):
+            product_public_view(factory.get(f"/product/{link.pk}/"), token=str(link.pk))
+        elapsed = time.perf_counter() - t0
+        return round(size / elapsed, 1) if elapsed else None
+
+    def run():
+        ProductLink.objects.filter(pk=link.pk).update(refreshed_at=None)
+        with patch_webhook(portal):
+            requests = portal.requests
+            rps = measure()
+            live_requests = portal.requests - requests
+            # после refresh_product_links копия свежая — страница без REST
+            refresh_links(link_ids=[link.pk])
+            requests = portal.requests
+            rps_refreshed = measure()
+            refreshed_requests = portal.requests - requests
+        return {
+            "requests": size,
+            "rps": rps,
+            "rest_per_view": round(live_requests / size, 2),
+            "rps_refreshed": rps_refreshed,
+            "rest_per_view_refreshed": round(refreshed_requests / size, 2),
+        }
+
+    return Prepared(run, portal, cleanup=link.delete)
+
+
+@scenario("parse_csv", sizes=[100_000, 1_000_000])
+def bench_parse_csv(size: int, opts: BenchOptions) -> Prepared:
+    """Разбор и нормализация CSV: один процесс против пула (parallel_parse)."""
+    from .contacts.parallel_parse import parse_csv_path
+    from .contacts.services import normalize_rows, parse_uploaded_file
+
+    path = ensure_csv(size, opts)
+    workers = max(2, os.cpu_count() or 1)
+
+    def run():
+        upload = _NamedFile(path)
+        t0 = time.perf_counter()
+        try:
+            serial = normalize_rows(parse_uploaded_file(upload))
+        finally:
+            upload.close()
+        serial_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        parallel = parse_csv_path(path, workers=workers, min_size=0)
+        parallel_s = time.perf_counter() - t0
+        if parallel != serial:
+            raise AssertionError("parallel CSV parsing differs from serial")
+        return {
+            "rows": len(serial),
+            "workers": workers,
+            "serial_rows_per_s": round(len(serial) / serial_s) if serial_s else None,
+            "parallel_rows_per_s": round(len(parallel) / parallel_s) if parallel_s else None,
+            "speedup": round(serial_s / parallel_s, 2) if parallel_s else None,
+        }
+
+    return Prepared(run)
+
+
+@scenario("product_search", sizes=[10_000, 100_000])
+def bench_product_search(size: int, opts: BenchOptions) -> Prepared:
+    """Локальный каталог товаров: синхронизация, инкремент и поиск для автокомплита."""
+    from .qr import catalog
+    from .qr.models import CatalogProduct, CatalogSyncState
+
+    portal = _portal(opts, products=size)
+    ids = sorted(portal.products)
+    own = CatalogProduct.objects.filter(product_id__range=(ids[0], ids[-1]))
+    saved_state = list(CatalogSyncState.objects.filter(pk=1))
+
+    def clear():
+        # только товары сценария и его отметка синхронизации
+        own.delete()
+        CatalogSyncState.objects.filter(pk=1).delete()
+        CatalogSyncState.objects.bulk_create(saved_state)
+
+    rnd = random.Random(opts.seed)
+    names = [p["NAME"] for p in portal.products.values()]
+    queries = []
+    for _ in range(1000):
+        words = rnd.choice(names).split()
+        word = rnd.choice(words)
+        queries.append(word[:rnd.randint(1, len(word))] if rnd.random() < 0.7 else " ".join(words[1:])[:8])
+    changed = [str(i) for i in range(1, size + 1, 100)]
+
+    def run():
+        clear()
+        with patch_webhook(portal):
+            t0 = time.perf_counter()
+            catalog.sync_catalog(full=True)
+            full_s = time.perf_counter() - t0
+            requests = portal.requests
+            portal.touch(list(portal.products.values()), changed, PRICE="1.00")
+            t0 = time.perf_counter()
+            stats = catalog.sync_catalog()
+            delta_s = time.perf_counter() - t0
+            delta_requests = portal.requests - requests
+
+            t0 = time.perf_counter()
+            index = catalog.get_search_index()
+            index_s = time.perf_counter() - t0
+            latencies = []
+            for q in queries:
+                t0 = time.perf_counter()
+                catalog.search_products(q)
+                latencies.append(time.perf_counter() - t0)
+            search_requests = portal.requests - requests - delta_requests
+
+            # набор по буквам, как в форме: каждый следующий префикс — отдельный запрос
+            typed = [name[:end] for name in rnd.sample(names, 200) for end in range(2, min(len(name), 16) + 1)]
+            fresh = catalog.ProductSearchIndex(
+                CatalogProduct.objects.order_by("product_id").values_list("product_id", "name", "price", "currency")
+            )
+            scans = []
+            search = fresh._search
+            fresh._search = lambda q, limit: scans.append(q) or search(q, limit)
+            t0 = time.perf_counter()
+            for q in typed:
+                fresh.lookup(q)
+            typed_cold_s = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            for q in typed:
+                fresh.lookup(q)
+            typed_warm_s = time.perf_counter() - t0
+        latencies.sort()
+        return {
+            "full_sync_s": round(full_s, 3),
+            "delta_sync_s": round(delta_s, 3),
+            "delta_fetched": stats["fetched"],
+            "delta_rest_requests": delta_requests,
+            "index_build_s": round(index_s, 3),
+            "indexed": len(index),
+            "search_p50_ms": round(latencies[len(latencies) // 2] * 1e3, 3),
+            "search_p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1e3, 3),
+            "search_rest_requests": search_requests,
+            "typed_queries": len(typed),
+            "typed_index_scans": len(scans),
+            "typed_cold_ms": round(typed_cold_s * 1e3, 1),
+            "typed_warm_ms": round(typed_warm_s * 1e3, 1),
+        }
+
+    return Prepared(run, portal, cleanup=clear)
+
+
+@scenario("qr_bulk", sizes=[1_000, 5_000])
+def bench_qr_bulk(size: int, opts: BenchOptions) -> Prepared:
+    """Массовые QR: товары batch-ами, bulk_create ссылок, ZIP и PDF потоком."""
+    from .qr import bulk
+    from .qr.models import ProductLink
+
+    portal = _portal(opts, products=size)
+    ids = list(portal.products)
+
+    def url_for(pl):
+        return f"https://example.com/product/{pl.pk}/"
+
+    def run():
+        with patch_webhook(portal):
+            requests = portal.requests
+            t0 = time.perf_counter()
+            products = bulk.collect_products(ids)
+            fetch_s = time.perf_counter() - t0
+            fetch_requests = portal.requests - requests
+        t0 = time.perf_counter()
+        links = bulk.create_links(products)
+        create_s = time.perf_counter() - t0
+        timings = {}
+        for fmt in bulk.FORMATS:
+            t0 = time.perf_counter()
+            first = None
+            out = 0
+            for chunk in bulk.stream_labels(fmt, links, url_for):
+                first = first or time.perf_counter() - t0
+                out += len(chunk)
+            timings[fmt] = (time.perf_counter() - t0, first, out)
+        return {
+            "products": len(products),
+            "fetch_s": round(fetch_s, 3),
+            "fetch_rest_requests": fetch_requests,
+            "create_links_s": round(create_s, 3),
+            **{f"{fmt}_s": round(t[0], 3) for fmt, t in timings.items()},
+            **{f"{fmt}_first_chunk_ms": round(t[1] * 1e3, 1) for fmt, t in timings.items()},
+            **{f"{fmt}_bytes": t[2] for fmt, t in timings.items()},
+        }
+
+    return Prepared(run, portal, cleanup=lambda: ProductLink.objects.filter(product_id__in=ids).delete())
+
+
+@scenario("qr_scans", sizes=[100_000])
+def bench_qr_scans(size: int, opts: BenchOptions) -> Prepared:
+    """Сканирования QR: стоимость record_scan в запросе и пакетной записи счётчиков."""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from .qr import scans
+    from .qr.models import ProductLink
+
+    links = ProductLink.objects.bulk_create([ProductLink(product_id=i, title_cached="bench") for i in range(1, 5001)])
+    rnd = random.Random(opts.seed)
+    # популярные ссылки сканируют чаще
+    hits = [links[min(int(rnd.paretovariate(1.2)) - 1, len(links) - 1)].pk for _ in range(size)]
+
+    def run():
+        scans.flush()
+        t0 = time.perf_counter()
+        for pk in hits:
+            scans.record_scan(pk)
+        record_s = time.perf_counter() - t0
+        with CaptureQueriesContext(connection) as queries:
+            t0 = time.perf_counter()
+            written = scans.flush()
+            flush_s = time.perf_counter() - t0
+        return {
+            "scans": written,
+            "record_us": round(record_s / size * 1e6, 2),
+            "flush_ms": round(flush_s * 1e3, 1),
+            "flush_queries": len(queries.captured_queries),
+        }
+
+    return Prepared(run, cleanup=lambda: ProductLink.objects.filter(pk__in=[pl.pk for pl in links]).delete())
+
+
+@scenario("deal_humanize", sizes=[10_000, 100_000])
+def bench_deal_humanize(size: int, opts: BenchOptions) -> Prepared:
+    """DealHumanizer: подписи для строк сделок без изменения исходных (закэшированных) строк."""
+    from .services import DEALS_TOP_SELECT, DealHumanizer, load_manuals
+
+    portal = _portal(opts, deals=size)
+    _, manuals = load_manuals(SimulatedToken(portal))
+    rows = [{k: d.get(k) for k in DEALS_TOP_SELECT} for d in portal.deals]
+
+    def run():
+        t0 = time.perf_counter()
+        humanizer = DealHumanizer(manuals)
+        compile_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        out = humanizer.rows(rows)
+        rows_s = time.perf_counter() - t0
+        if "TYPE_ID_H" in rows[0]:
+            raise AssertionError("source rows were mutated")
+        return {
+            "compile_us": round(compile_s * 1e6, 1),
+            "row_us": round(rows_s / len(out) * 1e6, 3),
+        }
+
+    return Prepared(run, portal)
+
+
+@scenario("normalize", sizes=[100_000, 1_000_000])
+def bench_normalize(size: int, opts: BenchOptions) -> Prepared:
+    """norm_phones/norm_emails против поэлементных norm_phone/norm_email."""
+    from .contacts.services import norm_email, norm_emails, norm_phone, norm_phones
+
+    rows = list(_fake_rows(size, opts.seed))
+    phones = [r[2] for r in rows]
+    emails = [r[3].upper() + " " for r in rows]
+
+    def run():
+        t0 = time.perf_counter()
+        scalar = ([norm_phone(v) for v in phones], [norm_email(v) for v in emails])
+        scalar_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        bulk = (norm_phones(phones), norm_emails(emails))
+        bulk_s = time.perf_counter() - t0
+        if bulk != scalar:
+            raise AssertionError("bulk normalization differs from scalar")
+        return {
+            "scalar_s": round(scalar_s, 4),
+            "bulk_s": round(bulk_s, 4),
+            "speedup": round(scalar_s / bulk_s, 1) if bulk_s else None,
+        }
+
+    return Prepared(run)
+
+
+def _dedup_prepared(size: int, opts: BenchOptions, build: Callable) -> Prepared:
+    from .contacts.services import norm_emails, norm_phones
+
+    rows = list(_fake_rows(size, opts.seed))
+    phones = norm_phones(r[2] for r in rows)
+    emails = norm_emails(r[3] for r in rows)
+    # половина проверок — промахи
+    probes = [("phone", p[:-1] + "x") if i % 2 else ("email", e) for i, (p, e) in enumerate(zip(phones, emails))]
+    del rows
+
+    def run():
+        before = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        index = build(phones, emails)
+        build_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        hits = sum(1 for key in probes if key in index)
+        lookup_s = time.perf_counter() - t0
+        result = {
+            "build_s": round(build_s, 4),
+            "lookup_us": round(lookup_s / len(probes) * 1e6, 3) if probes else None,
+            "hits": hits,
+        }
+        if tracemalloc.is_tracing():
+            # сколько занимает сам индекс после построения (пик — это ещё и временные объекты)
+            result["index_mb"] = round((tracemalloc.get_traced_memory()[0] - before) / 2 ** 20, 2)
+        return result
+
+    return Prepared(run)
+
+
+@scenario("dedup_index_set", sizes=[100_000, 1_000_000])
+def bench_dedup_index_set(size: int, opts: BenchOptions) -> Prepared:
+    """Индекс дублей как set кортежей (прежняя реализация) — для сравнения."""
+    def build(phones, emails):
+        index = {("phone", p) for p in phones if p}
+        index.update(("email", e) for e in emails if e)
+        return index
+
+    return _dedup_prepared(size, opts, build)
+
+
+@scenario("dedup_index", sizes=[100_000, 1_000_000])
+def bench_dedup_index(size: int, opts: BenchOptions) -> Prepared:
+    """ContactIndex: телефоны и хэши почт в отсортированных array('Q')."""
+    from .contacts.dedup import ContactIndex
+
+    return _dedup_prepared(size, opts, ContactIndex)
+
+
+@scenario("company_match", sizes=[10_000, 100_000])
+def bench_company_match(size: int, opts: BenchOptions) -> Prepared:
+    """CompanyMatcher: построение индекса и поиск вариантов названий."""
+    from .contacts.company_match import CompanyMatcher
+
+    rnd = random.Random(opts.seed)
+    syllables = [c + v for c in "бвгдзклмнпрстфхцчш" for v in "аеиоуя"] + ["строй", "снаб", "тех", "пром", "торг"]
+
+    def word() -> str:
+        return "".join(rnd.choice(syllables) for _ in range(rnd.randint(2, 4))).capitalize()
+
+    titles = []
+    for i in range(size):
+        name = " ".join(word() for _ in range(rnd.randint(1, 3)))
+        if rnd.random() < 0.1:
+            name += f" {i}"
+        titles.append(f"{rnd.choice(['ООО', 'АО', 'ИП'])} «{name}»")
+    companies = [{"ID": i + 1, "TITLE": t} for i, t in enumerate(titles)]
+
+    def variant(title: str, i: int) -> str:
+        name = title[title.index("«") + 1:-1]
+        kind = i % 4
+        if kind == 0:
+            return " ".join(reversed(name.split())) + " ООО"
+        if kind == 1:
+            return name + " LLC"
+        if kind == 2:
+            return name[:2] + name[3:]  # опечатка: пропущена буква
+        return f"АО {word()} {word()} {word()}"  # скорее всего промах
+
+    probes = [variant(titles[rnd.randrange(size)], i) for i in range(2000)]
+
+    def run():
+        t0 = time.perf_counter()
+        matcher = CompanyMatcher.from_companies(companies)
+        build_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        found = sum(1 for p in probes if matcher.match(p) is not None)
+        lookup_s = time.perf_counter() - t0
+        return {
+            "build_s": round(build_s, 4),
+            "lookup_ms": round(lookup_s / len(probes) * 1e3, 4),
+            "matched": found,
+            "probes": len(probes),
+        }
+
+    return Prepared(run)
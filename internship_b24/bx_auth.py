@@ -0,0 +1,296 @@
+"""
+main_auth с кэшем разрешённых токенов.
+
+main_auth(on_cookies=True) на каждом запросе заново находит
+BitrixUserToken по cookies (запрос к БД, а при истёкшем токене — ещё и
+REST-обновление). Здесь результат авторизации (request.bitrix_user_token,
+request.bitrix_user и прочие request.bitrix_*) хранится в памяти процесса
+BITRIX_AUTH_CACHE_TTL секунд по хэшу cookies авторизации: посторонние
+cookies вроде аналитики не дробят кэш. Какие cookies авторизационные,
+узнаём у самого main_auth — запоминаем, какие он прочитал при успешной
+авторизации (или берём BITRIX_AUTH_COOKIES, если он задан); пока не
+узнали, ключ — по всем cookies. Запрос без cookies авторизации проходит
+обычный main_auth без кэша, с предупреждением в лог. Параллельные
+запросы с одними cookies ждут одно разрешение, а не делают его каждый.
+
+Токен из кэша каждому запросу отдаётся копией: refresh()/save() одного
+запроса не меняют объект под другими. Обновление токена
+(BitrixUserToken.refresh) сериализуется по токену: кто дождался
+блокировки после чужого обновления, перечитывает токен из БД вместо
+второго REST-запроса; записи кэша с обновлённым токеном отбрасываются.
+
+Вход в приложение (on_start / set_cookie) не кэшируется — это обычный
+main_auth из integration_utils.
+"""
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from django.conf import settings
+
+from integration_utils.bitrix24.bitrix_user_auth.main_auth import main_auth as _main_auth
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# ключ -> (когда истекает, номер обновления токена, атрибуты request.bitrix_*)
+_entries: "OrderedDict[str, Tuple[float, int, dict]]" = OrderedDict()
+_entries_lock = threading.Lock()
+# ключ -> блокировка разрешения, пока кто-то его выполняет
+_resolving: Dict[str, threading.Lock] = {}
+# cookies, которые читал main_auth; None — ещё не знаем
+_learned: Optional[FrozenSet[str]] = None
+_warned = False
+
+
+class _CookieRecorder(dict):
+    """request.COOKIES на время main_auth: запоминает, какие cookies прочитаны."""
+
+    def __init__(self, cookies):
+        super().__init__(cookies)
+        self.read = set()
+        self.read_all = False
+
+    def __getitem__(self, name):
+        self.read.add(name)
+        return super().__getitem__(name)
+
+    def __contains__(self, name):
+        self.read.add(name)
+        return super().__contains__(name)
+
+    def get(self, name, default=None):
+        self.read.add(name)
+        return super().get(name, default)
+
+    def __iter__(self):
+        self.read_all = True
+        return super().__iter__()
+
+    def keys(self):
+        self.read_all = True
+        return super().keys()
+
+    def items(self):
+        self.read_all = True
+        return super().items()
+
+    def values(self):
+        self.read_all = True
+        return super().values()
+
+
+def _ttl() -> float:
+    return getattr(settings, "BITRIX_AUTH_CACHE_TTL", 60)
+
+
+def _auth_cookies() -> Optional[FrozenSet[str]]:
+    """Имена cookies авторизации; None — ключ по всем cookies запроса."""
+    names = getattr(settings, "BITRIX_AUTH_COOKIES", None)
+    return frozenset(names) if names is not None else _learned
+
+
+def _learn(recorder: _CookieRecorder) -> None:
+    global _learned
+    if recorder.read_all or not recorder.read:
+        # main_auth перебирает все cookies — сузить ключ нельзя
+        return
+    with _entries_lock:
+        _learned = (_learned or frozenset()) | recorder.read
+
+
+def _cookie_key(request) -> Optional[str]:
+    names = _auth_cookies()
+    cookies = request.COOKIES
+    pairs = sorted((n, cookies[n]) for n in (names if names is not None else cookies) if n in cookies)
+    if not pairs:
+        return None
+    return hashlib.sha256(json.dumps(pairs).encode()).hexdigest()
+
+
+def _generation(token) -> int:
+    """Сколько раз токен обновлялся в этом процессе (см. coordinate_refresh)."""
+    return _refreshed.get(getattr(token, "pk", None), (0, None))[0]
+
+
+def _get(key: str) -> Optional[dict]:
+    with _entries_lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        expires, generation, attrs = entry
+        token = attrs.get("bitrix_user_token")
+        if (
+            expires < time.monotonic()
+            or not getattr(token, "is_active", True)
+            # токен обновили — в кэше старый access_token
+            or _generation(token) != generation
+        ):
+            del _entries[key]
+            return None
+        _entries.move_to_end(key)
+        return attrs
+
+
+def _put(key: str, attrs: dict) -> None:
+    generation = _generation(attrs.get("bitrix_user_token"))
+    with _entries_lock:
+        _entries[key] = (time.monotonic() + _ttl(), generation, attrs)
+        _entries.move_to_end(key)
+        while len(_entries) > getattr(settings, "BITRIX_AUTH_CACHE_SIZE", 1024):
+            _entries.popitem(last=False)
+
+
+def clear() -> None:
+    global _learned, _warned
+    with _entries_lock:
+        _entries.clear()
+        _learned = None
+        _warned = False
+
+
+def _flight(key: str) -> threading.Lock:
+    with _entries_lock:
+        return _resolving.setdefault(key, threading.Lock())
+
+
+def _authorize(authorize, request, args, kwargs):
+    """Обычный main_auth: (ответ-отказ или None, добавленные атрибуты request.bitrix_*)."""
+    before = set(request.__dict__)
+    cookies = request.COOKIES
+    recorder = request.COOKIES = _CookieRecorder(cookies)
+    try:
+        denied = authorize(request, *args, **kwargs)
+    finally:
+        request.COOKIES = cookies
+    attrs = {k: v for k, v in request.__dict__.items() if k.startswith("bitrix_") and k not in before}
+    if denied is None and "bitrix_user_token" in attrs:
+        _learn(recorder)
+    return denied, attrs
+
+
+def _warn_no_cookies(request) -> None:
+    global _warned
+    names = _auth_cookies()
+    if names is None or _warned:
+        return
+    _warned = True
+    logger.warning(
+        "no auth cookies (%s) in request to %s, main_auth goes without cache",
+        ", ".join(sorted(names)), request.path,
+    )
+
+
+def _apply(request, attrs: dict) -> None:
+    for name, value in attrs.items():
+        if name == "bitrix_user_token":
+            # своя копия: refresh()/save() меняют поля токена на месте
+            value = copy.copy(value)
+        setattr(request, name, value)
+
+
+def main_auth(**auth_kwargs):
+    """Как main_auth из integration_utils; при on_cookies=True — с кэшем в памяти процесса."""
+    def decorator(view):
+        if not auth_kwargs.get("on_cookies") or auth_kwargs.get("on_start") or auth_kwargs.get("set_cookie"):
+            return _main_auth(**auth_kwargs)(view)
+
+        @_main_auth(**auth_kwargs)
+        def authorize(request, *args, **kwargs):
+            return None
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            t0 = time.perf_counter()
+            key = _cookie_key(request)
+            attrs = _get(key) if key else None
+            metrics.cache_result("auth", attrs is not None)
+            source = "cache"
+            if attrs is None:
+                source = "main_auth"
+                if key is None:
+                    _warn_no_cookies(request)
+                    denied, attrs = _authorize(authorize, request, args, kwargs)
+                else:
+                    flight = _flight(key)
+                    with flight:
+                        attrs = _get(key)
+                        if attrs is None:
+                            denied, attrs = _authorize(authorize, request, args, kwargs)
+                            if denied is None and "bitrix_user_token" in attrs:
+                                _put(key, attrs)
+                                # ключ по узнанным cookies: следующие запросы
+                                # считают его, а не ключ по всем cookies
+                                learned_key = _cookie_key(request)
+                                if learned_key and learned_key != key:
+                                    _put(learned_key, attrs)
+                        else:
+                            denied, source = None, "wait"
+                    with _entries_lock:
+                        if _resolving.get(key) is flight:
+                            del _resolving[key]
+                if denied is not None:
+                    metrics.auth_latency.observe(time.perf_counter() - t0, source="denied")
+                    return denied
+            _apply(request, attrs)
+            metrics.auth_latency.observe(time.perf_counter() - t0, source=source)
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# --------- обновление токена ---------
+
+_refresh_locks: Dict[object, threading.Lock] = {}
+# pk токена -> (номер обновления, результат refresh)
+_refreshed: Dict[object, Tuple[int, object]] = {}
+_refresh_guard = threading.Lock()
+
+
+def coordinate_refresh(cls) -> None:
+    """Оборачивает cls.refresh (один раз): одно обновление на токен, остальные перечитывают БД."""
+    if getattr(cls, "_bx_refresh_coordinated", False):
+        return
+    original = cls.refresh
+
+    @wraps(original)
+    def refresh(self, *args, **kwargs):
+        pk = self.pk
+        with _refresh_guard:
+            lock = _refresh_locks.setdefault(pk, threading.Lock())
+            seen = _refreshed.get(pk, (0, None))[0]
+        with lock:
+            generation, result = _refreshed.get(pk, (0, None))
+            if generation != seen:
+                # пока ждали, токен обновил другой запрос
+                self.refresh_from_db()
+                metrics.token_refreshes.inc(outcome="reused")
+                return result
+            result = original(self, *args, **kwargs)
+            _refreshed[pk] = (generation + 1, result)
+            metrics.token_refreshes.inc(outcome="refreshed")
+            return result
+
+    cls.refresh = refresh
+    cls._bx_refresh_coordinated = True
+
+
+def install() -> None:
+    """Вызывается из AppConfig.ready()."""
+    try:
+        from integration_utils.bitrix24.models import BitrixUserToken
+    except ImportError:
+        logger.warning("BitrixUserToken not found, token refresh is not coordinated")
+    else:
+        coordinate_refresh(BitrixUserToken)
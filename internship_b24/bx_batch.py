@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import re
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from urllib.parse import quote
+
+BATCH_LIMIT = 50  # лимит Bitrix для batch — до 50 команд за один вызов
+
+_REF_RE = re.compile(r"^\$result\[(\w+)\]((?:\[[^\]]*\])*)$")
+_REF_PATH_RE = re.compile(r"\[([^\]]*)\]")
+
+
+class BatchError(Exception):
+    """Команда внутри batch вернула ошибку (или batch не выполнился вовсе)."""
+
+
+def http_build_query(params: Any, prefix: Optional[str] = None) -> str:
+    """
+    Аналог PHP http_build_query: вложенные dict/list превращаются в
+    fields[NAME]=...&fields[PHONE][0][VALUE]=...
+    Именно в таком виде Bitrix ждёт параметры команд внутри batch.
+    """
+    return "&".join(_flatten_query(params, prefix))
+
+
+def _flatten_query(value: Any, prefix: Optional[str]) -> Iterator[str]:
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, (list, tuple)):
+        items = enumerate(value)
+    else:
+        if prefix is None:
+            return
+        if value is None:
+            value = ""
+        elif isinstance(value, bool):
+            value = "Y" if value else "N"
+        yield f"{quote(prefix, safe='[]')}={quote(str(value), safe='')}"
+        return
+
+    for k, v in items:
+        key = str(k) if prefix is None else f"{prefix}[{k}]"
+        yield from _flatten_query(v, key)
+
+
+class DeferredCall:
+    """
+    «Фьючерс» одной отложенной команды batch.
+    Результат доступен после RestBatch.flush() (или выхода из with-блока).
+    """
+
+    __slots__ = ("key", "method", "params", "_done", "_result", "_error", "total", "next")
+
+    def __init__(self, key: str, method: str, params: dict):
+        self.key = key
+        self.method = method
+        self.params = params
+        self._done = False
+        self._result: Any = None
+        self._error: Any = None
+        self.total: Optional[int] = None
+        self.next: Optional[int] = None
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    @property
+    def ok(self) -> bool:
+        return self._done and self._error is None
+
+    @property
+    def error(self) -> Any:
+        return self._error
+
+    def result(self, default: Any = None) -> Any:
+        """
+        Результат команды. При ошибке внутри batch возвращает default,
+        чтобы вызывающий код мог вести себя как со «сбойным» REST-вызовом.
+        """
+        if not self._done:
+            raise RuntimeError(f"batch ещё не отправлен: {self.method}")
+        if self._error is not None:
+            return default
+        return self._result
+
+    def result_or_raise(self) -> Any:
+        if not self._done:
+            raise RuntimeError(f"batch ещё не отправлен: {self.method}")
+        if self._error is not None:
+            raise BatchError(f"{self.method}: {self._error}")
+        return self._result
+
+    def ref(self, *path: Any) -> str:
+        """
+        Ссылка на результат для зависимой команды:
+        reg.ref("CALL_ID") -> "$result[c0][CALL_ID]"
+        """
+        return f"$result[{self.key}]" + "".join(f"[{p}]" for p in path)
+
+    def _resolve(self, result: Any, error: Any, total: Any = None, next_: Any = None) -> None:
+        self._done = True
+        self._result = result
+        self._error = error
+        self.total = _to_int(total)
+        self.next = _to_int(next_)
+
+
+class RestBatch:
+    """
+    Автоматический упаковщик независимых REST-вызовов в batch.
+
+        with RestBatch.for_token(but) as batch:
+            fields = batch.add("crm.deal.fields")
+            stages = batch.add("crm.status.entity.items", {"entityId": "DEAL_STAGE"})
+        fields.result(), stages.result()
+
+    - команды копятся до flush(), затем уходят пачками по BATCH_LIMIT;
+    - зависимые команды ссылаются на предыдущие через DeferredCall.ref();
+      если зависимость попала в уже отправленную пачку, ссылка подставляется
+      готовым значением перед отправкой.
+    """
+
+    def __init__(
+        self,
+        call: Callable[[str, dict], Any],
+        halt: bool = False,
+        limit: int = BATCH_LIMIT,
+        limiter=None,
+    ):
+        # call(method, params) -> сырой ответ REST ({"result": {...}, ...})
+        self._call = call
+        self._halt = halt
+        # limiter.acquire() перед каждым запросом (см. internship_b24.ratelimit)
+        self._limiter = limiter
+        self._limit = max(1, min(limit, BATCH_LIMIT))
+        self._pending: List[DeferredCall] = []
+        self._resolved: Dict[str, DeferredCall] = {}
+        self._seq = 0
+        self.requests_sent = 0
+
+    @classmethod
+    def for_token(cls, but, **kwargs) -> "RestBatch":
+        """batch через BitrixUserToken (call_api_method)."""
+        return cls(lambda method, params: but.call_api_method(api_method=method, params=params), **kwargs)
+
+    def __enter__(self) -> "RestBatch":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.flush()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, method: str, params: Optional[dict] = None, key: Optional[str] = None) -> DeferredCall:
+        if key is None:
+            key = f"c{self._seq}"
+        self._seq += 1
+        call = DeferredCall(key, method, params or {})
+        self._pending.append(call)
+        return call
+
+    def flush(self) -> None:
+        pending, self._pending = self._pending, []
+        for start in range(0, len(pending), self._limit):
+            self._send(pending[start:start + self._limit])
+
+    def _send(self, chunk: List[DeferredCall]) -> None:
+        cmd = {}
+        for c in chunk:
+            params = self._substitute_sent_refs(c.params)
+            query = http_build_query(params)
+            cmd[c.key] = f"{c.method}?{query}" if query else c.method
+
+        if self._limiter is not None:
+            self._limiter.acquire()
+        self.requests_sent += 1
+        try:
+            resp = self._call("batch", {"halt": 1 if self._halt else 0, "cmd": cmd})
+        except Exception as e:
+            resp = None
+            transport_error = str(e) or e.__class__.__name__
+        else:
+            transport_error = "empty batch response"
+
+        body = resp.get("result") if isinstance(resp, dict) else None
+        if not isinstance(body, dict):
+            for c in chunk:
+                c._resolve(None, transport_error)
+                self._resolved[c.key] = c
+            return
+
+        results = _as_dict(body.get("result"))
+        errors = _as_dict(body.get("result_error"))
+        totals = _as_dict(body.get("result_total"))
+        nexts = _as_dict(body.get("result_next"))
+
+        for c in chunk:
+            if c.key in errors:
+                c._resolve(None, errors[c.key])
+            elif c.key in results:
+                c._resolve(results[c.key], None, totals.get(c.key), nexts.get(c.key))
+            else:
+                c._resolve(None, "not executed")
+            self._resolved[c.key] = c
+
+    def _substitute_sent_refs(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            return {k: self._substitute_sent_refs(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._substitute_sent_refs(v) for v in value]
+        if isinstance(value, str) and value.startswith("$result["):
+            m = _REF_RE.match(value)
+            if m and m.group(1) in self._resolved:
+                res = self._resolved[m.group(1)].result()
+                for part in _REF_PATH_RE.findall(m.group(2)):
+                    if isinstance(res, dict):
+                        res = res.get(part)
+                    elif isinstance(res, list) and part.isdigit() and int(part) < len(res):
+                        res = res[int(part)]
+                    else:
+                        res = None
+                return res
+        return value
+
+
+def _as_dict(value: Any) -> dict:
+    # при числовых ключах Bitrix может вернуть list вместо dict
+    if isinstance(value, dict):
+        return value
+    if isinstance(value, list):
+        return {str(i): v for i, v in enumerate(value)}
+    return {}
+
+
+def _to_int(value: Any) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
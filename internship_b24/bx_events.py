@@ -0,0 +1,40 @@
+"""
+Приём исходящих событий Bitrix24 (event.bind -> POST на наш URL).
+
+Bitrix шлёт форму в стиле PHP: event=ONCRMPRODUCTUPDATE,
+data[FIELDS][ID]=123, auth[application_token]=... Подлинность проверяем по
+application_token: он приходит в каждом событии и задаётся в
+BITRIX_EVENTS_APPLICATION_TOKEN. Пока токен не настроен, события не
+принимаются.
+"""
+from __future__ import annotations
+
+import hmac
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+
+
+@dataclass
+class BxEvent:
+    name: str
+    entity_id: Optional[int]
+    domain: str = ""
+
+
+def parse_event(request) -> Optional[BxEvent]:
+    """Событие из POST-запроса или None, если токен не совпал."""
+    expected = getattr(settings, "BITRIX_EVENTS_APPLICATION_TOKEN", "") or ""
+    token = request.POST.get("auth[application_token]", "")
+    if not expected or not hmac.compare_digest(token, expected):
+        return None
+    try:
+        entity_id = int(request.POST.get("data[FIELDS][ID]", ""))
+    except ValueError:
+        entity_id = None
+    return BxEvent(
+        name=request.POST.get("event", "").upper(),
+        entity_id=entity_id,
+        domain=request.POST.get("auth[domain]", ""),
+    )
@@ -0,0 +1,664 @@
+"""
+Офлайн-симулятор REST API Bitrix24 для бенчмарков и тестов.
+
+    portal = SimulatedPortal(contacts=10_000, latency=0.05)
+    but = SimulatedToken(portal)              # вместо request.bitrix_user_token
+    with patch_webhook(portal): ...           # вместо входящего вебхука (_bx24_call)
+    server = serve(portal, port=8765)         # настоящий HTTP: /rest/<method>.json
+
+Реализованы методы, которыми пользуется приложение: crm.contact.*,
+crm.company.*, crm.address.list, crm.deal.*, crm.status.entity.items,
+crm.currency.list, crm.product.*, catalog.productImage.list, batch,
+user.get, department.get, voximplant.statistic.get, telephony.*.
+"""
+from __future__ import annotations
+
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from .ratelimit import RateLimiter
+
+PAGE_SIZE = 50
+UF_PRIORITY_CODE = "UF_CRM_1760383363428"
+
+FIRST_NAMES = ["Иван", "Пётр", "Анна", "Мария", "Олег", "Елена", "Сергей", "Ольга", "Дмитрий", "Наталья"]
+LAST_NAMES = ["Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов"]
+COMPANY_WORDS = ["Ромашка", "Вектор", "Альфа", "Горизонт", "Спектр", "Меридиан", "Сфера", "Тензор"]
+LEGAL_FORMS = ["ООО", "АО", "ИП", "ПАО"]
+CITIES = ["Москва", "Санкт-Петербург", "Казань", "Новосибирск", "Екатеринбург"]
+
+STAGES = {"NEW": "Новая", "PREPARATION": "Подготовка", "EXECUTING": "В работе", "WON": "Успешна"}
+DEAL_TYPES = {"SALE": "Продажа", "COMPLEX": "Комплексная продажа", "GOODS": "Продажа товара"}
+CURRENCIES = {"RUB": "Российский рубль", "USD": "Доллар США", "EUR": "Евро"}
+PRIORITIES = {"45": "Высокий", "46": "Средний", "47": "Низкий"}
+
+# смещение портала: все даты симулятора — в нём, как у настоящего Bitrix24
+PORTAL_TZ = timezone(timedelta(hours=3))
+_BASE_DATE = datetime(2025, 1, 1, 9, 0, tzinfo=PORTAL_TZ)
+_REF_RE = re.compile(r"^\$result\[(\w+)\]((?:\[[^\]]*\])*)$")
+
+
+class SimulatedApiError(Exception):
+    """Ошибка REST (аналог ошибок BitrixUserToken.call_api_method)."""
+
+    def __init__(self, error: str, description: str = "", status: int = 400):
+        super().__init__(f"{error}: {description}" if description else error)
+        self.error = error
+        self.description = description
+        self.status = status
+
+
+def _iso(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%S%z")[:-2] + ":" + dt.strftime("%z")[-2:]
+
+
+def _cmp_value(v: Any) -> Any:
+    """
+    Приводим значения к сравнимому виду: числа — к float, даты — к
+    'YYYY-MM-DD HH:MM:SS' во времени портала (дата со смещением сначала
+    переводится в PORTAL_TZ, без смещения — считается временем портала).
+    """
+    if isinstance(v, (int, float)):
+        return float(v)
+    s = str(v if v is not None else "")
+    try:
+        return float(s)
+    except ValueError:
+        pass
+    if len(s) >= 10 and s[4:5] == "-" and s[7:8] == "-":
+        try:
+            dt = datetime.fromisoformat(s)
+        except ValueError:
+            dt = None
+        if dt is not None and dt.tzinfo is not None:
+            return dt.astimezone(PORTAL_TZ).strftime("%Y-%m-%d %H:%M:%S")
+        return s[:19].replace("T", " ")
+    return s.lower()
+
+
+def _compile_filter(flt: dict) -> List[Tuple[str, str, Any]]:
+    compiled = []
+    for raw_key, expected in (flt or {}).items():
+        m = re.match(r"^(>=|<=|!=|>|<|!|%|=)?(.+)$", raw_key)
+        op, key = m.group(1) or "=", m.group(2)
+        if isinstance(expected, (list, tuple)):
+            # массив в фильтре — IN / NOT IN, как в crm.*.list
+            value = frozenset(_cmp_value(v) for v in expected)
+        else:
+            value = str(expected).lower() if op == "%" else _cmp_value(expected)
+        compiled.append((op, key, value))
+    return compiled
+
+
+def _match(item: dict, compiled: List[Tuple[str, str, Any]]) -> bool:
+    for op, key, e in compiled:
+        actual = item.get(key)
+        if isinstance(actual, list):
+            actual = actual[0] if actual else None
+        if op == "%":
+            if e not in str(actual or "").lower():
+                return False
+            continue
+        a = _cmp_value(actual)
+        if isinstance(e, frozenset):
+            if (a in e) != (op == "="):
+                return False
+            continue
+        if type(a) is not type(e):
+            a, e = str(a), str(e)
+        if op == "=" and a != e:
+            return False
+        if op in ("!", "!=") and a == e:
+            return False
+        if op == ">" and not a > e:
+            return False
+        if op == ">=" and not a >= e:
+            return False
+        if op == "<" and not a < e:
+            return False
+        if op == "<=" and not a <= e:
+            return False
+    return True
+
+
+def parse_php_query(query: str) -> dict:
+    """Обратное к http_build_query: 'fields[PHONE][0][VALUE]=1' -> вложенные dict/list."""
+    root: dict = {}
+    for raw_key, value in parse_qsl(query, keep_blank_values=True):
+        parts = [p for p in re.split(r"\[|\]", raw_key) if p != ""] or [raw_key]
+        node = root
+        for p in parts[:-1]:
+            node = node.setdefault(p, {})
+        node[parts[-1]] = value
+    return _listify(root)
+
+
+def _listify(node: Any) -> Any:
+    if isinstance(node, dict):
+        node = {k: _listify(v) for k, v in node.items()}
+        if node and all(k.isdigit() for k in node):
+            return [node[k] for k in sorted(node, key=int)]
+    return node
+
+
+class SimulatedPortal:
+    """
+    Данные портала и обработчики методов.
+    Размеры датасета, задержка и лимит запросов настраиваются в конструкторе.
+    """
+
+    def __init__(
+        self,
+        contacts: int = 1000,
+        companies: int = 100,
+        deals: int = 200,
+        users: int = 50,
+        departments: int = 10,
+        products: int = 500,
+        calls_per_user: int = 5,
+        address_ratio: float = 0.8,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        rate_limit: Optional[Tuple[float, int]] = None,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self._limiter = RateLimiter(*rate_limit) if rate_limit else None
+        self._rnd = random.Random(seed)
+        self._lock = threading.RLock()
+
+        self.calls: Dict[str, int] = {}
+        self.requests = 0
+        self.rate_limited = 0
+        self.bytes_sent = 0
+
+        self.companies = [self._make_company(i) for i in range(1, companies + 1)]
+        self.addresses = [
+            self._make_address(c) for c in self.companies if self._rnd.random() < address_ratio
+        ]
+        self.contacts = [self._make_contact(i) for i in range(1, contacts + 1)]
+        self.departments = [self._make_department(i, departments) for i in range(1, departments + 1)]
+        self.users = [self._make_user(i, departments) for i in range(1, users + 1)]
+        self.deals = [self._make_deal(i) for i in range(1, deals + 1)]
+        self.products = {i: self._make_product(i) for i in range(1, products + 1)}
+        self.phone_calls = [
+            self._make_phone_call(u["ID"], n) for u in self.users for n in range(calls_per_user)
+        ]
+        self._registered: Dict[str, dict] = {}
+        self._query_cache: Dict[tuple, Tuple[List[dict], List[dict]]] = {}
+        self._calls_index: Dict[str, List[dict]] = {}
+        self._calls_index_size = -1
+        self._products_list: List[dict] = []
+
+        self._methods: Dict[str, Callable[[dict], Any]] = {
+            "crm.contact.list": lambda p: self._list(self.contacts, p),
+            "crm.contact.add": lambda p: self._add(self.contacts, p, self._dated_defaults),
+            "crm.company.list": lambda p: self._list(self.companies, p),
+            "crm.company.add": lambda p: self._add(self.companies, p, self._dated_defaults),
+            "crm.address.list": lambda p: self._list(self.addresses, p),
+            "crm.deal.list": lambda p: self._list(self.deals, p),
+            "crm.deal.add": lambda p: self._add(self.deals, p, self._deal_defaults),
+            "crm.deal.get": lambda p: self._get(self.deals, p),
+            "crm.deal.fields": self._deal_fields,
+            "crm.status.entity.items": self._status_items,
+            "crm.currency.list": lambda p: [
+                {"CURRENCY": k, "FULL_NAME": v} for k, v in CURRENCIES.items()
+            ],
+            "crm.product.get": self._product_get,
+            "crm.product.list": lambda p: self._list(self._product_list(), p),
+            "catalog.productImage.list": self._product_images,
+            "user.get": self._user_get,
+            "department.get": lambda p: self._list(self.departments, {"filter": p}),
+            "voximplant.statistic.get": self._statistic_get,
+            "telephony.config.get": lambda p: {"DEFAULT_LINE": ""},
+            "telephony.externalCall.register": self._call_register,
+            "telephony.externalCall.finish": self._call_finish,
+        }
+
+    # --------- генерация данных ---------
+
+    def _date(self, max_days: int = 300) -> datetime:
+        return _BASE_DATE + timedelta(minutes=self._rnd.randint(0, max_days * 24 * 60))
+
+    def _make_company(self, i: int) -> dict:
+        word = COMPANY_WORDS[i % len(COMPANY_WORDS)]
+        # дата без self._rnd: иначе сдвинулись бы все следующие случайные данные
+        created = _iso(_BASE_DATE + timedelta(hours=i))
+        return {
+            "ID": str(i),
+            "TITLE": f"{LEGAL_FORMS[i % len(LEGAL_FORMS)]} {word} {i}",
+            "ACTIVE": "Y",
+            "DATE_CREATE": created,
+            "DATE_MODIFY": created,
+        }
+
+    def _make_address(self, company: dict) -> dict:
+        return {
+            "ENTITY_ID": company["ID"],
+            "ENTITY_TYPE_ID": "4",
+            "COUNTRY": "Россия",
+            "REGION": "",
+            "CITY": self._rnd.choice(CITIES),
+            "ADDRESS_1": f"ул. Ленина, {self._rnd.randint(1, 200)}",
+        }
+
+    def _make_contact(self, i: int) -> dict:
+        created = self._date()
+        company_id = str(self._rnd.randint(1, len(self.companies))) if self.companies else None
+        return {
+            "ID": str(i),
+            "NAME": self._rnd.choice(FIRST_NAMES),
+            "LAST_NAME": self._rnd.choice(LAST_NAMES),
+            "PHONE": [{"ID": str(i), "VALUE": f"+7 9{i:09d}", "VALUE_TYPE": "WORK"}],
+            "EMAIL": [{"ID": str(i), "VALUE": f"user{i}@example.com", "VALUE_TYPE": "WORK"}],
+            "COMPANY_ID": company_id,
+            "DATE_CREATE": _iso(created),
+            "DATE_MODIFY": _iso(created),
+        }
+
+    def _make_department(self, i: int, total: int) -> dict:
+        return {
+            "ID": str(i),
+            "NAME": "Компания" if i == 1 else f"Отдел {i}",
+            "PARENT": "" if i == 1 else str(max(1, i // 2)),
+            "UF_HEAD": str(i),  # пользователь с тем же ID — руководитель отдела
+        }
+
+    def _make_user(self, i: int, departments: int) -> dict:
+        return {
+            "ID": str(i),
+            "ACTIVE": True,
+            "NAME": self._rnd.choice(FIRST_NAMES),
+            "LAST_NAME": self._rnd.choice(LAST_NAMES),
+            "EMAIL": f"employee{i}@example.com",
+            "WORK_POSITION": "Менеджер",
+            "UF_DEPARTMENT": [(i - 1) % max(1, departments) + 1],
+        }
+
+    def _make_deal(self, i: int) -> dict:
+        created = self._date()
+        stage = self._rnd.choice(list(STAGES))
+        return {
+            "ID": str(i),
+            "TITLE": f"Сделка {i}",
+            "OPPORTUNITY": f"{self._rnd.randint(1, 1000) * 1000}.00",
+            "CURRENCY_ID": self._rnd.choice(list(CURRENCIES)),
+            "STAGE_ID": stage,
+            "TYPE_ID": self._rnd.choice(list(DEAL_TYPES)),
+            "BEGINDATE": _iso(created),
+            "CLOSEDATE": _iso(created + timedelta(days=30)),
+            "DATE_CREATE": _iso(created),
+            "DATE_MODIFY": _iso(created),
+            "CLOSED": "Y" if stage == "WON" else "N",
+            UF_PRIORITY_CODE: self._rnd.choice(list(PRIORITIES)),
+        }
+
+    def _dated_defaults(self, fields: dict) -> dict:
+        now = _iso(datetime.now(PORTAL_TZ))
+        return {"DATE_CREATE": now, "DATE_MODIFY": now, **fields}
+
+    def touch(self, items: List[dict], ids: List[str], **changes) -> None:
+        """Изменение записей, как через *.update: поля плюс новый DATE_MODIFY."""
+        now = _iso(datetime.now(PORTAL_TZ))
+        wanted = set(ids)
+        with self._lock:
+            for it in items:
+                if it["ID"] in wanted:
+                    it.update(changes, DATE_MODIFY=now)
+            self._query_cache.clear()
+
+    def _deal_defaults(self, fields: dict) -> dict:
+        now = _iso(datetime.now(PORTAL_TZ))
+        return {"CLOSED": "N", "STAGE_ID": "NEW", "DATE_CREATE": now, "DATE_MODIFY": now, **fields}
+
+    def _make_product(self, i: int) -> dict:
+        return {
+            "ID": str(i),
+            "NAME": f"{self._rnd.choice(COMPANY_WORDS)} товар {i}",
+            "PRICE": f"{self._rnd.randint(100, 100000)}.00",
+            "CURRENCY_ID": "RUB",
+            "DESCRIPTION": f"Описание товара {i}",
+            "SECTION_ID": str(i % 10 + 1),
+            "DATE_MODIFY": _iso(self._date()),
+        }
+
+    def _make_phone_call(self, user_id: str, n: int) -> dict:
+        start = datetime.now(PORTAL_TZ) - timedelta(minutes=self._rnd.randint(0, 48 * 60))
+        return {
+            "ID": f"{user_id}-{n}",
+            "PORTAL_USER_ID": user_id,
+            "CALL_TYPE": "1",
+            "CALL_DURATION": self._rnd.randint(1, 180),
+            "CALL_START_DATE": _iso(start),
+        }
+
+    # --------- обработчики ---------
+
+    def _list(self, items: List[dict], params: dict) -> dict:
+        flt = params.get("filter") or {}
+        order = params.get("order") or {}
+        rows = self._query(items, flt, order)
+
+        start = int(params.get("start") or 0)
+        count_total = start != -1
+        start = max(0, start)
+        page = rows[start:start + PAGE_SIZE]
+
+        select = params.get("select") or []
+        if select and "*" not in select:
+            page = [{k: r.get(k) for k in select if k in r} for r in page]
+
+        response: dict = {"result": page}
+        if count_total:
+            response["total"] = len(rows)
+            if start + PAGE_SIZE < len(rows):
+                response["next"] = start + PAGE_SIZE
+        return response
+
+    def _query(self, items: List[dict], flt: dict, order: dict) -> List[dict]:
+        """
+        Фильтр + сортировка. Результат запоминается до следующего изменения
+        коллекции, чтобы постраничная выгрузка не фильтровала всё заново.
+        """
+        if not flt and not order:
+            return items
+        key = (id(items), len(items), json.dumps([flt, order], sort_keys=True, default=str))
+        cached = self._query_cache.get(key)
+        # в кэше лежит и сама коллекция: пока она жива, её id не переиспользуется
+        if cached is not None and cached[0] is items:
+            return cached[1]
+
+        compiled = _compile_filter(flt)
+        rows = [it for it in items if _match(it, compiled)] if flt else list(items)
+        for field, direction in reversed(list(order.items())):
+            rows.sort(key=lambda r: _cmp_value(r.get(field)), reverse=str(direction).upper() == "DESC")
+
+        if len(self._query_cache) > 32:
+            self._query_cache.clear()
+        self._query_cache[key] = (items, rows)
+        return rows
+
+    def _add(self, items: List[dict], params: dict, defaults: Callable[[dict], dict] = dict) -> int:
+        fields = dict(params.get("fields") or {})
+        # ID выдаются по возрастанию, последний элемент — максимальный
+        new_id = int(items[-1]["ID"]) + 1 if items else 1
+        fields["ID"] = str(new_id)
+        items.append(defaults(fields))
+        return new_id
+
+    def _get(self, items: List[dict], params: dict) -> dict:
+        wanted = str(params.get("id") or params.get("ID") or "")
+        for it in items:
+            if it["ID"] == wanted:
+                return it
+        raise SimulatedApiError("NOT_FOUND", "Not found", status=400)
+
+    def _deal_fields(self, params: dict) -> dict:
+        return {
+            "ID": {"type": "integer", "title": "ID"},
+            "TITLE": {"type": "string", "title": "Название"},
+            "TYPE_ID": {"type": "crm_status", "title": "Тип"},
+            "STAGE_ID": {"type": "crm_status", "title": "Стадия"},
+            UF_PRIORITY_CODE: {
+                "type": "enumeration",
+                "title": UF_PRIORITY_CODE,
+                "formLabel": "Приоритет",
+                "items": [{"ID": k, "VALUE": v} for k, v in PRIORITIES.items()],
+            },
+        }
+
+    def _status_items(self, params: dict) -> list:
+        source = STAGES if params.get("entityId") == "DEAL_STAGE" else DEAL_TYPES
+        return [{"STATUS_ID": k, "NAME": v} for k, v in source.items()]
+
+    def _product_list(self) -> List[dict]:
+        # один и тот же список между вызовами: иначе _query не кэширует
+        # фильтр и постраничная выгрузка каталога сортирует его на каждой странице
+        if len(self._products_list) != len(self.products):
+            self._products_list = list(self.products.values())
+        return self._products_list
+
+    def _product_get(self, params: dict) -> dict:
+        product = self.products.get(int(params.get("ID") or params.get("id") or 0))
+        if not product:
+            raise SimulatedApiError("NOT_FOUND", "Product is not found", status=400)
+        return product
+
+    def _product_images(self, params: dict) -> dict:
+        pid = int(params.get("productId") or 0)
+        if pid not in self.products:
+            return {"productImages": []}
+        url = f"https://example.com/upload/product/{pid}.jpg"
+        return {"productImages": [{"id": pid, "productId": pid, "detailUrl": url, "downloadUrl": url}]}
+
+    def _user_get(self, params: dict) -> dict:
+        flt = dict(params.get("FILTER") or params.get("filter") or {})
+        for k, v in params.items():
+            if k not in ("FILTER", "filter", "start", "sort", "order"):
+                flt[k] = v
+        if str(flt.get("ACTIVE", "")).upper() in ("Y", "TRUE", "1"):
+            flt.pop("ACTIVE")
+            users = [u for u in self.users if u["ACTIVE"]]
+        else:
+            users = self.users
+        return self._list(users, {"filter": flt, "start": params.get("start")})
+
+    def _statistic_get(self, params: dict) -> dict:
+        flt = dict(params.get("FILTER") or {})
+        calls = self.phone_calls
+        user_id = flt.pop("PORTAL_USER_ID", None)
+        if user_id is not None:
+            calls = self._user_calls().get(str(user_id), [])
+        return self._list(calls, {"filter": flt, "start": params.get("start")})
+
+    def _user_calls(self) -> Dict[str, List[dict]]:
+        # индекс звонков по пользователю, пересобирается при добавлении звонков
+        if self._calls_index_size != len(self.phone_calls):
+            index: Dict[str, List[dict]] = {}
+            for c in self.phone_calls:
+                index.setdefault(str(c["PORTAL_USER_ID"]), []).append(c)
+            self._calls_index = index
+            self._calls_index_size = len(self.phone_calls)
+        return self._calls_index
+
+    def _call_register(self, params: dict) -> dict:
+        call_id = f"externalCall.{len(self._registered) + 1}"
+        self._registered[call_id] = dict(params)
+        return {"CALL_ID": call_id}
+
+    def _call_finish(self, params: dict) -> dict:
+        reg = self._registered.get(str(params.get("CALL_ID")))
+        if not reg:
+            raise SimulatedApiError("NOT_FOUND", "Call is not found", status=400)
+        self.phone_calls.append({
+            "ID": params["CALL_ID"],
+            "PORTAL_USER_ID": str(params.get("USER_ID") or reg.get("USER_ID")),
+            "CALL_TYPE": str(reg.get("TYPE", "1")),
+            "CALL_DURATION": int(params.get("DURATION") or 0),
+            "CALL_START_DATE": reg.get("CALL_START_DATE"),
+        })
+        return {"CALL_ID": params["CALL_ID"]}
+
+    def _batch(self, params: dict) -> dict:
+        cmd = params.get("cmd") or {}
+        halt = str(params.get("halt", 0)) in ("1", "true", "True")
+        result, errors, totals, nexts = {}, {}, {}, {}
+        for key, command in cmd.items():
+            method, _, query = command.partition("?")
+            sub = self._substitute(parse_php_query(query), result)
+            try:
+                resp = self._dispatch(method, sub)
+            except SimulatedApiError as e:
+                errors[key] = {"error": e.error, "error_description": e.description}
+                if halt:
+                    break
+                continue
+            result[key] = resp.get("result")
+            if "total" in resp:
+                totals[key] = resp["total"]
+            if "next" in resp:
+                nexts[key] = resp["next"]
+        return {
+            "result": result,
+            "result_error": errors,
+            "result_total": totals,
+            "result_next": nexts,
+        }
+
+    def _substitute(self, value: Any, results: dict) -> Any:
+        if isinstance(value, dict):
+            return {k: self._substitute(v, results) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._substitute(v, results) for v in value]
+        if isinstance(value, str) and value.startswith("$result["):
+            m = _REF_RE.match(value)
+            if m:
+                res: Any = results.get(m.group(1))
+                for part in re.findall(r"\[([^\]]*)\]", m.group(2)):
+                    res = res.get(part) if isinstance(res, dict) else None
+                return res
+        return value
+
+    # --------- точка входа ---------
+
+    def _dispatch(self, method: str, params: dict) -> dict:
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            handler = self._methods.get(method)
+            if method == "batch":
+                return {"result": self._batch(params)}
+            if handler is None:
+                raise SimulatedApiError("ERROR_METHOD_NOT_FOUND", f"Method not found: {method}", status=404)
+            result = handler(params or {})
+        return result if isinstance(result, dict) and "result" in result else {"result": result}
+
+    def handle(self, method: str, params: Optional[dict] = None) -> dict:
+        """
+        Один HTTP-запрос к порталу: задержка, лимит, затем ответ в формате REST.
+        Ошибки возвращаются как {"error": ..., "error_description": ...}.
+        """
+        self.requests += 1
+        if self.latency or self.jitter:
+            time.sleep(self.latency + (self._rnd.random() * self.jitter if self.jitter else 0))
+        if self._limiter is not None and not self._limiter.try_acquire():
+            self.rate_limited += 1
+            return {"error": "QUERY_LIMIT_EXCEEDED", "error_description": "Too many requests"}
+        try:
+            response = self._dispatch(method, params or {})
+        except SimulatedApiError as e:
+            return {"error": e.error, "error_description": e.description}
+        response.setdefault("time", {"start": time.time()})
+        self.bytes_sent += len(json.dumps(response, ensure_ascii=False, default=str))
+        return response
+
+    def reset_stats(self) -> None:
+        self.calls.clear()
+        self.requests = 0
+        self.rate_limited = 0
+        self.bytes_sent = 0
+
+    def webhook_call(self, method: str, params: dict) -> Optional[dict]:
+        """Замена qr.services._bx24_call: None при ошибке, как у настоящего."""
+        response = self.handle(method, params)
+        return None if "error" in response else response
+
+
+class SimulatedToken:
+    """
+    Подмена BitrixUserToken: call_api_method / call_list_method
+    работают поверх SimulatedPortal.
+    """
+
+    def __init__(self, portal: SimulatedPortal, domain: str = "sim.bitrix24.ru"):
+        self.portal = portal
+        self.domain = domain
+        self.auth_token = "simulated"
+        self.id = 0
+
+    def refresh(self, *args, **kwargs) -> bool:
+        return True
+
+    def call_api_method(self, api_method: str, params: Optional[dict] = None, timeout: Any = None) -> dict:
+        response = self.portal.handle(api_method, params or {})
+        if "error" in response:
+            raise SimulatedApiError(response["error"], response.get("error_description", ""))
+        return response
+
+    def call_list_method(self, method: str, fields: Optional[dict] = None, **kwargs) -> Any:
+        fields = dict(fields or {})
+        response = self.call_api_method(method, fields)
+        result = response.get("result")
+        if not isinstance(result, list):
+            return result
+
+        items = list(result)
+        while response.get("next"):
+            fields["start"] = response["next"]
+            response = self.call_api_method(method, fields)
+            items.extend(response.get("result") or [])
+        return items
+
+
+@contextmanager
+def patch_webhook(portal: SimulatedPortal):
+    """Перенаправляет qr.services._bx24_call в симулятор на время блока."""
+    from internship_b24.qr import services as qr_services
+
+    original = qr_services._bx24_call
+    qr_services._bx24_call = portal.webhook_call
+    try:
+        yield portal
+    finally:
+        qr_services._bx24_call = original
+
+
+class _Handler(BaseHTTPRequestHandler):
+    portal: SimulatedPortal
+
+    def do_POST(self):
+        m = re.match(r"^/rest/(?:[^/]+/[^/]+/)?([\w.]+?)(?:\.json)?/?$", self.path.split("?")[0])
+        if not m:
+            self._reply(404, {"error": "NOT_FOUND"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length).decode("utf-8") if length else ""
+        if "json" in (self.headers.get("Content-Type") or ""):
+            params = json.loads(raw or "{}")
+        else:
+            params = parse_php_query(raw)
+        params.pop("auth", None)
+
+        response = self.portal.handle(m.group(1), params)
+        status = 503 if response.get("error") == "QUERY_LIMIT_EXCEEDED" else (400 if "error" in response else 200)
+        self._reply(status, response)
+
+    def _reply(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(portal: SimulatedPortal, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """
+    Поднимает HTTP-сервер симулятора в фоновом потоке.
+    Вебхук: BITRIX_WEBHOOK_BASE = f"http://{host}:{server.server_port}/rest".
+    """
+    handler = type("SimulatedPortalHandler", (_Handler,), {"portal": portal})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="bx-simulator").start()
+    return server
@@ -0,0 +1,189 @@
+"""
+Колоночное представление строк контактов и его файловый формат.
+
+ContactColumns хранит каждое поле отдельным столбцом. В памяти столбец —
+обычный list[str], в файле — массив смещений uint64 и общий blob UTF-8,
+где каждое значение завершается нулевым байтом:
+
+    b"B24COLS1" | uint32 столбцов | uint64 строк
+    | для каждого столбца: uint16 длина имени + имя
+    | выравнивание до 8 | для каждого столбца: смещения (строк + 1) и blob,
+      выровненный до 8
+
+ContactColumns.open() отображает файл в память (mmap) и ничего не
+разбирает: отдельная строка декодируется только при обращении к ней, а
+обход столбца целиком декодирует blob одним вызовом и режет его по нулевым
+байтам (если их нет внутри значений). Порядок байт — родной для машины:
+файлы — локальный кэш и никуда не переносятся.
+
+Pyarrow в зависимостях проекта нет, поэтому формат свой, без Arrow/Parquet.
+"""
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+from array import array
+from typing import Iterable, Iterator, Sequence
+
+MAGIC = b"B24COLS1"
+_HEAD = struct.Struct("=8sIQ")
+_NAME_LEN = struct.Struct("=H")
+
+EXPORT_FIELDS = ("first_name", "last_name", "phone", "email", "company")
+
+
+def _pad(n: int) -> int:
+    return -n % 8
+
+
+class MappedColumn(Sequence[str]):
+    """Столбец строк поверх mmap: смещения и байты без копирования."""
+
+    def __init__(self, offsets: memoryview, blob: memoryview):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        # последний байт значения — завершающий ноль
+        return str(self._blob[self._offsets[i]:self._offsets[i + 1] - 1], "utf-8", "surrogatepass")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.tolist())
+
+    def tolist(self) -> list[str]:
+        n = len(self)
+        raw = bytes(self._blob)
+        if raw.count(b"\0") == n:
+            # нулей ровно по одному на значение — режем весь столбец разом
+            return raw.decode("utf-8", "surrogatepass").split("\0")[:n]
+        offsets = self._offsets.tolist()
+        return [
+            raw[offsets[i]:offsets[i + 1] - 1].decode("utf-8", "surrogatepass")
+            for i in range(n)
+        ]
+
+
+class ContactColumns:
+    def __init__(self, columns: dict[str, Sequence[str]], length: int | None = None):
+        self.columns = columns
+        if length is None:
+            length = len(next(iter(columns.values()))) if columns else 0
+        self.length = length
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict[str, str]], fields: Sequence[str] | None = None) -> "ContactColumns":
+        rows = rows if isinstance(rows, list) else list(rows)
+        if fields is None:
+            fields = list(rows[0]) if rows else list(EXPORT_FIELDS)
+        return cls({f: [row.get(f, "") or "" for row in rows] for f in fields}, len(rows))
+
+    @classmethod
+    def from_tuples(cls, tuples: Iterable[Sequence[str]], fields: Sequence[str] = EXPORT_FIELDS) -> "ContactColumns":
+        columns: list[list[str]] = [[] for _ in fields]
+        appends = [c.append for c in columns]
+        for values in tuples:
+            for append, value in zip(appends, values):
+                append(value)
+        return cls(dict(zip(fields, columns)))
+
+    def __len__(self) -> int:
+        return self.length
+
+    @property
+    def fields(self) -> list[str]:
+        return list(self.columns)
+
+    def tuples(self, fields: Sequence[str] | None = None) -> Iterator[tuple[str, ...]]:
+        return zip(*(self.columns[f] for f in (fields or self.fields)))
+
+    def rows(self) -> list[dict[str, str]]:
+        """Строки в виде словарей — для import_contacts и предпросмотра."""
+        fields = self.fields
+        return [dict(zip(fields, values)) for values in self.tuples(fields)]
+
+    def filter(self, keep: Sequence[bool]) -> "ContactColumns":
+        return ContactColumns(
+            {f: [v for v, k in zip(col, keep) if k] for f, col in self.columns.items()},
+            sum(1 for k in keep if k),
+        )
+
+    # --------- файл ---------
+
+    def save(self, path: str) -> None:
+        """Пишет во временный файл и атомарно переименовывает в path."""
+        fields = self.fields
+        with open(path + ".tmp", "wb") as f:
+            f.write(_HEAD.pack(MAGIC, len(fields), self.length))
+            written = _HEAD.size
+            for name in fields:
+                raw = name.encode("utf-8")
+                f.write(_NAME_LEN.pack(len(raw)) + raw)
+                written += _NAME_LEN.size + len(raw)
+            f.write(b"\0" * _pad(written))
+
+            for name in fields:
+                offsets = array("Q", [0])
+                blob = bytearray()
+                for value in self.columns[name]:
+                    blob += value.encode("utf-8", "surrogatepass")
+                    blob += b"\0"
+                    offsets.append(len(blob))
+                f.write(offsets.tobytes())
+                f.write(blob)
+                f.write(b"\0" * _pad(len(blob)))
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def open(cls, path: str) -> "ContactColumns":
+        """Столбцы файла path поверх mmap; ValueError, если формат не тот."""
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEAD.size:
+                raise ValueError(f"{path}: не файл столбцов контактов")
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            columns, nrows = cls._read_columns(mm, size)
+        except (struct.error, TypeError, UnicodeDecodeError):
+            raise ValueError(f"{path}: файл столбцов повреждён")
+        if columns is None:
+            raise ValueError(f"{path}: не файл столбцов контактов или он обрезан")
+        return cls(columns, nrows)
+
+    @staticmethod
+    def _read_columns(mm, size: int) -> tuple[dict[str, Sequence[str]] | None, int]:
+        magic, ncols, nrows = _HEAD.unpack_from(mm, 0)
+        if magic != MAGIC:
+            return None, 0
+
+        pos = _HEAD.size
+        names = []
+        for _ in range(ncols):
+            (n,) = _NAME_LEN.unpack_from(mm, pos)
+            pos += _NAME_LEN.size
+            names.append(bytes(mm[pos:pos + n]).decode("utf-8"))
+            pos += n
+        pos += _pad(pos)
+
+        view = memoryview(mm)
+        columns: dict[str, Sequence[str]] = {}
+        for name in names:
+            if pos + 8 * (nrows + 1) > size:
+                return None, 0
+            offsets = view[pos:pos + 8 * (nrows + 1)].cast("Q")
+            pos += 8 * (nrows + 1)
+            blob_len = offsets[-1]
+            if pos + blob_len > size:
+                return None, 0
+            columns[name] = MappedColumn(offsets, view[pos:pos + blob_len])
+            pos += blob_len + _pad(blob_len)
+        return columns, nrows
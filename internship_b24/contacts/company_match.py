@@ -0,0 +1,269 @@
+"""
+Нечёткое сопоставление компаний по названию для импорта контактов.
+
+Название приводится к ключу: нижний регистр, кириллица -> латиница,
+без кавычек/пунктуации и организационно-правовых форм, слова по алфавиту.
+"ООО «Ромашка»", "Ромашка ООО" и "Romashka LLC" дают один ключ "romashka".
+
+Сначала ищем ключ точно (dict), затем по триграммам: инвертированный
+индекс trigram -> номера компаний и коэффициент Дайса не ниже порога.
+Кандидатов собираем только из самых редких триграмм запроса (prefix
+filtering) и отбрасываем по верхней оценке сходства до точного подсчёта,
+поэтому поиск не перебирает все компании. Числа в названии должны
+совпадать точно: "Строй 15" и "Строй 16" — разные компании.
+"""
+from __future__ import annotations
+
+import math
+import re
+from array import array
+from collections import Counter
+from heapq import heapify, heappop
+from typing import Iterable
+
+from internship_b24.bx_batch import BATCH_LIMIT, RestBatch
+
+DEFAULT_THRESHOLD = 0.75
+
+_TRANSLIT = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e",
+    "ж": "zh", "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m",
+    "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch",
+    "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+})
+
+# полные названия форм убираем до разбиения на слова
+_LEGAL_PHRASES = re.compile(
+    r"общество с ограниченной ответственностью|"
+    r"(?:публичное |закрытое |открытое |непубличное )?акционерное общество|"
+    r"индивидуальный предприниматель|"
+    r"limited liability company|public limited company"
+)
+
+# аббревиатуры — уже после транслитерации
+_LEGAL_FORMS = frozenset({
+    "ooo", "oao", "zao", "pao", "ao", "nao", "ip", "chp", "nko", "ano",
+    "gup", "mup", "fgup", "tsj", "tszh", "snt", "kfkh", "pk",
+    "llc", "ltd", "limited", "inc", "incorporated", "corp", "corporation",
+    "co", "company", "plc", "llp", "lp", "gmbh", "ag", "sa", "sas", "bv", "jsc",
+    "pjsc", "ojsc", "cjsc",
+})
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def company_key(title: str | None) -> str:
+    """Ключ сопоставления; пустая строка, если от названия ничего не осталось."""
+    if not title:
+        return ""
+    s = _LEGAL_PHRASES.sub(" ", title.lower()).translate(_TRANSLIT)
+    tokens = [t for t in _NON_WORD.split(s) if t and t not in _LEGAL_FORMS]
+    if not tokens:
+        # название целиком из формы ("ИП") — оставляем как есть
+        tokens = [t for t in _NON_WORD.split(s) if t]
+    return " ".join(sorted(tokens))
+
+
+def _trigrams(key: str) -> set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _numbers(key: str) -> frozenset[str]:
+    return frozenset(t for t in key.split() if t.isdigit())
+
+
+class CompanyMatcher:
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self._exact: dict[str, int] = {}
+        self._keys: list[str] = []
+        self._ids = array("q")
+        # триграммы ключей — номерами, подряд в одном массиве
+        self._gram_ids: dict[str, int] = {}
+        self._grams = array("I")
+        self._offsets = array("Q", [0])
+        # число триграмм ключа — фильтр по длине без среза _grams
+        self._sizes = array("H")
+        # номер триграммы -> позиции ключей без чисел
+        self._postings: list[array] = []
+        self._by_number: dict[str, array] = {}
+        # кэш по исходному названию: в файле одни и те же компании повторяются
+        self._hits: dict[str, int] = {}
+        self._misses: set[str] = set()
+
+    @classmethod
+    def from_companies(cls, companies: Iterable[dict], threshold: float = DEFAULT_THRESHOLD) -> "CompanyMatcher":
+        matcher = cls(threshold)
+        for c in companies:
+            try:
+                cid = int(c.get("ID"))
+            except (TypeError, ValueError):
+                continue
+            matcher.add(c.get("TITLE"), cid)
+        return matcher
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, title: str | None, company_id: int) -> None:
+        key = company_key(title)
+        if not key or key in self._exact:
+            return
+        self._exact[key] = company_id
+        pos = len(self._keys)
+        self._keys.append(key)
+        self._ids.append(company_id)
+
+        gram_ids = []
+        for gram in _trigrams(key):
+            gid = self._gram_ids.get(gram)
+            if gid is None:
+                gid = self._gram_ids[gram] = len(self._postings)
+                self._postings.append(array("l"))
+            gram_ids.append(gid)
+        self._grams.extend(gram_ids)
+        self._offsets.append(len(self._grams))
+        self._sizes.append(len(gram_ids))
+
+        # названия с числами ищутся по числам, без чисел — по триграммам
+        numbers = _numbers(key)
+        if numbers:
+            for number in numbers:
+                self._by_number.setdefault(number, array("l")).append(pos)
+        else:
+            for gid in gram_ids:
+                self._postings[gid].append(pos)
+        # новая компания может стать ответом на прежние промахи
+        self._misses.clear()
+
+    def match(self, title: str | None) -> int | None:
+        """ID компании или None, если похожей нет."""
+        if not title:
+            return None
+        cid = self._hits.get(title)
+        if cid is not None or title in self._misses:
+            return cid
+        cid = self._match_key(company_key(title))
+        if cid is None:
+            self._misses.add(title)
+        else:
+            self._hits[title] = cid
+        return cid
+
+    def _match_key(self, key: str) -> int | None:
+        if not key:
+            return None
+        cid = self._exact.get(key)
+        if cid is not None:
+            return cid
+
+        grams = _trigrams(key)
+        size = len(grams)
+        known = {self._gram_ids[g] for g in grams if g in self._gram_ids}
+        numbers = _numbers(key)
+        if numbers:
+            candidates = self._with_numbers(numbers)
+        else:
+            candidates = self._prefix_candidates(known, size)
+
+        grams_flat, offsets = self._grams, self._offsets
+        best, best_score = None, self.threshold
+        while candidates:
+            neg_bound, pos = heappop(candidates)
+            if -neg_bound < best_score:
+                # кандидаты выходят по убыванию оценки — дальше только хуже
+                break
+            other = grams_flat[offsets[pos]:offsets[pos + 1]]
+            score = 2 * len(known.intersection(other)) / (size + len(other))
+            if score > best_score or (score == best_score and (best is None or pos < best)):
+                best, best_score = pos, score
+        return None if best is None else self._ids[best]
+
+    def _with_numbers(self, numbers: frozenset[str]) -> list[tuple[float, int]]:
+        postings = sorted((self._by_number.get(n, ()) for n in numbers), key=len)
+        candidates = set(postings[0])
+        for other in postings[1:]:
+            candidates.intersection_update(other)
+        # отсортированный список — уже куча
+        return [(-1.0, pos) for pos in sorted(candidates) if _numbers(self._keys[pos]) == numbers]
+
+    def _prefix_candidates(self, known: set[int], size: int) -> list[tuple[float, int]]:
+        """
+        Куча кандидатов (-верхняя оценка сходства, позиция): heappop
+        отдаёт их по убыванию оценки, при равной — по позиции.
+        Считаем, сколько из самых редких триграмм запроса есть у ключа (c),
+        и оцениваем сходство так, будто совпали и все остальные.
+        """
+        t = self.threshold
+        # Дайс 2c/(|A|+|B|) >= t при c <= |B| требует c >= t|A|/(2-t)
+        need = math.ceil(t * size / (2 - t))
+        if len(known) < need:
+            return []
+        postings = sorted((self._postings[gid] for gid in known), key=len)
+        split = len(postings) - need + 1
+        rest = len(postings) - split
+
+        counts: Counter = Counter()
+        for posting in postings[:split]:
+            counts.update(posting)
+
+        # при c совпадениях у кандидата может быть не больше max_size[c]
+        # триграмм и не меньше need, иначе порог недостижим
+        max_size = [0] + [int(2 * (c + rest) / t - size) for c in range(1, split + 1)]
+        sizes = self._sizes
+        # полная сортировка дороже: до Дайса доходит лишь начало списка
+        heap = [
+            (-2 * min(c + rest, other) / (size + other), pos)
+            for pos, c in counts.items()
+            if need <= (other := sizes[pos]) <= max_size[c]
+        ]
+        heapify(heap)
+        return heap
+
+
+def build_company_matcher(but, threshold: float = DEFAULT_THRESHOLD) -> CompanyMatcher:
+    items = but.call_list_method(
+        "crm.company.list",
+        fields={"select": ["ID", "TITLE"]},
+    ) or []
+    return CompanyMatcher.from_companies(items, threshold)
+
+
+def missing_companies(matcher: CompanyMatcher, titles: Iterable[str]) -> list[str]:
+    """
+    Названия, для которых matcher не нашёл пары; похожие друг на друга
+    новые названия попадают в список один раз.
+    """
+    pending: list[str] = []
+    seen = CompanyMatcher(matcher.threshold)
+    for title in titles:
+        title = (title or "").strip()
+        if not company_key(title) or matcher.match(title) is not None or seen.match(title) is not None:
+            continue
+        seen.add(title, len(pending))
+        pending.append(title)
+    return pending
+
+
+def create_missing_companies(but, matcher: CompanyMatcher, titles: Iterable[str]) -> int:
+    """
+    Создаёт компании, для которых matcher не нашёл пары, батчами по
+    BATCH_LIMIT; новые ID сразу попадают в matcher. Возвращает число созданных.
+    """
+    created = 0
+    batch = RestBatch.for_token(but)
+    calls = []
+    for title in missing_companies(matcher, titles):
+        calls.append((title, batch.add("crm.company.add", {"fields": {"TITLE": title}})))
+        if len(batch) >= BATCH_LIMIT:
+            batch.flush()
+    batch.flush()
+
+    for title, call in calls:
+        cid = call.result()
+        if cid:
+            matcher.add(title, int(cid))
+            created += 1
+    return created
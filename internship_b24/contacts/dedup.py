@@ -0,0 +1,149 @@
+"""
+Компактный индекс дублей контактов для импорта.
+
+Снаружи ведёт себя как set[tuple[str, str]] из ключей ('phone', digits) /
+('email', normalized): `key in index`, `index.add(key)`, `len(index)`.
+
+Внутри:
+- телефоны из портала — отсортированный array('Q') чисел int('1' + digits)
+  (ведущая единица сохраняет нули в начале; до 18 цифр влезает в 64 бита);
+- почты из портала — отсортированный array('Q') 64-битных хэшей плюс общий
+  blob с самими адресами: при совпадении хэша адрес сверяется побайтно,
+  поэтому коллизии не дают ложных дублей;
+- ключи, добавленные по ходу импорта, — обычные set (их немного).
+
+Хэши — встроенный hash() процесса: индекс живёт в памяти одного импорта
+и никуда не сохраняется.
+"""
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from typing import Iterable
+
+_MASK = (1 << 64) - 1
+_MAX_PHONE_DIGITS = 18
+
+
+def _phone_code(digits: str) -> int | None:
+    if len(digits) > _MAX_PHONE_DIGITS or not digits.isascii() or not digits.isdigit():
+        return None
+    return int("1" + digits)
+
+
+def _email_hash(email: str) -> int:
+    return hash(email) & _MASK
+
+
+def _contains_sorted(arr: array, value: int) -> bool:
+    i = bisect_left(arr, value)
+    return i < len(arr) and arr[i] == value
+
+
+class ContactIndex:
+    def __init__(self, phones: Iterable[str] = (), emails: Iterable[str] = ()):
+        self._phones = array("Q")
+        self._email_hashes = array("Q")
+        self._email_offsets = array("Q", [0])
+        self._email_blob = b""
+
+        # добавленные через add(); сюда же — телефоны, не влезающие в 64 бита
+        self._new_phones: set[int | str] = set()
+        self._new_emails: set[str] = set()
+        self._other: set = set()
+
+        self._build_phones(phones)
+        self._build_emails(emails)
+
+    def _build_phones(self, phones: Iterable[str]) -> None:
+        codes = set()
+        for p in phones:
+            if not p:
+                continue
+            if len(p) <= _MAX_PHONE_DIGITS and p.isascii() and p.isdigit():
+                codes.add(int("1" + p))
+            else:
+                self._new_phones.add(p)
+        self._phones = array("Q", sorted(codes))
+
+    def _build_emails(self, emails: Iterable[str]) -> None:
+        unique = list({e for e in emails if e})
+        hashes = array("Q", map(_email_hash, unique))
+        # сортируем индексы, а не пары (hash, email): быстрее и без миллиона кортежей
+        order = sorted(range(len(unique)), key=hashes.__getitem__)
+        self._email_hashes = array("Q", map(hashes.__getitem__, order))
+        del hashes
+
+        offsets = array("Q", [0])
+        blob = bytearray()
+        for i in order:
+            blob += unique[i].encode("utf-8", "surrogatepass")
+            offsets.append(len(blob))
+        self._email_offsets = offsets
+        self._email_blob = bytes(blob)
+
+    # --------- set-подобный интерфейс ---------
+
+    def __contains__(self, key) -> bool:
+        try:
+            kind, value = key
+        except (TypeError, ValueError):
+            return key in self._other
+        if kind == "phone" and isinstance(value, str):
+            return self._has_phone(value)
+        if kind == "email" and isinstance(value, str):
+            return value in self._new_emails or self._has_stored_email(value)
+        return key in self._other
+
+    def add(self, key) -> None:
+        try:
+            kind, value = key
+        except (TypeError, ValueError):
+            kind = value = None
+        if kind == "phone" and isinstance(value, str):
+            code = _phone_code(value)
+            self._new_phones.add(value if code is None else code)
+        elif kind == "email" and isinstance(value, str):
+            self._new_emails.add(value)
+        else:
+            self._other.add(key)
+
+    def __len__(self) -> int:
+        # add() уже существующего ключа не дублирует его в подсчёте
+        new_phones = sum(
+            1 for p in self._new_phones
+            if isinstance(p, str) or not _contains_sorted(self._phones, p)
+        )
+        new_emails = sum(1 for e in self._new_emails if not self._has_stored_email(e))
+        return len(self._phones) + len(self._email_hashes) + new_phones + new_emails + len(self._other)
+
+    @property
+    def nbytes(self) -> int:
+        """Размер упакованной части (массивы и blob), без set-ов добавленных ключей."""
+        return (
+            self._phones.itemsize * len(self._phones)
+            + self._email_hashes.itemsize * len(self._email_hashes)
+            + self._email_offsets.itemsize * len(self._email_offsets)
+            + len(self._email_blob)
+        )
+
+    # --------- проверки ---------
+
+    def _has_phone(self, digits: str) -> bool:
+        code = _phone_code(digits)
+        if code is None:
+            return digits in self._new_phones
+        return code in self._new_phones or _contains_sorted(self._phones, code)
+
+    def _has_stored_email(self, email: str) -> bool:
+        hashes = self._email_hashes
+        h = _email_hash(email)
+        i = bisect_left(hashes, h)
+        raw = None
+        while i < len(hashes) and hashes[i] == h:
+            if raw is None:
+                raw = email.encode("utf-8", "surrogatepass")
+            if self._email_blob[self._email_offsets[i]:self._email_offsets[i + 1]] == raw:
+                return True
+            i += 1
+        return False
@@ -0,0 +1,187 @@
+"""
+Параллельный разбор больших CSV с диска.
+
+Файл отображается в память (mmap) и делится на байтовые диапазоны по
+границам записей: режем только на переводе строки, перед которым чётное
+число кавычек, — то есть не внутри поля в кавычках. Пул процессов один на
+воркер (spawn, создаётся при первом большом файле); каждый процесс пула
+сам открывает файл, разбирает свой диапазон и нормализует строки
+(normalize_rows); результаты склеиваются в исходном порядке.
+
+XLSX так не делится (zip с общими строками, openpyxl читает лист
+последовательно) и разбирается в одном процессе, как раньше.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import mmap
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+from internship_b24.contacts.columnar import ContactColumns
+from internship_b24.contacts.snapshots import cache_key, cached_columns, file_digest
+from internship_b24.contacts.services import (
+    csv_header_keys,
+    csv_records_to_rows,
+    normalize_rows,
+    parse_csv_file,
+    parse_xlsx_file,
+)
+
+_COUNT_BLOCK = 16 * 1024 * 1024
+# диапазонов больше, чем процессов: быстрые не простаивают в конце
+_RANGES_PER_WORKER = 4
+
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """
+    Один пул на процесс, spawn: fork из многопоточного веб-воркера копирует
+    чужие захваченные блокировки, а новый пул на запрос — это ещё и запуск
+    процессов каждый раз.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=_workers(), mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _workers() -> int:
+    return getattr(settings, "CONTACTS_PARSE_WORKERS", None) or os.cpu_count() or 1
+
+
+def _min_size() -> int:
+    return getattr(settings, "CONTACTS_PARALLEL_PARSE_MIN_SIZE", 16 * 1024 * 1024)
+
+
+def _count_quotes(mm, start: int, end: int) -> int:
+    count = 0
+    for pos in range(start, end, _COUNT_BLOCK):
+        count += mm[pos:min(pos + _COUNT_BLOCK, end)].count(b'"')
+    return count
+
+
+def _record_end(mm, pos: int, quotes: int) -> int:
+    """
+    Начало первой записи не раньше pos; quotes — число кавычек до pos.
+    Если до конца файла кавычки не закрылись — len(mm).
+    """
+    size = len(mm)
+    while pos < size:
+        nl = mm.find(b"\n", pos)
+        if nl == -1:
+            return size
+        quotes += mm[pos:nl].count(b'"')
+        pos = nl + 1
+        if quotes % 2 == 0:
+            return pos
+    return size
+
+
+def split_csv(mm, parts: int) -> tuple[int, list[tuple[int, int]]] | None:
+    """
+    (конец заголовка, диапазоны записей) или None, если кавычек в файле
+    нечётное число: где-то есть одиночная кавычка внутри поля, и по
+    чётности границы записей не найти — такой файл разбираем целиком.
+    """
+    size = len(mm)
+    header_end = _record_end(mm, 0, 0)
+    span = max(1, (size - header_end) // max(parts, 1))
+    targets = list(range(header_end + span, size, span))[:parts - 1]
+
+    bounds = [header_end]
+    quotes = 0
+    prev = header_end
+    for target in targets:
+        quotes += _count_quotes(mm, prev, target)
+        prev = target
+        end = _record_end(mm, target, quotes)
+        if end > bounds[-1]:
+            bounds.append(end)
+    quotes += _count_quotes(mm, prev, size)
+    if quotes % 2:
+        return None
+    if bounds[-1] < size:
+        bounds.append(size)
+    return header_end, list(zip(bounds, bounds[1:]))
+
+
+def _parse_range(path: str, start: int, end: int, keys: list[str | None]) -> list[dict[str, str]]:
+    """Выполняется в процессе пула: разбор и нормализация одного диапазона."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode("utf-8")
+    rows = csv_records_to_rows(csv.reader(io.StringIO(text), delimiter=","), keys)
+    return normalize_rows(rows)
+
+
+def parse_csv_path(path: str, workers: int | None = None, min_size: int | None = None) -> list[dict[str, str]]:
+    """
+    Нормализованные строки CSV-файла path. Файлы от min_size (CONTACTS_PARALLEL_PARSE_MIN_SIZE)
+    байт разбираются пулом из workers (CONTACTS_PARSE_WORKERS) процессов.
+    """
+    workers = workers or _workers()
+    size = os.path.getsize(path)
+    if workers < 2 or size < (_min_size() if min_size is None else min_size):
+        with open(path, "rb") as f:
+            return normalize_rows(parse_csv_file(f))
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        split = split_csv(mm, workers * _RANGES_PER_WORKER)
+        if split is None:
+            return normalize_rows(parse_csv_file(f))
+        header_end, ranges = split
+        header = next(csv.reader(io.StringIO(mm[:header_end].decode("utf-8-sig"))), [])
+
+    if not ranges:
+        return []
+    keys = csv_header_keys(header)
+    rows: list[dict[str, str]] = []
+    futures = [_get_pool().submit(_parse_range, path, start, end, keys) for start, end in ranges]
+    try:
+        for future in futures:
+            rows.extend(future.result())
+    finally:
+        for future in futures:
+            future.cancel()
+    return rows
+
+
+def parse_path(path: str, name: str | None = None) -> list[dict[str, str]]:
+    """Файл импорта с диска: CSV — параллельно, XLSX — как parse_uploaded_file."""
+    name = (name or path).lower()
+    if name.endswith(".csv"):
+        return parse_csv_path(path)
+    if name.endswith(".xlsx") or name.endswith(".xlsm"):
+        with open(path, "rb") as f:
+            return parse_xlsx_file(f)
+    raise ValueError("Поддерживаются только CSV и XLSX")
+
+
+def parse_path_cached(path: str, name: str | None = None) -> list[dict[str, str]]:
+    """
+    parse_path с кэшем по sha256 содержимого: повторно загруженный тот же
+    файл читается из столбцов на диске (CONTACTS_PARSE_CACHE_TTL).
+    """
+    ext = os.path.splitext(name or path)[1].lower()
+    parsed: list[list[dict[str, str]]] = []
+
+    def build() -> ContactColumns:
+        parsed.append(parse_path(path, name))
+        return ContactColumns.from_rows(parsed[0])
+
+    columns = cached_columns(
+        "parsed",
+        cache_key(file_digest(path), ext),
+        getattr(settings, "CONTACTS_PARSE_CACHE_TTL", 3600),
+        build,
+    )
+    return parsed[0] if parsed else columns.rows()
@@ -0,0 +1,186 @@
+"""
+Предпросмотр импорта контактов (dry-run).
+
+preview_import прогоняет нормализацию, поиск дублей и сопоставление
+компаний без записи в Bitrix и отдаёт счётчики и примеры строк по
+категориям. Индексы портала (компании, телефоны/почты контактов) кэшируются
+в процессе на CONTACTS_INDEX_TTL секунд отдельно для каждого пользователя
+портала (у пользователей разные права на CRM): повторный предпросмотр и
+последующий импорт их не перестраивают.
+
+Нормализованные строки сохраняются в файл плана (столбцы, contacts.columnar);
+импорт по плану читает его вместо повторного разбора загруженного файла.
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Callable, TypeVar
+
+from django.conf import settings
+
+from internship_b24 import metrics
+from internship_b24.contacts.columnar import ContactColumns
+from internship_b24.contacts.company_match import CompanyMatcher, build_company_matcher, missing_companies
+from internship_b24.contacts.dedup import ContactIndex
+from internship_b24.contacts.services import build_existing_contacts_index, classify_rows, normalize_rows
+from internship_b24.ratelimit import portal_key
+
+SAMPLE_SIZE = 10
+
+T = TypeVar("T")
+
+# (портал, пользователь, вид индекса) -> (время построения, индекс)
+_indexes: dict[tuple[str, Any, str], tuple[float, Any]] = {}
+_indexes_lock = threading.Lock()
+
+
+def _index_ttl() -> float:
+    return getattr(settings, "CONTACTS_INDEX_TTL", 300)
+
+
+def _cached_index(but, kind: str, build: Callable[[Any], T], take: bool = False) -> T:
+    """
+    Индекс из кэша процесса или свежепостроенный.
+    take=True забирает индекс из кэша: импорт его изменит, а после
+    импорта он всё равно устареет.
+    """
+    # индекс строится по правам пользователя токена — чужой не отдаём
+    key = (portal_key(but), getattr(but, "user_id", None), kind)
+    with _indexes_lock:
+        entry = _indexes.pop(key, None) if take else _indexes.get(key)
+    fresh = entry is not None and time.monotonic() - entry[0] < _index_ttl()
+    metrics.cache_result(f"contacts_{kind}", fresh)
+    if fresh:
+        return entry[1]
+
+    index = build(but)
+    if not take:
+        with _indexes_lock:
+            _indexes[key] = (time.monotonic(), index)
+    return index
+
+
+def get_company_matcher(but, take: bool = False) -> CompanyMatcher:
+    return _cached_index(but, "companies", build_company_matcher, take)
+
+
+def get_contacts_index(but, take: bool = False) -> ContactIndex:
+    return _cached_index(but, "contacts", build_existing_contacts_index, take)
+
+
+def _sample(row: dict[str, str], **extra: Any) -> dict[str, Any]:
+    return {
+        "first_name": row.get("first_name", ""),
+        "last_name": row.get("last_name", ""),
+        "phone": row.get("phone", ""),
+        "email": row.get("email", ""),
+        "company": row.get("company", ""),
+        **extra,
+    }
+
+
+def preview_import(
+    but,
+    rows: list[dict[str, str]],
+    create_companies: bool = False,
+    sample_size: int = SAMPLE_SIZE,
+) -> dict[str, Any]:
+    """
+    Что сделает import_contacts с этими строками: счётчики и до sample_size
+    примеров в каждой категории. В Bitrix ничего не пишет.
+    """
+    t0 = time.perf_counter()
+    companies = get_company_matcher(but)
+    existing_index = get_contacts_index(but)
+
+    counts = {"create": 0, "duplicate": 0, "empty": 0, "company_matched": 0, "company_unmatched": 0}
+    samples: dict[str, list[dict[str, Any]]] = {"create": [], "duplicate": [], "empty": [], "company_unmatched": []}
+    unmatched_titles: list[str] = []
+
+    for category, row, payload in classify_rows(normalize_rows(rows), companies, existing_index):
+        counts[category] += 1
+        if len(samples[category]) < sample_size:
+            samples[category].append(_sample(row, company_id=(payload or {}).get("COMPANY_ID")))
+        if payload is None or not row.get("company", "").strip():
+            continue
+        if "COMPANY_ID" in payload:
+            counts["company_matched"] += 1
+        else:
+            counts["company_unmatched"] += 1
+            unmatched_titles.append(row["company"])
+            if len(samples["company_unmatched"]) < sample_size:
+                samples["company_unmatched"].append(_sample(row))
+
+    new_companies = missing_companies(companies, unmatched_titles) if create_companies else []
+    return {
+        "total": len(rows),
+        "counts": counts,
+        "samples": samples,
+        "new_companies": len(new_companies),
+        "new_companies_sample": new_companies[:sample_size],
+        "create_companies": create_companies,
+        "elapsed_s": round(time.perf_counter() - t0, 2),
+    }
+
+
+# --------- файл плана ---------
+
+def _plan_dir() -> str:
+    return getattr(settings, "CONTACTS_PLAN_DIR", None) or os.path.join(
+        tempfile.gettempdir(), "b24_import_plans"
+    )
+
+
+def _plan_path(token: str) -> str:
+    # токен — только hex uuid, чтобы из него нельзя было собрать чужой путь
+    if not token or any(ch not in "0123456789abcdef" for ch in token):
+        raise ValueError("Некорректный идентификатор плана импорта")
+    return os.path.join(_plan_dir(), f"{token}.cols")
+
+
+def _plan_ttl() -> float:
+    return getattr(settings, "CONTACTS_PLAN_TTL", 3600)
+
+
+def _drop_expired_plans(directory: str) -> None:
+    now = time.time()
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if now - os.path.getmtime(path) > _plan_ttl():
+                os.remove(path)
+        except OSError:
+            continue
+
+
+def save_plan(rows: list[dict[str, str]]) -> str:
+    """Пишет нормализованные строки во временный файл, возвращает токен плана."""
+    token = uuid.uuid4().hex
+    path = _plan_path(token)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _drop_expired_plans(os.path.dirname(path))
+    ContactColumns.from_rows(normalize_rows(rows)).save(path)
+    return token
+
+
+def load_plan(token: str) -> list[dict[str, str]]:
+    """Строки плана; ValueError, если план не найден или устарел."""
+    path = _plan_path(token)
+    try:
+        age = time.time() - os.path.getmtime(path)
+        if age > _plan_ttl():
+            raise ValueError("План импорта устарел, загрузите файл заново")
+        return ContactColumns.open(path).rows()
+    except FileNotFoundError:
+        raise ValueError("План импорта не найден, загрузите файл заново")
+
+
+def delete_plan(token: str) -> None:
+    try:
+        os.remove(_plan_path(token))
+    except (OSError, ValueError):
+        pass
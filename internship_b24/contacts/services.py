@@ -2,10 +2,24 @@ from __future__ import annotations
 
 import csv
 import io
-from typing import Any, Iterable
+import time
+from typing import Any, Iterable, Iterator
 
+from django.conf import settings
 from openpyxl import load_workbook, Workbook
 
+from internship_b24 import metrics
+from internship_b24.bx_batch import BATCH_LIMIT, RestBatch
+from internship_b24.contacts.columnar import EXPORT_FIELDS, ContactColumns
+from internship_b24.contacts.company_match import (
+    CompanyMatcher,
+    build_company_matcher,
+    create_missing_companies,
+)
+from internship_b24.contacts.dedup import ContactIndex
+from internship_b24.contacts.snapshots import cache_key, incremental_columns
+from internship_b24.ratelimit import portal_key
+
 
 # --------- Утилиты нормализации ---------
 
@@ -31,6 +45,49 @@ def norm_email(raw: str | None) -> str:
     return (raw or "").strip().lower()
 
 
+# Пакетные версии для больших импортов: результат совпадает с norm_phone /
+# norm_email поэлементно. Колонка склеивается через "\n" и обрабатывается
+# одним bytes.translate / lower; если в колонке есть не-ASCII (isdigit и
+# lower там шире ASCII) или сами переводы строк — поэлементный путь.
+
+_SEP = "\n"
+_NOT_DIGITS = bytes(b for b in range(256) if not chr(b).isdigit() and chr(b) != _SEP)
+
+
+def _join_column(values: Iterable[str | None]) -> tuple[list[str], str | None]:
+    column = [v or "" for v in values]
+    joined = _SEP.join(column)
+    if not joined.isascii() or joined.count(_SEP) != max(len(column) - 1, 0):
+        return column, None
+    return column, joined
+
+
+def norm_phones(values: Iterable[str | None]) -> list[str]:
+    column, joined = _join_column(values)
+    if joined is None:
+        return [norm_phone(v) for v in column]
+    if not column:
+        return []
+
+    result = joined.encode("ascii").translate(None, _NOT_DIGITS).decode("ascii").split(_SEP)
+    for i, digits in enumerate(result):
+        n = len(digits)
+        if n == 11 and digits[0] == "8":
+            result[i] = "7" + digits[1:]
+        elif n == 10:
+            result[i] = "7" + digits
+    return result
+
+
+def norm_emails(values: Iterable[str | None]) -> list[str]:
+    column, joined = _join_column(values)
+    if joined is None:
+        return [norm_email(v) for v in column]
+    if not column:
+        return []
+    return [v.strip() for v in joined.lower().split(_SEP)]
+
+
 # --------- Парсинг файлов ---------
 
 
@@ -66,6 +123,35 @@ def _extract_row_common(row: dict[str, str]) -> dict[str, str]:
     }
 
 
+def csv_header_keys(header: list[str]) -> list[str | None]:
+    """Ключи столбцов: strip + lower; None для столбцов без заголовка."""
+    return [h.strip().lower() if h else None for h in header]
+
+
+def csv_records_to_rows(records: Iterable[list[str]], keys: list[str | None]) -> list[dict[str, str]]:
+    """
+    Записи csv.reader -> строки импорта, как у csv.DictReader: пустые записи
+    пропускаем, лишние значения без заголовка отбрасываем, недостающие — "".
+    """
+    rows: list[dict[str, str]] = []
+    width = len(keys)
+    for values in records:
+        if not values:
+            continue
+
+        normalized_row: dict[str, str] = {}
+        for k, v in zip(keys, values):
+            if k is not None:
+                normalized_row[k] = v.strip()
+        if len(values) < width:
+            for k in keys[len(values):]:
+                if k is not None:
+                    normalized_row[k] = ""
+
+        rows.append(_extract_row_common(normalized_row))
+    return rows
+
+
 def parse_csv_file(file) -> list[dict[str, str]]:
     """
     Парсим CSV:
@@ -73,6 +159,7 @@ def parse_csv_file(file) -> list[dict[str, str]]:
     - разделитель ",",
     - нормализуем заголовки: strip + lower,
     - приводим к единому виду через _extract_row_common.
+    Большие CSV с диска разбирает параллельно contacts.parallel_parse.
     """
     data = file.read()
     text = data.decode("utf-8-sig")
@@ -80,23 +167,9 @@ def parse_csv_file(file) -> list[dict[str, str]]:
     if not text.strip():
         return []
 
-    reader = csv.DictReader(io.StringIO(text), delimiter=",")
-
-    rows: list[dict[str, str]] = []
-    for raw_row in reader:
-        if not raw_row:
-            continue
-
-        normalized_row: dict[str, str] = {}
-        for k, v in raw_row.items():
-            if not k:
-                continue
-            key = k.strip().lower()
-            normalized_row[key] = (v or "").strip()
-
-        rows.append(_extract_row_common(normalized_row))
-
-    return rows
+    reader = csv.reader(io.StringIO(text), delimiter=",")
+    header = next(reader, [])
+    return csv_records_to_rows(reader, csv_header_keys(header))
 
 
 def parse_xlsx_file(file) -> list[dict[str, str]]:
@@ -156,7 +229,7 @@ def get_companies_map(but) -> dict[str, int]:
     return result
 
 
-def build_existing_contacts_index(but) -> set[tuple[str, str]]:
+def build_existing_contacts_index(but) -> ContactIndex:
     """
     Индекс уже существующих контактов:
     ('phone', normalized) / ('email', normalized)
@@ -167,64 +240,55 @@ def build_existing_contacts_index(but) -> set[tuple[str, str]]:
         fields={"select": ["ID", "PHONE", "EMAIL"]},
     ) or []
 
-    index: set[tuple[str, str]] = set()
-
+    phones: list[str | None] = []
+    emails: list[str | None] = []
     for c in items:
-        for p in c.get("PHONE", []) or []:
-            np = norm_phone(p.get("VALUE"))
-            if np:
-                index.add(("phone", np))
-        for e in c.get("EMAIL", []) or []:
-            ne = norm_email(e.get("VALUE"))
-            if ne:
-                index.add(("email", ne))
+        phones.extend(p.get("VALUE") for p in c.get("PHONE", []) or [])
+        emails.extend(e.get("VALUE") for e in c.get("EMAIL", []) or [])
+    del items
 
-    return index
+    return ContactIndex(norm_phones(phones), norm_emails(emails))
 
 
-def import_contacts(but, rows: list[dict[str, str]]) -> dict[str, int]:
-    """
-    Импорт контактов из уже распарсенных строк.
-    - Матчим компанию по названию.
-    - Не создаём дубли по телефону/почте.
-    - Создание контактов отправляем в Bitrix батчами.
-    """
-    from urllib.parse import urlencode  # локальный import, чтобы не трогать заголовок файла
+def _is_empty_row(row: dict[str, str]) -> bool:
+    # пустая строка — нет ни имени, ни фамилии
+    return not (row.get("first_name", "").strip() or row.get("last_name", "").strip())
 
-    companies = get_companies_map(but)
-    existing_index = build_existing_contacts_index(but)
 
-    created = 0
-    skipped_duplicates = 0
-    skipped_empty = 0
-
-    seen_in_file: set[tuple[str, str]] = set()
+def normalize_rows(rows: list[dict[str, str]]) -> list[dict[str, str]]:
+    """
+    Добавляет к строкам phone_norm / email_norm (колонками целиком).
+    Уже нормализованные строки (из файла предпросмотра) не трогает.
+    """
+    if not rows or "phone_norm" in rows[0]:
+        return rows
+    phones_norm = norm_phones(row.get("phone", "") for row in rows)
+    emails_norm = norm_emails(row.get("email", "") for row in rows)
+    for row, np, ne in zip(rows, phones_norm, emails_norm):
+        row["phone_norm"] = np
+        row["email_norm"] = ne
+    return rows
 
-    # команды для batch: key -> "crm.contact.add?fields[NAME]=..."
-    batch_cmd: dict[str, str] = {}
-    batch_size = 50  # лимит Bitrix для batch — до 50 команд за один вызов
 
-    def flush_batch():
-        nonlocal batch_cmd
-        if not batch_cmd:
-            return
-        but.call_api_method("batch", params={"halt": 0, "cmd": batch_cmd})
-        batch_cmd = {}
+def classify_rows(
+    rows: list[dict[str, str]],
+    companies: CompanyMatcher,
+    existing_index: ContactIndex,
+) -> Iterator[tuple[str, dict[str, str], dict[str, Any] | None]]:
+    """
+    Разбор нормализованных строк без записи в Bitrix:
+    ("empty", row, None), ("duplicate", row, None) или ("create", row, payload).
+    existing_index только читается, дубли внутри файла копятся отдельно.
+    """
+    seen_in_file = ContactIndex()
 
     for row in rows:
-        fn = row.get("first_name", "").strip()
-        ln = row.get("last_name", "").strip()
-        phone_raw = row.get("phone", "").strip()
-        email_raw = row.get("email", "").strip()
-        company_raw = row.get("company", "").strip()
-
-        # пустая строка (нет ни имени, ни фамилии)
-        if not (fn or ln):
-            skipped_empty += 1
+        if _is_empty_row(row):
+            yield "empty", row, None
             continue
 
-        np = norm_phone(phone_raw)
-        ne = norm_email(email_raw)
+        np = row.get("phone_norm", "")
+        ne = row.get("email_norm", "")
 
         # проверка дублей (в базе + внутри текущего файла)
         keys: list[tuple[str, str]] = []
@@ -234,63 +298,124 @@ def import_contacts(but, rows: list[dict[str, str]]) -> dict[str, int]:
             keys.append(("email", ne))
 
         if any(k in existing_index or k in seen_in_file for k in keys):
-            skipped_duplicates += 1
+            yield "duplicate", row, None
             continue
 
         for k in keys:
             seen_in_file.add(k)
 
         payload: dict[str, Any] = {
-            "NAME": fn,
-            "LAST_NAME": ln,
+            "NAME": row.get("first_name", "").strip(),
+            "LAST_NAME": row.get("last_name", "").strip(),
         }
 
         if np:
-            payload["PHONE"] = [{"VALUE": phone_raw, "VALUE_TYPE": "WORK"}]
+            payload["PHONE"] = [{"VALUE": row.get("phone", "").strip(), "VALUE_TYPE": "WORK"}]
         if ne:
-            payload["EMAIL"] = [{"VALUE": email_raw, "VALUE_TYPE": "WORK"}]
+            payload["EMAIL"] = [{"VALUE": row.get("email", "").strip(), "VALUE_TYPE": "WORK"}]
 
+        company_raw = row.get("company", "").strip()
         if company_raw:
-            cid = companies.get(norm(company_raw))
+            cid = companies.match(company_raw)
             if cid:
                 payload["COMPANY_ID"] = cid
 
+        yield "create", row, payload
+
+
+def import_contacts(
+    but,
+    rows: list[dict[str, str]],
+    create_companies: bool = False,
+    companies: CompanyMatcher | None = None,
+    existing_index: ContactIndex | None = None,
+) -> dict[str, int]:
+    """
+    Импорт контактов из уже распарсенных строк.
+    - Матчим компанию по названию (нечётко, см. company_match).
+    - Если create_companies — недостающие компании создаём батчами.
+    - Не создаём дубли по телефону/почте.
+    - Создание контактов отправляем в Bitrix батчами.
+    Готовые индексы (например, после предпросмотра) можно передать явно.
+    """
+    t0 = time.perf_counter()
+    if companies is None:
+        companies = build_company_matcher(but)
+    created_companies = 0
+    if create_companies:
+        created_companies = create_missing_companies(
+            but,
+            companies,
+            (row.get("company", "") for row in rows if not _is_empty_row(row)),
+        )
+    if existing_index is None:
+        existing_index = build_existing_contacts_index(but)
+
+    counts = {"create": 0, "duplicate": 0, "empty": 0}
+
+    # команды crm.contact.add копятся в batch и уходят по BATCH_LIMIT штук
+    batch = RestBatch.for_token(but)
+
+    for category, _row, payload in classify_rows(normalize_rows(rows), companies, existing_index):
+        counts[category] += 1
+        if payload is None:
+            continue
+
         # добавляем команду в batch
-        cmd_key = f"c{len(batch_cmd)}"
-        batch_cmd[cmd_key] = "crm.contact.add?" + urlencode({"fields": payload})
-        created += 1
+        batch.add("crm.contact.add", {"fields": payload})
 
         # если достигли размера батча — отправляем
-        if len(batch_cmd) >= batch_size:
-            flush_batch()
+        if len(batch) >= BATCH_LIMIT:
+            metrics.import_batch_size.observe(len(batch))
+            batch.flush()
 
     # отправляем остаток, если есть
-    flush_batch()
+    if len(batch):
+        metrics.import_batch_size.observe(len(batch))
+        batch.flush()
+
+    metrics.import_rows.inc(counts["create"], outcome="created")
+    metrics.import_rows.inc(counts["duplicate"], outcome="duplicate")
+    metrics.import_rows.inc(counts["empty"], outcome="empty")
+    metrics.import_seconds.inc(time.perf_counter() - t0)
 
     return {
-        "created": created,
-        "skipped_duplicates": skipped_duplicates,
-        "skipped_empty": skipped_empty,
+        "created": counts["create"],
+        "skipped_duplicates": counts["duplicate"],
+        "skipped_empty": counts["empty"],
+        "created_companies": created_companies,
     }
 
 
+_CONTACT_SNAPSHOT_FIELDS = (
+    "id", "date_modify", "first_name", "last_name", "phone", "email", "company_id", "company_title",
+)
 
-def _collect_contacts_for_export(
+
+def _first_multifield(value: Any) -> str:
+    if value:
+        return value[0].get("VALUE", "") or ""
+    return ""
+
+
+def _fetch_contacts_snapshot(
     but,
     date_from: str | None,
     date_to: str | None,
-    company_filter: str | None = None,
-) -> list[tuple[str, str, str, str, str]]:
+    since: str | None = None,
+) -> ContactColumns:
     """
-    Возвращает список кортежей:
-    (имя, фамилия, телефон, почта, компания)
-    — общая логика для CSV и XLSX экспорта.
+    Контакты за период (по DATE_CREATE) столбцами _CONTACT_SNAPSHOT_FIELDS;
+    since — только изменённые начиная с этого DATE_MODIFY.
     """
     filters: dict[str, Any] = {}
     if date_from:
         filters[">=DATE_CREATE"] = date_from + " 00:00:00"
     if date_to:
         filters["<=DATE_CREATE"] = date_to + " 23:59:59"
+    if since:
+        # >=, а не >: изменения в ту же секунду, что и отметка, не теряются
+        filters[">=DATE_MODIFY"] = since
 
     contacts = but.call_list_method(
         "crm.contact.list",
@@ -303,48 +428,107 @@ def _collect_contacts_for_export(
                 "EMAIL",
                 "COMPANY_ID",
                 "COMPANY_TITLE",
+                "DATE_MODIFY",
             ],
             "filter": filters,
+            "order": {"ID": "ASC"},
         },
     ) or []
 
-    companies_map = get_companies_map(but)
-    # id -> title (normalized)
-    companies_by_id = {cid: title for title, cid in companies_map.items()}
-
-    rows: list[tuple[str, str, str, str, str]] = []
-
-    company_filter_norm = company_filter.lower() if company_filter else None
-
-    for c in contacts:
-        name = c.get("NAME") or ""
-        last_name = c.get("LAST_NAME") or ""
-
-        phone = ""
-        if c.get("PHONE"):
-            phone = c["PHONE"][0].get("VALUE", "") or ""
-
-        email = ""
-        if c.get("EMAIL"):
-            email = c["EMAIL"][0].get("VALUE", "") or ""
-
-        company_title = c.get("COMPANY_TITLE") or ""
-        if not company_title:
-            cid = c.get("COMPANY_ID")
-            if cid:
-                try:
-                    company_title = companies_by_id.get(int(cid), "") or ""
-                except (TypeError, ValueError):
-                    pass
-
-        # фильтр по компании (подстрока, регистр не важен)
-        if company_filter_norm:
-            if not company_title or company_filter_norm not in company_title.lower():
-                continue
+    return ContactColumns.from_tuples(
+        (
+            (
+                str(c.get("ID") or ""),
+                c.get("DATE_MODIFY") or "",
+                c.get("NAME") or "",
+                c.get("LAST_NAME") or "",
+                _first_multifield(c.get("PHONE")),
+                _first_multifield(c.get("EMAIL")),
+                str(c.get("COMPANY_ID") or ""),
+                c.get("COMPANY_TITLE") or "",
+            )
+            for c in contacts
+        ),
+        _CONTACT_SNAPSHOT_FIELDS,
+    )
+
+
+def _fetch_companies_snapshot(but, since: str | None = None) -> ContactColumns:
+    """Компании столбцами id, date_modify, title (нормализованное название)."""
+    items = but.call_list_method(
+        "crm.company.list",
+        fields={
+            "select": ["ID", "TITLE", "DATE_MODIFY"],
+            "filter": {">=DATE_MODIFY": since} if since else {},
+            "order": {"ID": "ASC"},
+        },
+    ) or []
+    return ContactColumns.from_tuples(
+        ((str(c.get("ID") or ""), c.get("DATE_MODIFY") or "", norm(c.get("TITLE"))) for c in items),
+        ("id", "date_modify", "title"),
+    )
+
+
+def _export_columns(snapshot: ContactColumns, companies_by_id: dict[str, str]) -> ContactColumns:
+    """Столбцы снимка -> EXPORT_FIELDS, название компании — по COMPANY_ID."""
+    cols = snapshot.columns
+    company = [
+        title or companies_by_id.get(cid, "")
+        for title, cid in zip(cols["company_title"], cols["company_id"])
+    ]
+    return ContactColumns(
+        dict(zip(EXPORT_FIELDS, (
+            list(cols["first_name"]),
+            list(cols["last_name"]),
+            list(cols["phone"]),
+            list(cols["email"]),
+            company,
+        ))),
+        len(snapshot),
+    )
 
-        rows.append((name, last_name, phone, email, company_title))
 
-    return rows
+def _collect_contacts_for_export(
+    but,
+    date_from: str | None,
+    date_to: str | None,
+    company_filter: str | None = None,
+    changes_only: bool = False,
+) -> ContactColumns:
+    """
+    Столбцы (имя, фамилия, телефон, почта, компания) — общая логика для
+    CSV и XLSX экспорта. Контакты за период и компании берутся из
+    инкрементальных снимков на диске (contacts.snapshots): из Bitrix
+    докачиваются только записи, изменённые после прошлого экспорта.
+    changes_only — только эти изменения, а не весь период.
+    """
+    user = getattr(but, "user_id", None)
+    ttl = getattr(settings, "CONTACTS_EXPORT_SNAPSHOT_TTL", 300)
+    snapshot, changes = incremental_columns(
+        "export",
+        cache_key(portal_key(but), user, date_from, date_to),
+        lambda since: _fetch_contacts_snapshot(but, date_from, date_to, since),
+        ttl,
+        force=changes_only,
+    )
+    companies, _ = incremental_columns(
+        "companies",
+        cache_key(portal_key(but), user),
+        lambda since: _fetch_companies_snapshot(but, since),
+        ttl,
+    )
+    companies_by_id = dict(zip(companies.columns["id"], companies.columns["title"]))
+
+    columns = _export_columns(changes if changes_only else snapshot, companies_by_id)
+
+    # фильтр по компании (подстрока, регистр не важен)
+    if company_filter:
+        company_filter_norm = company_filter.lower()
+        columns = columns.filter([
+            bool(title) and company_filter_norm in title.lower()
+            for title in columns.columns["company"]
+        ])
+    return columns
 
 
 def export_contacts_to_csv(
@@ -352,20 +536,23 @@ def export_contacts_to_csv(
     date_from: str | None,
     date_to: str | None,
     company_filter: str | None = None,
+    changes_only: bool = False,
 ) -> str:
     """
     Экспорт контактов в CSV:
     имя,фамилия,номер телефона,почта,компания
     """
-    rows = _collect_contacts_for_export(but, date_from, date_to, company_filter)
+    t0 = time.perf_counter()
+    rows = _collect_contacts_for_export(but, date_from, date_to, company_filter, changes_only)
 
     output = io.StringIO()
     writer = csv.writer(output)
     writer.writerow(["имя", "фамилия", "номер телефона", "почта", "компания"])
 
-    for name, last_name, phone, email, company_title in rows:
-        writer.writerow([name, last_name, phone, email, company_title])
+    writer.writerows(rows.tuples(EXPORT_FIELDS))
 
+    metrics.export_rows.inc(len(rows), format="csv")
+    metrics.export_seconds.inc(time.perf_counter() - t0, format="csv")
     return output.getvalue()
 
 
@@ -374,21 +561,25 @@ def export_contacts_to_xlsx(
     date_from: str | None,
     date_to: str | None,
     company_filter: str | None = None,
+    changes_only: bool = False,
 ) -> bytes:
     """
     Экспорт контактов в XLSX в том же формате:
     имя,фамилия,номер телефона,почта,компания
     """
-    rows = _collect_contacts_for_export(but, date_from, date_to, company_filter)
+    t0 = time.perf_counter()
+    rows = _collect_contacts_for_export(but, date_from, date_to, company_filter, changes_only)
 
     wb = Workbook()
     ws = wb.active
     ws.title = "Contacts"
 
     ws.append(["имя", "фамилия", "номер телефона", "почта", "компания"])
-    for row in rows:
+    for row in rows.tuples(EXPORT_FIELDS):
         ws.append(list(row))
 
     buf = io.BytesIO()
     wb.save(buf)
+    metrics.export_rows.inc(len(rows), format="xlsx")
+    metrics.export_seconds.inc(time.perf_counter() - t0, format="xlsx")
     return buf.getvalue()
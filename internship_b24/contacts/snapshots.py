@@ -0,0 +1,238 @@
+"""
+Дисковый кэш столбцов контактов (формат contacts.columnar).
+
+Сюда попадают разобранные файлы импорта (ключ — sha256 содержимого: тот же
+файл повторно не разбирается) и снимки экспорта (ключ — портал,
+пользователь и период). Файлы читаются через mmap.
+
+Снимки экспорта инкрементальные (incremental_columns): рядом со столбцами
+лежит <kind>-<key>.json с отметкой — максимальным DATE_MODIFY из уже
+загруженного. Следующий экспорт запрашивает только записи, изменённые с
+отметки, и сливает их со снимком по ID, поэтому его стоимость зависит от
+числа изменений, а не от размера таблицы. Удалённые в Bitrix записи так не
+видны: раз в CONTACTS_EXPORT_FULL_REFRESH снимок скачивается заново.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from django.conf import settings
+
+from internship_b24 import metrics
+from internship_b24.contacts.columnar import ContactColumns
+
+_READ_SIZE = 1024 * 1024
+# файлы больше блока хэшируются по блокам параллельно (file_digest)
+_HASH_BLOCK = 32 * 1024 * 1024
+
+
+def _cache_dir() -> str:
+    return getattr(settings, "CONTACTS_CACHE_DIR", None) or os.path.join(
+        tempfile.gettempdir(), "b24_contacts_cache"
+    )
+
+
+def cache_key(*parts: Any) -> str:
+    raw = json.dumps(parts, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _block_digest(path: str, start: int, end: int) -> bytes:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        f.seek(start)
+        left = end - start
+        while left > 0 and (chunk := f.read(min(_READ_SIZE, left))):
+            digest.update(chunk)
+            left -= len(chunk)
+    return digest.digest()
+
+
+def file_digest(path: str) -> str:
+    """
+    sha256 содержимого. Большие файлы хэшируются блоками по _HASH_BLOCK
+    в потоках (hashlib отпускает GIL), итог — sha256 от хэшей блоков.
+    """
+    size = os.path.getsize(path)
+    if size <= _HASH_BLOCK:
+        return _block_digest(path, 0, size).hex()
+    starts = range(0, size, _HASH_BLOCK)
+    with ThreadPoolExecutor(max_workers=min(len(starts), os.cpu_count() or 1)) as pool:
+        blocks = pool.map(lambda start: _block_digest(path, start, min(start + _HASH_BLOCK, size)), starts)
+        return hashlib.sha256(b"".join(blocks) + str(size).encode()).hexdigest()
+
+
+def _full_refresh() -> float:
+    return getattr(settings, "CONTACTS_EXPORT_FULL_REFRESH", 7 * 24 * 3600)
+
+
+def _retention(name: str, names: set) -> float:
+    """
+    Сколько хранить файл кэша: снимки экспорта (.cols с .json-отметкой) —
+    до следующей полной перезагрузки, остальное (разобранные файлы импорта
+    с персональными данными) — не дольше CONTACTS_PARSE_CACHE_TTL.
+    """
+    base, ext = os.path.splitext(name)
+    if ext == ".json" or f"{base}.json" in names:
+        return _full_refresh()
+    return getattr(settings, "CONTACTS_PARSE_CACHE_TTL", 3600)
+
+
+def _drop_expired(directory: str) -> None:
+    now = time.time()
+    names = set(os.listdir(directory))
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            if now - os.path.getmtime(path) > _retention(name, names):
+                os.remove(path)
+        except OSError:
+            continue
+
+
+def cached_columns(kind: str, key: str, ttl: float, build: Callable[[], ContactColumns]) -> ContactColumns:
+    """
+    Столбцы из файла <kind>-<key>.cols, если он моложе ttl секунд, иначе
+    build() и запись в кэш. Ошибка записи кэша не мешает вернуть результат.
+    """
+    directory = _cache_dir()
+    path = os.path.join(directory, f"{kind}-{key}.cols")
+    try:
+        fresh = time.time() - os.path.getmtime(path) < ttl
+    except OSError:
+        fresh = False
+    if fresh:
+        try:
+            columns = ContactColumns.open(path)
+        except (OSError, ValueError):
+            pass
+        else:
+            metrics.cache_result(f"contacts_{kind}", True)
+            return columns
+    metrics.cache_result(f"contacts_{kind}", False)
+
+    columns = build()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        _drop_expired(directory)
+        columns.save(path)
+    except OSError:
+        pass
+    return columns
+
+
+def invalidate(kind: str, key: str) -> None:
+    for suffix in (".cols", ".json"):
+        try:
+            os.remove(os.path.join(_cache_dir(), f"{kind}-{key}{suffix}"))
+        except OSError:
+            pass
+
+
+# --------- инкрементальные снимки ---------
+
+def _read_snapshot(base: str) -> tuple[ContactColumns, dict] | None:
+    try:
+        with open(base + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+        return ContactColumns.open(base + ".cols"), meta
+    except (OSError, ValueError):
+        return None
+
+
+def _write_snapshot(base: str, columns: ContactColumns, meta: dict) -> None:
+    # сначала столбцы, потом отметка: читатель со старой отметкой и новыми
+    # столбцами лишь перезапросит часть изменений, наоборот — потерял бы их
+    try:
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        _drop_expired(os.path.dirname(base))
+        columns.save(base + ".cols")
+        with open(base + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(base + ".json.tmp", base + ".json")
+    except OSError:
+        pass
+
+
+def _watermark(columns: ContactColumns, previous: str = "") -> str:
+    values = [v for v in columns.columns.get("date_modify", ()) if v]
+    return max([previous, *values]) if values else previous
+
+
+def merge_by_id(base: ContactColumns, delta: ContactColumns) -> ContactColumns:
+    """
+    Строки delta заменяют строки base с тем же id, новые id добавляются.
+    Порядок — по возрастанию числового id, как при выгрузке с order ID ASC.
+    """
+    if not len(delta):
+        return base
+    fields = base.fields
+    cols = {f: list(base.columns[f]) for f in fields}
+    ids = cols["id"]
+    positions = {v: i for i, v in enumerate(ids)}
+
+    def num(v: str) -> int:
+        return int(v) if v.isdigit() else 0
+
+    last = num(ids[-1]) if ids else -1
+    ordered = True
+    for values in delta.tuples(fields):
+        row = dict(zip(fields, values))
+        i = positions.get(row["id"])
+        if i is None:
+            positions[row["id"]] = len(ids)
+            ordered = ordered and num(row["id"]) > last
+            last = max(last, num(row["id"]))
+            for f in fields:
+                cols[f].append(row[f])
+        else:
+            for f in fields:
+                cols[f][i] = row[f]
+
+    if not ordered:
+        order = sorted(range(len(ids)), key=lambda i: num(ids[i]))
+        cols = {f: [col[i] for i in order] for f, col in cols.items()}
+    return ContactColumns(cols, len(ids))
+
+
+def incremental_columns(
+    kind: str,
+    key: str,
+    fetch: Callable[[str | None], ContactColumns],
+    ttl: float,
+    force: bool = False,
+) -> tuple[ContactColumns, ContactColumns | None]:
+    """
+    (снимок, изменения). fetch(since) возвращает столбцы с "id" и
+    "date_modify": всё при since=None, иначе — изменённое начиная с since.
+    Снимок моложе ttl отдаётся без запроса (изменения — None), если не
+    force. Изменения при первой и полной загрузке — весь снимок.
+    """
+    base = os.path.join(_cache_dir(), f"{kind}-{key}")
+    stored = _read_snapshot(base)
+    now = time.time()
+
+    if stored is not None:
+        columns, meta = stored
+        if not force and now - meta.get("updated_at", 0) < ttl:
+            metrics.cache_result(f"contacts_{kind}", True)
+            return columns, None
+    metrics.cache_result(f"contacts_{kind}", False)
+
+    if stored is None or now - meta.get("full_at", 0) > _full_refresh() or not meta.get("watermark"):
+        changes = snapshot = fetch(None)
+        meta = {"full_at": now, "watermark": _watermark(snapshot)}
+    else:
+        changes = fetch(meta["watermark"])
+        snapshot = merge_by_id(columns, changes)
+        meta = {"full_at": meta["full_at"], "watermark": _watermark(changes, meta["watermark"])}
+
+    meta["updated_at"] = now
+    _write_snapshot(base, snapshot, meta)
+    return snapshot, changes
@@ -0,0 +1,206 @@
+"""
+Загрузка больших файлов импорта по частям.
+
+Протокол: init -> put chunk (в любом порядке, можно повторять) -> complete.
+Части пишутся сразу на своё место во временный файл <id><ext>.part, у
+каждой проверяется sha256. Принятые части дописываются строкой в журнал
+<id>.chunks (O_APPEND), поэтому параллельные запросы разных воркеров не
+перетирают друг друга, а прерванная загрузка продолжается с недостающих
+частей (status). После complete файл переименовывается в <id><ext> и
+импорт читает его на месте, без копирования.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+from dataclasses import asdict, dataclass
+
+from django.conf import settings
+
+ALLOWED_EXTENSIONS = (".csv", ".xlsx", ".xlsm")
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+_READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+@dataclass
+class UploadMeta:
+    id: str
+    filename: str
+    size: int
+    chunk_size: int
+    created_at: float
+
+    @property
+    def chunks(self) -> int:
+        return max(1, -(-self.size // self.chunk_size))
+
+    @property
+    def ext(self) -> str:
+        return os.path.splitext(self.filename)[1].lower()
+
+    def chunk_length(self, index: int) -> int:
+        if index == self.chunks - 1:
+            return self.size - index * self.chunk_size
+        return self.chunk_size
+
+
+def _upload_dir() -> str:
+    return getattr(settings, "CONTACTS_UPLOAD_DIR", None) or os.path.join(
+        tempfile.gettempdir(), "b24_uploads"
+    )
+
+
+def _path(upload_id: str, suffix: str) -> str:
+    # id — только hex uuid, чтобы из него нельзя было собрать чужой путь
+    if not upload_id or len(upload_id) != 32 or any(ch not in "0123456789abcdef" for ch in upload_id):
+        raise UploadError("Некорректный идентификатор загрузки")
+    return os.path.join(_upload_dir(), upload_id + suffix)
+
+
+def _drop_expired(directory: str) -> None:
+    ttl = getattr(settings, "CONTACTS_UPLOAD_TTL", 24 * 3600)
+    now = time.time()
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if now - os.path.getmtime(path) > ttl:
+                os.remove(path)
+        except OSError:
+            continue
+
+
+def init_upload(filename: str, size: int, chunk_size: int | None = None) -> UploadMeta:
+    filename = os.path.basename(filename or "")
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        raise UploadError("Поддерживаются только CSV и XLSX")
+    max_size = getattr(settings, "CONTACTS_UPLOAD_MAX_SIZE", 2 * 1024 ** 3)
+    if size <= 0 or size > max_size:
+        raise UploadError(f"Размер файла должен быть от 1 байта до {max_size} байт")
+    max_chunk = getattr(settings, "CONTACTS_UPLOAD_MAX_CHUNK", 8 * 1024 * 1024)
+    chunk_size = min(max(int(chunk_size or DEFAULT_CHUNK_SIZE), 64 * 1024), max_chunk)
+
+    directory = _upload_dir()
+    os.makedirs(directory, exist_ok=True)
+    _drop_expired(directory)
+
+    meta = UploadMeta(uuid.uuid4().hex, filename, size, chunk_size, time.time())
+    with open(_path(meta.id, ext + ".part"), "wb") as f:
+        f.truncate(size)
+    open(_path(meta.id, ".chunks"), "w").close()
+    with open(_path(meta.id, ".json"), "w", encoding="utf-8") as f:
+        json.dump(asdict(meta), f)
+    return meta
+
+
+def get_meta(upload_id: str) -> UploadMeta:
+    try:
+        with open(_path(upload_id, ".json"), encoding="utf-8") as f:
+            return UploadMeta(**json.load(f))
+    except FileNotFoundError:
+        raise UploadError("Загрузка не найдена или устарела")
+
+
+def received_chunks(upload_id: str) -> set[int]:
+    try:
+        with open(_path(upload_id, ".chunks"), encoding="utf-8") as f:
+            return {int(line.split()[0]) for line in f if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def put_chunk(upload_id: str, index: int, stream, sha256: str) -> None:
+    """
+    Пишет часть index из stream (file-like, например request) на её место.
+    Часть засчитывается, только если совпали длина и sha256.
+    """
+    meta = get_meta(upload_id)
+    if not 0 <= index < meta.chunks:
+        raise UploadError(f"Номер части вне диапазона 0..{meta.chunks - 1}")
+    expected = meta.chunk_length(index)
+    part = _path(upload_id, meta.ext + ".part")
+    if not os.path.exists(part):
+        raise UploadError("Загрузка уже завершена")
+
+    digest = hashlib.sha256()
+    written = 0
+    with open(part, "r+b") as f:
+        f.seek(index * meta.chunk_size)
+        while written <= expected:
+            data = stream.read(min(_READ_SIZE, expected + 1 - written))
+            if not data:
+                break
+            if written + len(data) > expected:
+                raise UploadError(f"Часть {index} длиннее {expected} байт")
+            f.write(data)
+            digest.update(data)
+            written += len(data)
+    if written != expected:
+        raise UploadError(f"Часть {index}: получено {written} байт из {expected}")
+    if digest.hexdigest() != (sha256 or "").lower():
+        raise UploadError(f"Часть {index}: контрольная сумма не совпала")
+
+    # одна короткая строка с O_APPEND — атомарная дозапись
+    fd = os.open(_path(upload_id, ".chunks"), os.O_WRONLY | os.O_APPEND)
+    try:
+        os.write(fd, f"{index} {digest.hexdigest()}\n".encode())
+    finally:
+        os.close(fd)
+
+
+def upload_status(upload_id: str) -> dict:
+    meta = get_meta(upload_id)
+    received = received_chunks(upload_id)
+    missing = [i for i in range(meta.chunks) if i not in received]
+    return {
+        "upload_id": meta.id,
+        "filename": meta.filename,
+        "size": meta.size,
+        "chunk_size": meta.chunk_size,
+        "chunks": meta.chunks,
+        "received": len(received),
+        "missing": missing[:1000],
+        "complete": os.path.exists(_path(upload_id, meta.ext)),
+    }
+
+
+def complete_upload(upload_id: str) -> str:
+    """Проверяет, что все части на месте, и возвращает путь к собранному файлу."""
+    meta = get_meta(upload_id)
+    final = _path(upload_id, meta.ext)
+    if os.path.exists(final):
+        return final
+    received = received_chunks(upload_id)
+    missing = meta.chunks - len(received & set(range(meta.chunks)))
+    if missing:
+        raise UploadError(f"Не хватает частей: {missing}")
+    os.replace(_path(upload_id, meta.ext + ".part"), final)
+    return final
+
+
+def assembled_path(upload_id: str) -> str:
+    meta = get_meta(upload_id)
+    final = _path(upload_id, meta.ext)
+    if not os.path.exists(final):
+        raise UploadError("Загрузка ещё не завершена")
+    return final
+
+
+def delete_upload(upload_id: str) -> None:
+    try:
+        meta = get_meta(upload_id)
+    except UploadError:
+        return
+    for suffix in (meta.ext, meta.ext + ".part", ".chunks", ".json"):
+        try:
+            os.remove(_path(upload_id, suffix))
+        except OSError:
+            pass
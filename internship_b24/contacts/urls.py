@@ -6,4 +6,8 @@ app_name = "contacts"
 urlpatterns = [
     path("import/", views.import_view, name="import"),
     path("export/", views.export_view, name="export"),
+    path("upload/", views.upload_init_view, name="upload_init"),
+    path("upload/<str:upload_id>/", views.upload_status_view, name="upload_status"),
+    path("upload/<str:upload_id>/chunk/<int:index>/", views.upload_chunk_view, name="upload_chunk"),
+    path("upload/<str:upload_id>/complete/", views.upload_complete_view, name="upload_complete"),
 ]
@@ -1,9 +1,29 @@
 from django.contrib import messages
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import redirect, render
-
-from integration_utils.bitrix24.bitrix_user_auth.main_auth import main_auth
-
+from django.views.decorators.http import require_GET, require_POST, require_http_methods
+
+from internship_b24.bx_auth import main_auth
+
+from .parallel_parse import parse_path_cached
+from .preview import (
+    delete_plan,
+    get_company_matcher,
+    get_contacts_index,
+    load_plan,
+    preview_import,
+    save_plan,
+)
+from .uploads import (
+    UploadError,
+    assembled_path,
+    complete_upload,
+    delete_upload,
+    get_meta,
+    init_upload,
+    put_chunk,
+    upload_status,
+)
 from .services import (
     parse_uploaded_file,
     import_contacts,
@@ -17,22 +37,138 @@ def manage_view(request):
     return render(request, "contacts/manage.html")
 
 
+_PLANS_SESSION_KEY = "contacts_import_plans"
+_UPLOADS_SESSION_KEY = "contacts_uploads"
+
+
+def _read_import_rows(request) -> tuple[list[dict[str, str]], str]:
+    """
+    Строки из обычной формы (request.FILES) или из файла, собранного
+    по частям (upload_id): его разбираем прямо с диска и затем удаляем.
+    """
+    upload_id = request.POST.get("upload_id")
+    if upload_id:
+        _check_upload_owner(request, upload_id)
+        path = assembled_path(upload_id)
+        file_name = get_meta(upload_id).filename
+        try:
+            rows = parse_path_cached(path, file_name)
+        finally:
+            delete_upload(upload_id)
+        return rows, file_name
+
+    upload = request.FILES.get("file")
+    if not upload:
+        raise ValueError("Файл не прикреплён.")
+    if hasattr(upload, "temporary_file_path"):
+        # большой файл Django уже сохранил на диск — разбираем оттуда
+        return parse_path_cached(upload.temporary_file_path(), upload.name), upload.name
+    return parse_uploaded_file(upload), upload.name
+
+
+def _check_upload_owner(request, upload_id: str) -> None:
+    if upload_id not in request.session.get(_UPLOADS_SESSION_KEY, []):
+        raise UploadError("Загрузка не найдена или устарела")
+
+
+@main_auth(on_cookies=True)
+@require_POST
+def upload_init_view(request):
+    try:
+        meta = init_upload(
+            request.POST.get("filename", ""),
+            int(request.POST.get("size") or 0),
+            int(request.POST.get("chunk_size") or 0) or None,
+        )
+    except (ValueError, UploadError) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    request.session[_UPLOADS_SESSION_KEY] = request.session.get(_UPLOADS_SESSION_KEY, [])[-9:] + [meta.id]
+    return JsonResponse(upload_status(meta.id), status=201)
+
+
+@main_auth(on_cookies=True)
+@require_http_methods(["PUT", "POST"])
+def upload_chunk_view(request, upload_id: str, index: int):
+    """
+    Тело запроса — сырые байты части (application/octet-stream, CSRF-токен
+    в заголовке X-CSRFToken), X-Chunk-Sha256 — её sha256. Тело читаем
+    потоком прямо в файл, а не через request.body.
+    """
+    try:
+        _check_upload_owner(request, upload_id)
+        put_chunk(upload_id, index, request, request.headers.get("X-Chunk-Sha256", ""))
+    except UploadError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse({"index": index, "ok": True})
+
+
+@main_auth(on_cookies=True)
+@require_GET
+def upload_status_view(request, upload_id: str):
+    try:
+        _check_upload_owner(request, upload_id)
+        return JsonResponse(upload_status(upload_id))
+    except UploadError as e:
+        return JsonResponse({"error": str(e)}, status=404)
+
+
+@main_auth(on_cookies=True)
+@require_POST
+def upload_complete_view(request, upload_id: str):
+    try:
+        _check_upload_owner(request, upload_id)
+        complete_upload(upload_id)
+    except UploadError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse(upload_status(upload_id))
+
+
 @main_auth(on_cookies=True)
 def import_view(request):
     if request.method == "POST":
-        upload = request.FILES.get("file")
-        if not upload:
-            messages.error(request, "Файл не прикреплён.")
-            return redirect("internship_b24:contacts:import")
-
         but = request.bitrix_user_token
-        try:
-            rows = parse_uploaded_file(upload)
-        except ValueError as e:
-            messages.error(request, str(e))
-            return redirect("internship_b24:contacts:import")
-
-        stats = import_contacts(but, rows)
+        create_companies = bool(request.POST.get("create_companies"))
+        plan_token = request.POST.get("plan")
+
+        if plan_token:
+            # импорт по файлу плана из предпросмотра, без повторного разбора
+            plans = request.session.get(_PLANS_SESSION_KEY, [])
+            try:
+                if plan_token not in plans:
+                    raise ValueError("План импорта не найден, загрузите файл заново")
+                rows = load_plan(plan_token)
+            except ValueError as e:
+                messages.error(request, str(e))
+                return redirect("internship_b24:contacts:import")
+        else:
+            try:
+                rows, file_name = _read_import_rows(request)
+            except (ValueError, UploadError) as e:
+                messages.error(request, str(e))
+                return redirect("internship_b24:contacts:import")
+
+            if request.POST.get("action") == "preview":
+                preview = preview_import(but, rows, create_companies=create_companies)
+                token = save_plan(rows)
+                request.session[_PLANS_SESSION_KEY] = request.session.get(_PLANS_SESSION_KEY, [])[-4:] + [token]
+                return render(
+                    request,
+                    "contacts/import_preview.html",
+                    {"preview": preview, "plan": token, "file_name": file_name},
+                )
+
+        stats = import_contacts(
+            but,
+            rows,
+            create_companies=create_companies,
+            companies=get_company_matcher(but, take=True),
+            existing_index=get_contacts_index(but, take=True),
+        )
+        if plan_token:
+            delete_plan(plan_token)
+            request.session[_PLANS_SESSION_KEY] = [
+                t for t in request.session.get(_PLANS_SESSION_KEY, []) if t != plan_token
+            ]
 
         messages.success(
             request,
@@ -40,7 +176,8 @@ def import_view(request):
                 "Импорт завершён. "
                 f"Создано: {stats['created']}, "
                 f"дубли: {stats['skipped_duplicates']}, "
-                f"пустые строки: {stats['skipped_empty']}."
+                f"пустые строки: {stats['skipped_empty']}, "
+                f"новых компаний: {stats['created_companies']}."
             ),
         )
         return redirect("internship_b24:contacts:import")
@@ -56,6 +193,8 @@ def export_view(request):
         date_from = (request.POST.get("date_from") or "").strip() or None
         date_to = (request.POST.get("date_to") or "").strip() or None
         company_filter = (request.POST.get("company") or "").strip() or None
+        changes_only = bool(request.POST.get("changes_only"))
+        file_name = "contacts_changes" if changes_only else "contacts"
 
         but = request.bitrix_user_token
 
@@ -65,6 +204,7 @@ def export_view(request):
                 date_from=date_from,
                 date_to=date_to,
                 company_filter=company_filter,
+                changes_only=changes_only,
             )
             response = HttpResponse(
                 data,
@@ -74,7 +214,7 @@ def export_view(request):
                 ),
             )
             response["Content-Disposition"] = (
-                'attachment; filename="contacts.xlsx"'
+                f'attachment; filename="{file_name}.xlsx"'
             )
             return response
 
@@ -84,13 +224,14 @@ def export_view(request):
             date_from=date_from,
             date_to=date_to,
             company_filter=company_filter,
+            changes_only=changes_only,
         )
         response = HttpResponse(
             data,
             content_type="text/csv; charset=utf-8",
         )
         response["Content-Disposition"] = (
-            'attachment; filename="contacts.csv"'
+            f'attachment; filename="{file_name}.csv"'
         )
         return response
 
@@ -0,0 +1,175 @@
+"""
+Постраничный список открытых сделок.
+
+Страница, сортировка и фильтры (стадия, тип, валюта, приоритет)
+переводятся в start/order/filter одного вызова crm.deal.list — Bitrix
+отдаёт ровно 50 строк и total, поэтому страница стоит один запрос при
+любом размере портала. Недавно открытые страницы лежат в кэше
+DEALS_PAGE_TTL секунд, а следующая страница подгружается в фоне, пока
+пользователь смотрит текущую. Страницы кэшируются на пользователя:
+crm.deal.list учитывает его права в CRM. Создание сделки и события
+ONCRMDEAL* сбрасывают кэш страниц всего портала.
+"""
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass, replace
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .jobs import run_in_background
+from .ratelimit import portal_key
+from .services import DEALS_TOP_SELECT, UF_PRIORITY_CODE
+
+PAGE_SIZE = 50
+
+# ?sort= -> поле crm.deal.list
+SORT_FIELDS = {
+    'id': 'ID',
+    'title': 'TITLE',
+    'opportunity': 'OPPORTUNITY',
+    'stage': 'STAGE_ID',
+    'begindate': 'BEGINDATE',
+    'closedate': 'CLOSEDATE',
+    'created': 'DATE_CREATE',
+}
+DEFAULT_SORT = 'created'
+
+# предзагрузки в очереди (ключи) и уже идущие (ключ -> Event); ждать имеет
+# смысл только идущую — поставленная в очередь может и не скоро начаться
+_queued = set()
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class DealsQuery:
+    page: int = 1
+    sort: str = DEFAULT_SORT
+    desc: bool = True
+    stage: str = ''
+    type_id: str = ''
+    currency: str = ''
+    priority: str = ''
+
+    @classmethod
+    def from_params(cls, params) -> 'DealsQuery':
+        """Из GET-параметров; неизвестная сортировка и кривой номер страницы — по умолчанию."""
+        try:
+            page = max(1, int(params.get('page') or 1))
+        except ValueError:
+            page = 1
+        sort = params.get('sort') or DEFAULT_SORT
+        if sort not in SORT_FIELDS:
+            sort = DEFAULT_SORT
+        return cls(
+            page=page,
+            sort=sort,
+            desc=params.get('dir', 'desc') != 'asc',
+            stage=params.get('stage') or '',
+            type_id=params.get('type') or '',
+            currency=params.get('currency') or '',
+            priority=params.get('priority') or '',
+        )
+
+    def rest_params(self) -> dict:
+        direction = 'DESC' if self.desc else 'ASC'
+        flt = {'CLOSED': 'N'}
+        for field, value in (
+            ('STAGE_ID', self.stage),
+            ('TYPE_ID', self.type_id),
+            ('CURRENCY_ID', self.currency),
+            (UF_PRIORITY_CODE, self.priority),
+        ):
+            if value:
+                flt[field] = value
+        order = {SORT_FIELDS[self.sort]: direction}
+        # ID вторым ключом: при равных значениях строки не переезжают между страницами
+        order.setdefault('ID', direction)
+        return {
+            'select': DEALS_TOP_SELECT,
+            'filter': flt,
+            'order': order,
+            'start': (self.page - 1) * PAGE_SIZE,
+        }
+
+    def querystring(self, **changes) -> str:
+        """GET-параметры для ссылок пагинации и сортировки."""
+        q = replace(self, **changes)
+        params = {
+            'page': q.page, 'sort': q.sort, 'dir': 'desc' if q.desc else 'asc',
+            'stage': q.stage, 'type': q.type_id, 'currency': q.currency, 'priority': q.priority,
+        }
+        return urlencode({k: v for k, v in params.items() if v})
+
+
+def _version_key(portal: str) -> str:
+    return f'deals_pages_ver:{portal}'
+
+
+def _page_key(portal: str, user, query: DealsQuery) -> str:
+    version = cache.get(_version_key(portal), 0)
+    digest = hashlib.md5(json.dumps(query.rest_params(), sort_keys=True).encode()).hexdigest()
+    return f'deals_page:{portal}:{user}:{version}:{digest}'
+
+
+def invalidate_pages(portal: str) -> None:
+    """Сделки портала изменились: все закэшированные страницы становятся невидимыми."""
+    cache.set(_version_key(portal), time.time_ns(), None)
+
+
+def _load(but, query: DealsQuery, key: str) -> dict:
+    response = but.call_api_method('crm.deal.list', query.rest_params()) or {}
+    page = {
+        'rows': list(response.get('result') or []),
+        'total': int(response.get('total') or 0),
+    }
+    cache.set(key, page, getattr(settings, 'DEALS_PAGE_TTL', 30))
+    return page
+
+
+def _prefetch(but, query: DealsQuery, key: str) -> None:
+    with _inflight_lock:
+        _queued.discard(key)
+        done = _inflight[key] = threading.Event()
+    try:
+        if cache.get(key) is None:
+            _load(but, query, key)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        done.set()
+
+
+def _schedule_prefetch(but, key: str, query: DealsQuery) -> None:
+    with _inflight_lock:
+        if key in _queued or key in _inflight or cache.get(key) is not None:
+            return
+        _queued.add(key)
+    run_in_background(_prefetch, but, query, key)
+
+
+def get_deals_page(but, query: DealsQuery) -> dict:
+    """
+    Одна страница: {'rows': [...], 'total': N, 'pages': M} (строки без подписей).
+    Промах кэша — один crm.deal.list; после ответа в фоне грузится следующая страница.
+    """
+    portal, user = portal_key(but), getattr(but, 'user_id', None)
+    key = _page_key(portal, user, query)
+    page = cache.get(key)
+    if page is None:
+        # пользователь обогнал идущую предзагрузку: дожидаемся её, а не шлём тот же запрос второй раз
+        with _inflight_lock:
+            pending = _inflight.get(key)
+        if pending is not None and pending.wait(getattr(settings, 'DEALS_PREFETCH_WAIT', 10)):
+            page = cache.get(key)
+    if page is None:
+        page = _load(but, query, key)
+    pages = max(1, -(-page['total'] // PAGE_SIZE))
+    if query.page < pages:
+        following = replace(query, page=query.page + 1)
+        _schedule_prefetch(but, _page_key(portal, user, following), following)
+    return {'rows': page['rows'], 'total': page['total'], 'pages': pages}
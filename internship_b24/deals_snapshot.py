@@ -0,0 +1,243 @@
+"""
+Локальная копия открытых сделок для таблицы «последние сделки».
+
+Копия своя у каждого пользователя портала (portal, user): crm.deal.list
+отдаёт сделки с учётом прав CRM, и общая копия показала бы одному
+пользователю чужие сделки, а полная перезагрузка под другим — удалила бы их.
+
+В таблице OpenDeal лежат все видимые пользователю открытые сделки с уже
+подставленными подписями (DealHumanizer применяется один раз, при
+загрузке), поэтому таблица, её N и фильтры по стадии, типу и приоритету
+считаются в БД без запросов к Bitrix.
+
+Обновление:
+- первый раз и раз в DEALS_SNAPSHOT_FULL_REFRESH — все открытые сделки
+  (заодно пропадают удалённые и подтягиваются новые подписи справочников);
+- копия старше DEALS_SNAPSHOT_TTL или помеченная событием
+  ONCRMDEALADD/UPDATE — только сделки с DATE_MODIFY не раньше отметки:
+  открытые обновляются, закрытые удаляются;
+- событие ONCRMDEALADD/UPDATE помечает копии всех пользователей портала,
+  ONCRMDEALDELETE удаляет сделку из всех копий сразу, без запроса.
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .bx_batch import RestBatch
+from .models import DealSnapshot, OpenDeal
+from .ratelimit import portal_key
+from .services import DEALS_TOP_SELECT, UF_PRIORITY_CODE, DealHumanizer, get_manuals
+
+PAGE_SIZE = 50
+_SELECT = DEALS_TOP_SELECT + ['DATE_MODIFY', 'CLOSED']
+_FIELDS = [
+    'title', 'opportunity', 'currency_id', 'stage_id', 'type_id', 'priority',
+    'begindate', 'closedate', 'date_create', 'date_modify',
+    'type_h', 'stage_h', 'currency_h', 'priority_h',
+]
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'DEALS_SNAPSHOT_TTL', 60))
+
+
+def _full_refresh():
+    return timedelta(seconds=getattr(settings, 'DEALS_SNAPSHOT_FULL_REFRESH', 24 * 3600))
+
+
+def _fetch_deals(but, flt):
+    """Все сделки по фильтру: первая страница обычным вызовом, остальные — batch."""
+    params = {'select': _SELECT, 'filter': flt, 'order': {'ID': 'ASC'}}
+    first = but.call_api_method('crm.deal.list', {**params, 'start': 0}) or {}
+    items = list(first.get('result') or [])
+    total = int(first.get('total') or len(items))
+
+    with RestBatch.for_token(but) as batch:
+        pages = [
+            batch.add('crm.deal.list', {**params, 'start': start})
+            for start in range(PAGE_SIZE, total, PAGE_SIZE)
+        ]
+    for page in pages:
+        items.extend(page.result_or_raise() or [])
+    return items
+
+
+def _text(value):
+    return '' if value is None else str(value)
+
+
+def _scope(but):
+    """(портал, пользователь) — ключ копии."""
+    return portal_key(but), _text(getattr(but, 'user_id', None))
+
+
+def _to_model(scope, raw, humanizer):
+    row = humanizer.row(raw)
+    portal, user = scope
+    return OpenDeal(
+        portal=portal,
+        user=user,
+        deal_id=int(row['ID']),
+        title=_text(row.get('TITLE')),
+        opportunity=_text(row.get('OPPORTUNITY')),
+        currency_id=_text(row.get('CURRENCY_ID')),
+        stage_id=_text(row.get('STAGE_ID')),
+        type_id=_text(row.get('TYPE_ID')),
+        priority=_text(row.get(UF_PRIORITY_CODE)),
+        begindate=_text(row.get('BEGINDATE')),
+        closedate=_text(row.get('CLOSEDATE')),
+        date_create=_text(row.get('DATE_CREATE')),
+        date_modify=_text(row.get('DATE_MODIFY')),
+        type_h=_text(row.get('TYPE_ID_H')),
+        stage_h=_text(row.get('STAGE_ID_H')),
+        currency_h=_text(row.get('CURRENCY_H')),
+        priority_h=_text(row.get('UF_PRIORITY_H')),
+    )
+
+
+def _upsert(deals):
+    OpenDeal.objects.bulk_create(
+        deals,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['portal', 'user', 'deal_id'],
+        update_fields=_FIELDS,
+    )
+
+
+def _watermark(items, previous=''):
+    return max([previous] + [_text(i.get('DATE_MODIFY')) for i in items])
+
+
+def refresh(but, full=False):
+    """Докачивает изменения (или всё при full / первой загрузке). Возвращает число полученных сделок."""
+    scope = _scope(but)
+    portal, user = scope
+    state, _ = DealSnapshot.objects.get_or_create(portal=portal, user=user)
+    snapshot = DealSnapshot.objects.filter(pk=state.pk)
+    deals = OpenDeal.objects.filter(portal=portal, user=user)
+    now = timezone.now()
+    full = full or not state.watermark or state.full_at is None or now - state.full_at > _full_refresh()
+    _, manuals = get_manuals(but, force=full)
+    humanizer = DealHumanizer(manuals)
+
+    # снимаем пометку до запроса: событие, пришедшее во время загрузки, пометит заново
+    snapshot.update(stale=False)
+
+    if full:
+        items = _fetch_deals(but, {'CLOSED': 'N'})
+        fresh = [_to_model(scope, i, humanizer) for i in items]
+        _upsert(fresh)
+        alive = {d.deal_id for d in fresh}
+        gone = [pk for pk, deal_id in deals.values_list('pk', 'deal_id') if deal_id not in alive]
+        for start in range(0, len(gone), 500):
+            OpenDeal.objects.filter(pk__in=gone[start:start + 500]).delete()
+        snapshot.update(
+            watermark=_watermark(items), full_at=now, refreshed_at=now,
+        )
+        return len(items)
+
+    items = _fetch_deals(but, {'>=DATE_MODIFY': state.watermark})
+    _upsert([_to_model(scope, i, humanizer) for i in items if i.get('CLOSED') != 'Y'])
+    closed = [int(i['ID']) for i in items if i.get('CLOSED') == 'Y']
+    if closed:
+        deals.filter(deal_id__in=closed).delete()
+    snapshot.update(
+        watermark=_watermark(items, state.watermark), refreshed_at=now,
+    )
+    return len(items)
+
+
+def ensure_fresh(but, force=False):
+    portal, user = _scope(but)
+    state = DealSnapshot.objects.filter(portal=portal, user=user).first()
+    if (
+        force
+        or state is None
+        or state.stale
+        or state.refreshed_at is None
+        or timezone.now() - state.refreshed_at > _ttl()
+    ):
+        refresh(but)
+
+
+def as_row(deal):
+    """Строка в том же виде, что DealHumanizer.row(crm.deal.list)."""
+    return {
+        'ID': str(deal.deal_id),
+        'TITLE': deal.title,
+        'OPPORTUNITY': deal.opportunity,
+        'CURRENCY_ID': deal.currency_id,
+        'STAGE_ID': deal.stage_id,
+        'TYPE_ID': deal.type_id,
+        'BEGINDATE': deal.begindate,
+        'CLOSEDATE': deal.closedate,
+        'DATE_CREATE': deal.date_create,
+        UF_PRIORITY_CODE: deal.priority,
+        'TYPE_ID_H': deal.type_h,
+        'STAGE_ID_H': deal.stage_h,
+        'CURRENCY_H': deal.currency_h,
+        'UF_PRIORITY_H': deal.priority_h,
+    }
+
+
+def top_deals(but, n=None, stage=None, type_id=None, priority=None, force=False):
+    """Последние n открытых сделок (по DATE_CREATE) с фильтрами — из локальной копии."""
+    ensure_fresh(but, force)
+    n = n or getattr(settings, 'DEALS_TOP_N', 10)
+    portal, user = _scope(but)
+    qs = OpenDeal.objects.filter(portal=portal, user=user)
+    if stage:
+        qs = qs.filter(stage_id=stage)
+    if type_id:
+        qs = qs.filter(type_id=type_id)
+    if priority:
+        qs = qs.filter(priority=priority)
+    return [as_row(d) for d in qs.order_by('-date_create', '-deal_id')[:n]]
+
+
+def remember_new_deal(but, deal_id, fields, manuals):
+    """
+    Кладёт только что созданную сделку в локальную копию, чтобы таблица
+    после редиректа не ходила в Bitrix. Строка собирается из отправленных
+    полей: crm.deal.get после add не нужен. Отметку DATE_MODIFY не двигаем —
+    следующая докачка всё равно перечитает сделку целиком.
+    """
+    scope = _scope(but)
+    portal, user = scope
+    state = DealSnapshot.objects.filter(portal=portal, user=user).first()
+    if state is None:
+        return
+    now = _portal_now(state.watermark)
+    raw = {k: v for k, v in fields.items() if k in DEALS_TOP_SELECT}
+    raw.update({
+        'ID': deal_id,
+        'DATE_CREATE': now,
+        'DATE_MODIFY': now,
+        # стадию не передаём — Bitrix ставит первую стадию воронки
+        'STAGE_ID': fields.get('STAGE_ID') or next(iter(manuals.get('STAGE_ID', {})), ''),
+    })
+    _upsert([_to_model(scope, raw, DealHumanizer(manuals))])
+
+
+def _portal_now(sample):
+    """
+    Текущее время со смещением портала (берём его из отметки DATE_MODIFY):
+    даты сравниваются строками, и смещение должно совпадать.
+    """
+    try:
+        tz = datetime.fromisoformat(sample).tzinfo
+    except ValueError:
+        tz = None
+    return datetime.now(tz).astimezone(tz).isoformat(timespec='seconds')
+
+
+def apply_deal_event(event):
+    """ONCRMDEALDELETE — удалить сделку из копий портала; ADD/UPDATE — пометить их к докачке."""
+    if not event.domain:
+        return
+    if event.name == 'ONCRMDEALDELETE' and event.entity_id:
+        OpenDeal.objects.filter(portal=event.domain, deal_id=event.entity_id).delete()
+    elif event.name in ('ONCRMDEALADD', 'ONCRMDEALUPDATE'):
+        DealSnapshot.objects.filter(portal=event.domain).update(stale=True)
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
-import time
 from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, List, Optional
 
+from internship_b24.bx_batch import BATCH_LIMIT, RestBatch
+from internship_b24.ratelimit import get_rate_limiter, portal_key
+
 
 def b24_call(request, method: str, params=None):
     """
@@ -37,6 +39,10 @@ def fetch_active_users(request) -> List[Dict[str, Any]]:
 def fetch_departments(request) -> Dict[int, Dict[str, Any]]:
     """Карта департаментов: dept_id -> {ID, NAME, UF_HEAD, PARENT}."""
     dept_list = b24_call(request, "department.get", {})
+    return parse_departments(dept_list)
+
+
+def parse_departments(dept_list) -> Dict[int, Dict[str, Any]]:
     depts: Dict[int, Dict[str, Any]] = {}
 
     for d in dept_list or []:
@@ -89,31 +95,94 @@ def build_manager_chain(
     return chain
 
 
-def count_outbound_calls_24h(request, user_id: int) -> int:
-    """
-    Количество звонков за последние 24 часа
-    по заданным критериям (см. FILTER ниже).
-    """
+def outbound_calls_24h_params(user_id: int) -> Dict[str, Any]:
     to_dt = datetime.now(timezone.utc)
     from_dt = to_dt - timedelta(hours=24)
 
-    res = b24_call(request, "voximplant.statistic.get", {
+    return {
         "FILTER": {
             "PORTAL_USER_ID": int(user_id),
             "CALL_TYPE": "1",
             ">CALL_DURATION": 60,
             ">CALL_START_DATE": from_dt.strftime("%Y-%m-%dT%H:%M:%S%z"),
         }
-    })
+    }
+
+
+def count_outbound_calls_24h(request, user_id: int) -> int:
+    """
+    Количество звонков за последние 24 часа
+    по заданным критериям (см. FILTER ниже).
+    """
+    res = b24_call(request, "voximplant.statistic.get", outbound_calls_24h_params(user_id))
 
     items = res if isinstance(res, list) else (res.get("result", []) if isinstance(res, dict) else [])
     return len(items)
 
 
-def generate_test_calls(request, user_ids: List[int], per_user: int = 3) -> None:
+def build_employee_rows(
+    users: List[Dict[str, Any]],
+    depts: Dict[int, Dict[str, Any]],
+    calls_by_uid: Dict[int, int],
+) -> List[Dict[str, Any]]:
+    """Строки таблицы сотрудников, отсортированные по отделу и имени."""
+    users_by_id = {int(u["ID"]): u for u in users}
+
+    rows = []
+    for u in users:
+        uid = int(u["ID"])
+
+        # Отдел
+        dept_ids = u.get("UF_DEPARTMENT") or []
+        dept_name = ""
+        if dept_ids:
+            try:
+                d = depts.get(int(dept_ids[0]))
+            except (TypeError, ValueError):
+                d = None
+            if d:
+                dept_name = d.get("NAME", "") or ""
+
+        # Должность (в Bitrix обычно поле POSITION)
+        position = (u.get("WORK_POSITION") or u.get("POSITION") or "").strip()
+
+        rows.append({
+            "id": uid,
+            "name": f'{u.get("NAME", "")} {u.get("LAST_NAME", "")}'.strip(),
+            "email": u.get("EMAIL"),
+            "department": dept_name,
+            "position": position,
+            "managers": build_manager_chain(u, depts, users_by_id),
+            "calls_24h": calls_by_uid.get(uid, 0),
+        })
+
+    rows.sort(
+        key=lambda r: (
+            (r["department"] or "ЯЯЯ").lower(),
+            r["name"].lower()
+        )
+    )
+    return rows
+
+
+def collect_employee_rows(request) -> List[Dict[str, Any]]:
+    """Синхронная выборка для employees_list_view."""
+    users = fetch_active_users(request)
+    depts = fetch_departments(request)
+
+    calls_by_uid = {
+        int(u["ID"]): count_outbound_calls_24h(request, int(u["ID"]))
+        for u in users
+    }
+    return build_employee_rows(users, depts, calls_by_uid)
+
+
+def generate_test_calls(but, user_ids: List[int], per_user: int = 3, job=None) -> int:
     """
     Генерирует per_user тестовых звонков для каждого пользователя.
-    Параметры и пауза подобраны под текущую рабочую конфигурацию.
+    Пары register -> finish уходят batch-ами (до 25 пар за запрос),
+    темп задаёт общий лимитер портала. Прогресс пишется в job (если передан).
+    Возвращает число отправленных пар.
     """
     from random import randint
 
@@ -121,11 +190,25 @@ def generate_test_calls(request, user_ids: List[int], per_user: int = 3) -> None
 
     # дефолтная линия (если нужна порталу)
     try:
-        cfg = b24_call(request, "telephony.config.get", {})
+        cfg = but.call_api_method(api_method="telephony.config.get", params={})
     except Exception:
         cfg = {}
+    cfg = (cfg or {}).get("result", cfg) if isinstance(cfg, dict) else {}
     default_line = (cfg or {}).get("DEFAULT_LINE")
 
+    # register -> finish связываем через $result, пара уходит в один batch
+    batch = RestBatch.for_token(but, limiter=get_rate_limiter(portal_key(but)))
+    pairs_per_batch = BATCH_LIMIT // 2
+    sent = 0
+
+    def flush():
+        nonlocal sent
+        pairs = len(batch) // 2
+        batch.flush()
+        sent += pairs
+        if job is not None:
+            job.advance(pairs)
+
     for uid in user_ids:
         for _ in range(max(0, per_user)):
             start_dt = now - timedelta(minutes=randint(0, 23 * 60))
@@ -142,22 +225,9 @@ def generate_test_calls(request, user_ids: List[int], per_user: int = 3) -> None
             if default_line:
                 reg_payload["LINE_NUMBER"] = default_line
 
-            reg = b24_call(request, "telephony.externalCall.register", reg_payload)
-
-            if isinstance(reg, dict):
-                call_id = (
-                    reg.get("CALL_ID")
-                    or (isinstance(reg.get("result"), dict) and reg["result"].get("CALL_ID"))
-                    or reg.get("ID")
-                )
-            else:
-                call_id = reg
-
-            if not call_id:
-                continue
-
-            b24_call(request, "telephony.externalCall.finish", {
-                "CALL_ID": call_id,
+            reg = batch.add("telephony.externalCall.register", reg_payload)
+            batch.add("telephony.externalCall.finish", {
+                "CALL_ID": reg.ref("CALL_ID"),
                 "USER_ID": int(uid),
                 "DURATION": duration,
                 "STATUS_CODE": 200,
@@ -165,4 +235,8 @@ def generate_test_calls(request, user_ids: List[int], per_user: int = 3) -> None
                 "RECORD_URL": "",
             })
 
-            time.sleep(0.5)
+            if len(batch) >= pairs_per_batch * 2:
+                flush()
+
+    flush()
+    return sent
@@ -1,9 +1,16 @@
 from django.urls import path
-from .views import employees_list_view, generate_calls_view
+from .views import (
+    employees_list_view,
+    employees_list_async_view,
+    generate_calls_view,
+    generate_calls_status_view,
+)
 
 app_name = "employees"
 
 urlpatterns = [
     path("", employees_list_view, name="list"),
+    path("async/", employees_list_async_view, name="list_async"),
     path("generate-calls/", generate_calls_view, name="generate_calls"),
+    path("generate-calls/<str:job_id>/", generate_calls_status_view, name="generate_calls_status"),
 ]
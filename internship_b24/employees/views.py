@@ -1,66 +1,61 @@
-from django.shortcuts import render, redirect
+import asyncio
+
+from asgiref.sync import sync_to_async
 from django.contrib import messages
+from django.http import JsonResponse
+from django.shortcuts import render, redirect
+from django.urls import reverse
 
-from integration_utils.bitrix24.bitrix_user_auth.main_auth import main_auth
+from internship_b24.bx_auth import main_auth
+from internship_b24.aio import AsyncBitrixClient, async_main_auth
+from internship_b24.jobs import get_job, submit_job
 from .services import (
     fetch_active_users,
-    fetch_departments,
-    build_manager_chain,
-    count_outbound_calls_24h,
+    parse_departments,
+    build_employee_rows,
+    collect_employee_rows,
+    outbound_calls_24h_params,
     generate_test_calls,
 )
 
 
 @main_auth(on_cookies=True)
 def employees_list_view(request):
-    users = fetch_active_users(request)
-    depts = fetch_departments(request)
-    users_by_id = {int(u["ID"]): u for u in users}
-
-    rows = []
-    for u in users:
-        uid = int(u["ID"])
-
-        # Отдел
-        dept_ids = u.get("UF_DEPARTMENT") or []
-        dept_name = ""
-        if dept_ids:
-            try:
-                d = depts.get(int(dept_ids[0]))
-            except (TypeError, ValueError):
-                d = None
-            if d:
-                dept_name = d.get("NAME", "") or ""
-
-        # Должность (в Bitrix обычно поле POSITION)
-        position = (u.get("WORK_POSITION") or u.get("POSITION") or "").strip()
-
-        manager_chain = build_manager_chain(u, depts, users_by_id)
-        calls = count_outbound_calls_24h(request, uid)
-
-        rows.append({
-            "id": uid,
-            "name": f'{u.get("NAME", "")} {u.get("LAST_NAME", "")}'.strip(),
-            "email": u.get("EMAIL"),
-            "department": dept_name,
-            "position": position,
-            "managers": manager_chain,
-            "calls_24h": calls,
-        })
-
-    rows.sort(
-        key=lambda r: (
-            (r["department"] or "ЯЯЯ").lower(),
-            r["name"].lower()
-        )
+    rows = collect_employee_rows(request)
+    return render(request, "employees/list.html", {"rows": rows})
+
+
+@async_main_auth(on_cookies=True)
+async def employees_list_async_view(request):
+    """
+    Async-вариант: пользователи и отделы грузятся одновременно,
+    счётчики звонков — конкурентно (с ограничением параллелизма клиента).
+    """
+    client = AsyncBitrixClient(request.bitrix_user_token)
+
+    users, dept_list = await asyncio.gather(
+        client.call_list("user.get", {"ACTIVE": "Y"}),
+        client.call_list("department.get", {}),
     )
+    depts = parse_departments(dept_list)
 
-    return render(request, "employees/list.html", {"rows": rows})
+    user_ids = [int(u["ID"]) for u in users]
+    counts = await asyncio.gather(*(
+        client.call_list("voximplant.statistic.get", outbound_calls_24h_params(uid))
+        for uid in user_ids
+    ))
+    calls_by_uid = {uid: len(items) for uid, items in zip(user_ids, counts)}
 
+    rows = build_employee_rows(users, depts, calls_by_uid)
+    return await sync_to_async(render)(request, "employees/list.html", {"rows": rows})
 
 
 @main_auth(on_cookies=True)
 def generate_calls_view(request):
+    """
+    Запускает генерацию звонков фоновой задачей и сразу отвечает
+    её ID и прогрессом; статус — в generate_calls_status_view.
+    """
     if request.method != "POST":
         return redirect("internship_b24:employees:list")
 
@@ -71,12 +66,30 @@ def generate_calls_view(request):
 
     per_user = max(0, per_user)
 
+    but = request.bitrix_user_token
     users = fetch_active_users(request)
     user_ids = [int(u["ID"]) for u in users]
-    generate_test_calls(request, user_ids, per_user=per_user)
+
+    job = submit_job(
+        "generate_calls",
+        lambda job: generate_test_calls(but, user_ids, per_user=per_user, job=job),
+        total=len(user_ids) * per_user,
+    )
+
+    status_url = reverse("internship_b24:employees:generate_calls_status", args=[job.id])
+    if request.headers.get("x-requested-with") == "XMLHttpRequest":
+        return JsonResponse({**job.as_dict(), "status_url": status_url}, status=202)
 
     messages.success(
         request,
-        f"Сгенерированы тестовые звонки: по {per_user} шт. на пользователя."
+        f"Генерация звонков запущена: по {per_user} шт. на пользователя (задача {job.id})."
     )
     return redirect("internship_b24:employees:list")
+
+
+@main_auth(on_cookies=True)
+def generate_calls_status_view(request, job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        return JsonResponse({"error": "job not found"}, status=404)
+    return JsonResponse(job.as_dict())
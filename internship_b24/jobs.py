@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+JOB_TTL = 24 * 3600
+# кэш, общий для воркеров: задачу запускает один процесс, а статус может спросить другой
+JOB_CACHE = "shared"
+
+_executor: Optional[ThreadPoolExecutor] = None
+# мелкая фоновая работа (run_in_background) — отдельно, чтобы не стоять за долгими задачами
+_light_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+@dataclass
+class Job:
+    """
+    Фоновая задача. Состояние хранится в общем кэше (CACHES["shared"]),
+    поэтому прогресс виден из любого воркера.
+    """
+    id: str
+    kind: str
+    status: str = "queued"  # queued / running / done / failed
+    done: int = 0
+    total: int = 0
+    error: str = ""
+    result: Any = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def save(self) -> None:
+        _cache().set(_cache_key(self.id), asdict(self), JOB_TTL)
+
+    def advance(self, n: int = 1) -> None:
+        self.done += n
+        self.save()
+
+    @property
+    def progress(self) -> float:
+        return round(self.done / self.total, 4) if self.total else 0.0
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        data["progress"] = self.progress
+        return data
+
+
+def _cache():
+    return caches[JOB_CACHE] if JOB_CACHE in settings.CACHES else caches["default"]
+
+
+def _cache_key(job_id: str) -> str:
+    return f"internship_b24:job:{job_id}"
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "BACKGROUND_JOB_WORKERS", 2),
+                thread_name_prefix="b24-job",
+            )
+        return _executor
+
+
+def _get_light_executor() -> ThreadPoolExecutor:
+    global _light_executor
+    with _executor_lock:
+        if _light_executor is None:
+            _light_executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "BACKGROUND_LIGHT_WORKERS", 2),
+                thread_name_prefix="b24-bg",
+            )
+        return _light_executor
+
+
+def get_job(job_id: str) -> Optional[Job]:
+    data = _cache().get(_cache_key(job_id))
+    return Job(**data) if data else None
+
+
+def submit_job(kind: str, fn: Callable[[Job], Any], total: int = 0) -> Job:
+    """
+    Запускает fn(job) в фоне и сразу возвращает job.
+    fn сам двигает прогресс через job.advance().
+    """
+    job = Job(id=uuid.uuid4().hex, kind=kind, total=total)
+    job.save()
+
+    def run():
+        job.status = "running"
+        job.save()
+        try:
+            job.result = fn(job)
+            job.status = "done"
+        except Exception as e:
+            logger.exception("background job %s (%s) failed", job.id, kind)
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            job.save()
+            connections.close_all()
+
+    _get_executor().submit(run)
+    return job
+
+
+def run_in_background(fn: Callable[..., Any], *args: Any) -> None:
+    """
+    Выполняет fn(*args) в фоне без Job: для мелкой работы (предзагрузка),
+    прогресс и результат которой никому не нужны. Пул свой
+    (BACKGROUND_LIGHT_WORKERS), задачи submit_job его не занимают.
+    """
+
+    def run():
+        try:
+            fn(*args)
+        except Exception:
+            logger.exception("background task %s failed", getattr(fn, "__name__", fn))
+        finally:
+            connections.close_all()
+
+    _get_light_executor().submit(run)
@@ -0,0 +1,111 @@
+import json
+import platform
+import subprocess
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from internship_b24.benchmarks import SCENARIOS, BenchOptions, isolated_environment, run_scenario
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарки горячих путей на симулированном портале Bitrix24: "
+        "время, число REST-запросов, пиковая память. Результат — JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "scenarios", nargs="*",
+            help=f"Сценарии (по умолчанию все): {', '.join(SCENARIOS)}",
+        )
+        parser.add_argument("--sizes", help="Размеры через запятую вместо стандартных")
+        parser.add_argument("--max-size", type=int, help="Пропустить размеры больше указанного")
+        parser.add_argument("--latency", type=float, default=0.0, help="Задержка на REST-запрос, с")
+        parser.add_argument("--no-memory", action="store_true", help="Не замерять пиковую память")
+        parser.add_argument("--workdir", help="Каталог для сгенерированных файлов")
+        parser.add_argument("--output", "-o", help="Куда записать JSON с результатами")
+        parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+        parser.add_argument("--list", action="store_true", help="Показать сценарии и выйти")
+
+    def handle(self, *args, **opts):
+        if opts["list"]:
+            for sc in SCENARIOS.values():
+                sizes = ", ".join(str(s) for s in sc.sizes)
+                self.stdout.write(f"{sc.name:<16} [{sizes}]  {sc.description}")
+            return
+
+        names = opts["scenarios"] or list(SCENARIOS)
+        unknown = [n for n in names if n not in SCENARIOS]
+        if unknown:
+            raise CommandError(f"Неизвестные сценарии: {', '.join(unknown)}")
+
+        bench_opts = BenchOptions(latency=opts["latency"])
+        if opts["workdir"]:
+            bench_opts.workdir = opts["workdir"]
+
+        custom_sizes = [int(s) for s in opts["sizes"].split(",")] if opts["sizes"] else None
+
+        results = []
+        with isolated_environment():
+            for name in names:
+                sc = SCENARIOS[name]
+                for size in custom_sizes or sc.sizes:
+                    if opts["max_size"] and size > opts["max_size"]:
+                        continue
+                    self.stdout.write(f"{name} [{size}] ...", ending="")
+                    self.stdout.flush()
+                    res = run_scenario(sc, size, bench_opts, memory=not opts["no_memory"])
+                    results.append(res)
+                    self.stdout.write(" " + self._summary(res))
+
+        report = {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "latency": bench_opts.latency,
+            "results": results,
+        }
+
+        if opts["output"]:
+            with open(opts["output"], "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Результаты: {opts['output']}"))
+
+        if opts["compare"]:
+            self._compare(opts["compare"], results)
+
+    def _summary(self, res):
+        parts = [f"{res['wall_s']:.3f}s"]
+        if "rest_requests" in res:
+            parts.append(f"rest={res['rest_requests']}")
+        if "peak_mem_mb" in res:
+            parts.append(f"mem={res['peak_mem_mb']}MB")
+        if "rps" in res:
+            parts.append(f"rps={res['rps']}")
+        return " ".join(parts)
+
+    def _compare(self, path, results):
+        with open(path, encoding="utf-8") as f:
+            previous = {(r["scenario"], r["size"]): r for r in json.load(f)["results"]}
+
+        self.stdout.write(f"\nСравнение с {path}:")
+        for res in results:
+            old = previous.get((res["scenario"], res["size"]))
+            if not old:
+                continue
+            line = f"  {res['scenario']} [{res['size']}]:"
+            for key in ("wall_s", "rest_requests", "peak_mem_mb"):
+                if key in res and old.get(key):
+                    delta = (res[key] - old[key]) / old[key] * 100
+                    line += f" {key} {old[key]} -> {res[key]} ({delta:+.1f}%)"
+            self.stdout.write(line)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
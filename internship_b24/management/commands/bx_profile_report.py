@@ -0,0 +1,105 @@
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return values[idx]
+
+
+class Command(BaseCommand):
+    help = (
+        "Сводка по REST-вызовам Bitrix24 в разрезе вьюх из лога профилировщика "
+        "(BITRIX_PROFILER_LOG). Подсвечивает методы, которые вызываются много раз за запрос."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--log", help="Путь к JSONL-логу (по умолчанию BITRIX_PROFILER_LOG)")
+        parser.add_argument("--view", help="Только указанная вьюха (view_name)")
+        parser.add_argument(
+            "--repeats", type=int, default=5,
+            help="Порог «N+1»: метод вызван больше N раз за запрос",
+        )
+        parser.add_argument("--json", action="store_true", help="Вывести сводку в JSON")
+
+    def handle(self, *args, **opts):
+        path = opts["log"] or getattr(settings, "BITRIX_PROFILER_LOG", None)
+        if not path:
+            raise CommandError("Не задан путь к логу: --log или BITRIX_PROFILER_LOG")
+
+        views = defaultdict(lambda: {"requests": 0, "wall": [], "rest_ms": [], "calls": [], "methods": defaultdict(list)})
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    if opts["view"] and rec.get("view") != opts["view"]:
+                        continue
+                    v = views[rec.get("view") or rec.get("path")]
+                    v["requests"] += 1
+                    v["wall"].append(rec.get("wall_ms", 0))
+                    v["rest_ms"].append(rec.get("rest_ms", 0))
+                    v["calls"].append(len(rec.get("calls", [])))
+
+                    per_method = defaultdict(lambda: [0, 0.0, 0])
+                    for c in rec.get("calls", []):
+                        m = per_method[c["method"]]
+                        m[0] += 1
+                        m[1] += c.get("latency_ms", 0)
+                        m[2] += c.get("pages", 1)
+                    for method, (count, ms, pages) in per_method.items():
+                        v["methods"][method].append((count, ms, pages))
+        except FileNotFoundError:
+            raise CommandError(f"Лог не найден: {path}")
+
+        report = []
+        for name, v in sorted(views.items(), key=lambda kv: -sum(kv[1]["wall"])):
+            n = v["requests"]
+            methods = []
+            for method, samples in v["methods"].items():
+                counts = [s[0] for s in samples]
+                methods.append({
+                    "method": method,
+                    "calls_per_request": round(sum(counts) / n, 1),
+                    "max_calls": max(counts),
+                    "ms_per_request": round(sum(s[1] for s in samples) / n, 1),
+                    "pages_per_request": round(sum(s[2] for s in samples) / n, 1),
+                    "n_plus_one": max(counts) > opts["repeats"],
+                })
+            methods.sort(key=lambda m: -m["ms_per_request"])
+            report.append({
+                "view": name,
+                "requests": n,
+                "wall_ms_avg": round(sum(v["wall"]) / n, 1),
+                "wall_ms_p95": _percentile(v["wall"], 0.95),
+                "rest_ms_avg": round(sum(v["rest_ms"]) / n, 1),
+                "rest_calls_avg": round(sum(v["calls"]) / n, 1),
+                "methods": methods,
+            })
+
+        if opts["json"]:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+
+        for r in report:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{r['view']}: {r['requests']} запр., "
+                f"avg {r['wall_ms_avg']} мс (p95 {r['wall_ms_p95']}), "
+                f"REST {r['rest_calls_avg']} выз. / {r['rest_ms_avg']} мс"
+            ))
+            for m in r["methods"]:
+                line = (
+                    f"  {m['method']:<36} {m['calls_per_request']:>7} выз./запр. "
+                    f"{m['pages_per_request']:>7} стр. {m['ms_per_request']:>9} мс"
+                )
+                if m["n_plus_one"]:
+                    line = self.style.WARNING(line + f"  N+1? (до {m['max_calls']} за запрос)")
+                self.stdout.write(line)
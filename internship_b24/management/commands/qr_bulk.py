@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from internship_b24.qr.bulk import FORMATS, BulkQRError, collect_products, create_links, stream_labels
+
+
+class Command(BaseCommand):
+    help = (
+        "Создаёт QR-ссылки для списка товаров или раздела каталога и пишет "
+        "лист этикеток (PDF) или архив PNG (ZIP)."
+    )
+
+    def add_arguments(self, parser):
+        src = parser.add_mutually_exclusive_group(required=True)
+        src.add_argument("--ids", help="ID товаров через запятую")
+        src.add_argument("--section", type=int, help="ID раздела каталога")
+        parser.add_argument("--format", choices=FORMATS, default="pdf")
+        parser.add_argument(
+            "--base-url", required=True,
+            help="Адрес сайта для публичных ссылок, например https://example.com",
+        )
+        parser.add_argument("-o", "--output", required=True, help="Файл результата")
+        parser.add_argument("--workers", type=int, default=None, help="Процессов отрисовки (QR_BULK_WORKERS)")
+
+    def handle(self, *args, **opts):
+        try:
+            ids = [int(x) for x in opts["ids"].split(",") if x.strip()] if opts["ids"] else None
+        except ValueError:
+            raise CommandError("--ids: нужны числа через запятую")
+        try:
+            products = collect_products(ids, opts["section"])
+        except BulkQRError as e:
+            raise CommandError(str(e))
+        if not products:
+            raise CommandError("Товары не найдены в Битрикс24")
+
+        links = create_links(products, created_by="manage.py qr_bulk")
+        base = opts["base_url"].rstrip("/")
+
+        def url_for(pl):
+            return base + reverse("internship_b24:qr_public:product_public", args=[str(pl.pk)])
+
+        with open(opts["output"], "wb") as f:
+            for chunk in stream_labels(opts["format"], links, url_for, opts["workers"]):
+                f.write(chunk)
+        self.stdout.write(f"Ссылок: {len(links)}, файл: {opts['output']}")
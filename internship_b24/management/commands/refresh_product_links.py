@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from internship_b24.qr.bulk import BulkQRError
+from internship_b24.qr.refresh import refresh_links
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверяет сохранённые данные QR-ссылок (название, цена, картинка, описание) с Bitrix24 "
+        "и проставляет refreshed_at. Запускайте по расписанию чаще PRODUCT_LINK_FRESH_TTL, "
+        "например раз в 5 минут с --older-than 300."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than", type=int, default=None, metavar="SECONDS",
+            help="Только товары, ссылки которых не обновлялись дольше SECONDS секунд",
+        )
+
+    def handle(self, *args, **opts):
+        older_than = timedelta(seconds=opts["older_than"]) if opts["older_than"] is not None else None
+        try:
+            stats = refresh_links(older_than)
+        except BulkQRError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            f"Товаров: {stats['products']} (нет в Bitrix: {stats['missing']}), "
+            f"ссылок обновлено: {stats['links']}, из них с изменениями: {stats['changed']}"
+        )
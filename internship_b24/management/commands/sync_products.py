@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from internship_b24.qr.catalog import CatalogSyncError, sync_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Синхронизирует локальный каталог товаров (автокомплит QR-формы) с Bitrix24: "
+        "по умолчанию только товары, изменённые с последней синхронизации. "
+        "Запускайте по расписанию (cron), например раз в 5 минут, и --full раз в сутки."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full", action="store_true",
+            help="Скачать весь каталог и удалить товары, которых в Bitrix больше нет",
+        )
+
+    def handle(self, *args, **opts):
+        try:
+            stats = sync_catalog(full=opts["full"])
+        except CatalogSyncError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            f"{'Полная' if stats['full'] else 'Инкрементальная'} синхронизация: "
+            f"получено {stats['fetched']}, записано {stats['upserted']}, удалено {stats['deleted']}"
+        )
@@ -5,4 +5,5 @@ app_name = "map"
 
 urlpatterns = [
     path("", views.companies_map_view, name="companies_map"),
+    path("async/", views.companies_map_async_view, name="companies_map_async"),
 ]
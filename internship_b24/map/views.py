@@ -1,9 +1,12 @@
+import asyncio
 import json
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.shortcuts import render
 
-from integration_utils.bitrix24.bitrix_user_auth.main_auth import main_auth
+from internship_b24.bx_auth import main_auth
+from internship_b24.aio import AsyncBitrixClient, async_main_auth
 
 
 def b24_call(request, method: str, params=None):
@@ -22,48 +25,36 @@ def b24_call(request, method: str, params=None):
     return but.call_api_method(api_method=method, params=params)
 
 
-@main_auth(on_cookies=True)
-def companies_map_view(request):
-    """
-    Страница с картой компаний.
+COMPANIES_PARAMS = {
+    "filter": {"ACTIVE": "Y"},
+    "select": ["ID", "TITLE"],
+    "order": {"ID": "ASC"},
+}
+
+ADDRESSES_PARAMS = {
+    "select": [
+        "ENTITY_ID",
+        "ADDRESS_1",
+        "CITY",
+        "REGION",
+        "COUNTRY",
+    ],
+    # Можно отфильтровать только компании:
+    # "filter": {"ENTITY_TYPE_ID": 4},
+}
+
+
+def _unwrap(resp):
+    if isinstance(resp, dict):
+        return resp.get("result", [])
+    return resp or []
 
-    1) Берём активные компании (ID, TITLE).
-    2) Берём адреса из crm.address.list.
-    3) Склеиваем по ENTITY_ID → получаем список компаний с адресами.
-    4) Отдаём на фронт, там уже geocode через Yandex JS API.
-    """
 
-    # 1. Компании
-    companies_resp = b24_call(request, "crm.company.list", {
-        "filter": {"ACTIVE": "Y"},
-        "select": ["ID", "TITLE"],
-        "order": {"ID": "ASC"},
-    })
-
-    if isinstance(companies_resp, dict):
-        companies_raw = companies_resp.get("result", [])
-    else:
-        companies_raw = companies_resp or []
-
-    # 2. Адреса
-    addresses_resp = b24_call(request, "crm.address.list", {
-        "select": [
-            "ENTITY_ID",
-            "ADDRESS_1",
-            "CITY",
-            "REGION",
-            "COUNTRY",
-        ],
-        # Можно отфильтровать только компании:
-        # "filter": {"ENTITY_TYPE_ID": 4},
-    })
-
-    if isinstance(addresses_resp, dict):
-        addresses_raw = addresses_resp.get("result", [])
-    else:
-        addresses_raw = addresses_resp or []
-
-    # 3. Собираем словарь: company_id -> строка адреса
+def build_map_context(companies_raw, addresses_raw) -> dict:
+    """
+    Склеиваем компании и адреса по ENTITY_ID → контекст шаблона карты.
+    """
+    # Собираем словарь: company_id -> строка адреса
     address_by_company_id = {}
 
     for a in addresses_raw:
@@ -86,7 +77,7 @@ def companies_map_view(request):
         if addr:
             address_by_company_id[cid] = addr
 
-    # 4. Формируем итоговый список компаний с адресом
+    # Формируем итоговый список компаний с адресом
     companies = []
     for c in companies_raw:
         if not isinstance(c, dict):
@@ -108,9 +99,42 @@ def companies_map_view(request):
             "address": addr,
         })
 
-    context = {
+    return {
         "companies_json": json.dumps(companies, ensure_ascii=False),
         "yandex_api_key": getattr(settings, "YANDEX_API_KEY", ""),
         "has_companies": bool(companies),
     }
+
+
+def collect_map_context(request) -> dict:
+    companies_raw = _unwrap(b24_call(request, "crm.company.list", COMPANIES_PARAMS))
+    addresses_raw = _unwrap(b24_call(request, "crm.address.list", ADDRESSES_PARAMS))
+    return build_map_context(companies_raw, addresses_raw)
+
+
+@main_auth(on_cookies=True)
+def companies_map_view(request):
+    """
+    Страница с картой компаний.
+
+    1) Берём активные компании (ID, TITLE).
+    2) Берём адреса из crm.address.list.
+    3) Склеиваем по ENTITY_ID → получаем список компаний с адресами.
+    4) Отдаём на фронт, там уже geocode через Yandex JS API.
+    """
+    context = collect_map_context(request)
     return render(request, "map/map.html", context)
+
+
+@async_main_auth(on_cookies=True)
+async def companies_map_async_view(request):
+    """Async-вариант: компании и адреса грузятся одновременно."""
+    client = AsyncBitrixClient(request.bitrix_user_token)
+
+    companies_raw, addresses_raw = await asyncio.gather(
+        client.call_list("crm.company.list", COMPANIES_PARAMS),
+        client.call_list("crm.address.list", ADDRESSES_PARAMS),
+    )
+
+    context = build_map_context(companies_raw, addresses_raw)
+    return await sync_to_async(render)(request, "map/map.html", context)
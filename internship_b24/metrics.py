@@ -0,0 +1,387 @@
+"""
+Метрики в формате Prometheus без внешних зависимостей.
+
+Значения копятся в памяти процесса под одним lock-ом. Для gunicorn с
+несколькими воркерами задайте METRICS_MULTIPROC_DIR: фоновый поток каждого
+процесса раз в METRICS_FLUSH_INTERVAL секунд (и при выходе) сбрасывает его
+снимок в <dir>/metrics_<pid>.json, а /metrics суммирует снимки.
+
+Счётчики и гистограммы завершившегося воркера (max_requests, падение) не
+пропадают: его снимок прибавляется к <dir>/metrics_dead.json, иначе сумма
+уменьшилась бы и Prometheus принял бы это за сброс счётчика. Значения
+остальных видов (gauge) умершего воркера отбрасываются. Слияние и чтение
+снимков идут под файловой блокировкой <dir>/metrics.lock.
+
+/metrics отдаётся только с заголовком Authorization: Bearer <METRICS_TOKEN>;
+пока токен не задан, эндпоинт отвечает 403.
+"""
+from __future__ import annotations
+
+import atexit
+import fcntl
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_registry: Dict[str, "_Metric"] = {}
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        with _lock:
+            _registry[name] = self
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+        _maybe_flush()
+
+    def snapshot(self) -> dict:
+        return {"|".join(k): v for k, v in self.values.items()}
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [счётчики по бакетам..., +Inf, sum]
+        self.values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with _lock:
+            data = self.values.get(key)
+            if data is None:
+                data = self.values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+                    break
+            else:
+                data[len(self.buckets)] += 1
+            data[-1] += value
+        _maybe_flush()
+
+    def snapshot(self) -> dict:
+        return {"|".join(k): list(v) for k, v in self.values.items()}
+
+
+# --------- метрики приложения ---------
+
+view_latency = Histogram(
+    "b24_view_duration_seconds", "Время обработки запроса по имени URL", ["view", "method"],
+)
+view_requests = Counter(
+    "b24_view_requests_total", "Запросы по имени URL и коду ответа", ["view", "status"],
+)
+rest_calls = Counter(
+    "b24_rest_calls_total", "REST-вызовы Bitrix24 по методу и результату", ["method", "outcome"],
+)
+rest_latency = Histogram(
+    "b24_rest_call_duration_seconds", "Длительность REST-вызовов Bitrix24", ["method"],
+)
+import_batch_size = Histogram(
+    "b24_import_batch_size", "Команд в batch при импорте контактов", [],
+    buckets=(1, 5, 10, 25, 40, 50),
+)
+import_rows = Counter(
+    "b24_import_rows_total", "Обработанные строки импорта контактов", ["outcome"],
+)
+import_seconds = Counter(
+    "b24_import_seconds_total", "Суммарное время импорта контактов, с", [],
+)
+export_rows = Counter(
+    "b24_export_rows_total", "Выгруженные строки экспорта контактов", ["format"],
+)
+export_seconds = Counter(
+    "b24_export_seconds_total", "Суммарное время экспорта контактов, с", ["format"],
+)
+cache_requests = Counter(
+    "b24_cache_requests_total", "Обращения к кэшам приложения", ["cache", "result"],
+)
+auth_latency = Histogram(
+    "b24_auth_duration_seconds", "Время авторизации запроса (main_auth) по источнику", ["source"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+token_refreshes = Counter(
+    "b24_token_refresh_total", "Обновления токенов Bitrix24: выполнено или взято у соседнего запроса", ["outcome"],
+)
+qr_public_hits = Counter(
+    "b24_qr_public_hits_total", "Открытия публичной страницы товара по QR", ["source"],
+)
+
+
+def cache_result(cache: str, hit: bool) -> None:
+    cache_requests.inc(cache=cache, result="hit" if hit else "miss")
+
+
+# --------- мультипроцессный режим ---------
+
+# виды метрик, значения которых копятся и после смерти процесса
+_CUMULATIVE = ("counter", "histogram")
+_DEAD = "metrics_dead.json"
+
+_flusher: Optional[threading.Thread] = None
+_flusher_pid: Optional[int] = None
+# снимок процесса уже перенесён в metrics_dead.json — больше не пишем
+_retired = threading.Event()
+
+
+def _multiproc_dir() -> Optional[str]:
+    return getattr(settings, "METRICS_MULTIPROC_DIR", None)
+
+
+def _interval() -> float:
+    return getattr(settings, "METRICS_FLUSH_INTERVAL", 5)
+
+
+def _maybe_flush() -> None:
+    """Первое обновление метрики в процессе запускает его фоновый сброс снимков."""
+    global _flusher, _flusher_pid
+    if not _multiproc_dir():
+        return
+    # после fork поток родителя в дочернем процессе не работает — заводим свой
+    if _flusher is not None and _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher is not None and _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+        _flusher = threading.Thread(target=_run_flusher, name="metrics-flusher", daemon=True)
+        _flusher.start()
+
+
+def _run_flusher() -> None:
+    while True:
+        time.sleep(_interval())
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def flush() -> None:
+    """Сбрасывает снимок метрик процесса в METRICS_MULTIPROC_DIR."""
+    directory = _multiproc_dir()
+    if not directory or _retired.is_set():
+        return
+    with _lock:
+        data = {name: m.snapshot() for name, m in _registry.items()}
+    os.makedirs(directory, exist_ok=True)
+    _write_json(_snapshot_path(os.getpid()), data)
+
+
+def _write_json(path: str, data: dict) -> None:
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+def _read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(_multiproc_dir(), f"metrics_{pid}.json")
+
+
+class _DirLock:
+    """Исключительная flock-блокировка каталога снимков (между процессами)."""
+
+    def __enter__(self):
+        os.makedirs(_multiproc_dir(), exist_ok=True)
+        self._f = open(os.path.join(_multiproc_dir(), "metrics.lock"), "a")
+        fcntl.flock(self._f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._f, fcntl.LOCK_UN)
+        self._f.close()
+
+
+def _merge(merged: Dict[str, dict], data: dict, only_cumulative: bool = False) -> None:
+    for name, values in data.items():
+        if only_cumulative:
+            metric = _registry.get(name)
+            if metric is None or metric.kind not in _CUMULATIVE:
+                continue
+        target = merged.setdefault(name, {})
+        for key, value in values.items():
+            if isinstance(value, list):
+                acc = target.setdefault(key, [0.0] * len(value))
+                for i, v in enumerate(value):
+                    acc[i] += v
+            else:
+                target[key] = target.get(key, 0.0) + value
+
+
+def _retire(path: str) -> None:
+    """Снимок завершившегося процесса -> в metrics_dead.json. Вызывать под _DirLock."""
+    data = _read_json(path)
+    if data:
+        dead_path = os.path.join(_multiproc_dir(), _DEAD)
+        dead = _read_json(dead_path) or {}
+        _merge(dead, data, only_cumulative=True)
+        _write_json(dead_path, dead)
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _retire_own_snapshot() -> None:
+    """Воркер завершается: последний снимок — в накопленные значения умерших."""
+    if not _multiproc_dir():
+        return
+    try:
+        flush()
+        with _DirLock():
+            _retired.set()
+            _retire(_snapshot_path(os.getpid()))
+    except OSError:
+        pass
+
+
+atexit.register(_retire_own_snapshot)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _collect() -> Dict[str, dict]:
+    """Снимки всех процессов (или только текущего), просуммированные."""
+    directory = _multiproc_dir()
+    if not directory:
+        with _lock:
+            return {name: m.snapshot() for name, m in _registry.items()}
+
+    flush()
+    merged: Dict[str, dict] = {}
+    with _DirLock():
+        for path in glob.glob(os.path.join(directory, "metrics_*.json")):
+            pid = os.path.basename(path)[len("metrics_"):-len(".json")]
+            if pid.isdigit() and not _pid_alive(int(pid)):
+                # воркер убит без atexit (SIGKILL, OOM): его счётчики — к умершим
+                _retire(path)
+        for path in glob.glob(os.path.join(directory, "metrics_*.json")):
+            data = _read_json(path)
+            if data:
+                _merge(merged, data)
+    return merged
+
+
+# --------- экспозиция ---------
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render_text() -> str:
+    data = _collect()
+    lines: List[str] = []
+    for name, metric in sorted(_registry.items()):
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for key, value in sorted(data.get(name, {}).items()):
+            label_values = key.split("|") if metric.labelnames else []
+            if isinstance(metric, Histogram):
+                cumulative = 0.0
+                for bound, count in zip(metric.buckets, value):
+                    cumulative += count
+                    le = _labels(metric.labelnames, label_values, 'le="%s"' % bound)
+                    lines.append(f"{name}_bucket{le} {cumulative}")
+                cumulative += value[len(metric.buckets)]
+                le = _labels(metric.labelnames, label_values, 'le="+Inf"')
+                lines.append(f"{name}_bucket{le} {cumulative}")
+                lines.append(f"{name}_sum{_labels(metric.labelnames, label_values)} {value[-1]}")
+                lines.append(f"{name}_count{_labels(metric.labelnames, label_values)} {cumulative}")
+            else:
+                lines.append(f"{name}{_labels(metric.labelnames, label_values)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    # без METRICS_TOKEN эндпоинт закрыт: метрики не должны быть публичными по умолчанию
+    token = getattr(settings, "METRICS_TOKEN", "")
+    supplied = request.headers.get("Authorization", "")
+    if not token or not hmac.compare_digest(supplied, f"Bearer {token}"):
+        return HttpResponseForbidden()
+    return HttpResponse(render_text(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class MetricsMiddleware:
+    """Латентность и коды ответов по имени URL."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        t0 = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, "resolver_match", None)
+        view = (match.view_name if match else "") or "<unresolved>"
+        if view != "internship_b24:metrics":
+            view_latency.observe(time.perf_counter() - t0, view=view, method=request.method)
+            view_requests.inc(view=view, status=response.status_code)
+        return response
+
+
+def _on_rest_call(call) -> None:
+    rest_calls.inc(method=call.method, outcome="ok" if call.ok else "error")
+    rest_latency.observe(call.latency_ms / 1000, method=call.method)
+
+
+def install() -> None:
+    """Вызывается из AppConfig.ready(): подписка на REST-вызовы из profiling."""
+    if not getattr(settings, "METRICS_ENABLED", False):
+        return
+    from . import profiling
+
+    profiling.add_call_listener(_on_rest_call)
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('internship_b24', '0002_productlink_currency_cached_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogProduct',
+            fields=[
+                ('product_id', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(blank=True, max_length=512)),
+                ('price', models.CharField(blank=True, max_length=64)),
+                ('currency', models.CharField(blank=True, max_length=16)),
+                ('date_modify', models.CharField(blank=True, db_index=True, max_length=32)),
+                ('synced_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+            options={
+                'ordering': ['-product_id'],
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('internship_b24', '0003_catalogproduct'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productlink',
+            name='refreshed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
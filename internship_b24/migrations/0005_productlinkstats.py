@@ -0,0 +1,28 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('internship_b24', '0004_productlink_refreshed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductLinkStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True)),
+                ('scans', models.PositiveIntegerField(default=0)),
+                ('link', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='internship_b24.productlink')),
+            ],
+            options={
+                'ordering': ['-day', '-scans'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='productlinkstats',
+            constraint=models.UniqueConstraint(fields=('link', 'day'), name='productlinkstats_link_day'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('internship_b24', '0006_dealsnapshot_opendeal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('watermark', models.CharField(blank=True, max_length=32)),
+                ('full_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,70 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # копия сделок — кэш: таблицы пересоздаются с пользователем в ключе,
+    # при первом открытии таблицы копия загрузится заново
+
+    dependencies = [
+        ('internship_b24', '0007_catalogsyncstate'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='OpenDeal',
+        ),
+        migrations.DeleteModel(
+            name='DealSnapshot',
+        ),
+        migrations.CreateModel(
+            name='DealSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('portal', models.CharField(max_length=255)),
+                ('user', models.CharField(blank=True, max_length=64)),
+                ('watermark', models.CharField(blank=True, max_length=32)),
+                ('full_at', models.DateTimeField(blank=True, null=True)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+                ('stale', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OpenDeal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('portal', models.CharField(max_length=255)),
+                ('user', models.CharField(blank=True, max_length=64)),
+                ('deal_id', models.PositiveIntegerField()),
+                ('title', models.CharField(blank=True, max_length=512)),
+                ('opportunity', models.CharField(blank=True, max_length=32)),
+                ('currency_id', models.CharField(blank=True, max_length=16)),
+                ('stage_id', models.CharField(blank=True, max_length=64)),
+                ('type_id', models.CharField(blank=True, max_length=64)),
+                ('priority', models.CharField(blank=True, max_length=64)),
+                ('begindate', models.CharField(blank=True, max_length=32)),
+                ('closedate', models.CharField(blank=True, max_length=32)),
+                ('date_create', models.CharField(blank=True, max_length=32)),
+                ('date_modify', models.CharField(blank=True, max_length=32)),
+                ('type_h', models.CharField(blank=True, max_length=255)),
+                ('stage_h', models.CharField(blank=True, max_length=255)),
+                ('currency_h', models.CharField(blank=True, max_length=255)),
+                ('priority_h', models.CharField(blank=True, max_length=255)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dealsnapshot',
+            constraint=models.UniqueConstraint(fields=('portal', 'user'), name='dealsnapshot_portal_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='opendeal',
+            constraint=models.UniqueConstraint(fields=('portal', 'user', 'deal_id'), name='opendeal_portal_user_deal'),
+        ),
+        migrations.AddIndex(
+            model_name='opendeal',
+            index=models.Index(fields=['portal', 'user', '-date_create', '-deal_id'], name='opendeal_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='opendeal',
+            index=models.Index(fields=['portal', 'deal_id'], name='opendeal_portal_deal_id'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+from django.db import models
+
+# Модели QR живут в подпакете; импорт здесь регистрирует их при загрузке
+# приложения (миграции, админка), а не при первом импорте вьюх.
+from internship_b24.qr.models import CatalogProduct, CatalogSyncState, ProductLink, ProductLinkStats  # noqa: F401
+
+
+class DealSnapshot(models.Model):
+    """
+    Состояние локальной копии открытых сделок (см. deals_snapshot.py).
+    Копия своя у каждого пользователя портала: crm.deal.list отдаёт только
+    сделки, которые ему видны по правам CRM.
+    """
+    portal = models.CharField(max_length=255)
+    # BitrixUserToken.user_id; пусто — токен без пользователя
+    user = models.CharField(max_length=64, blank=True)
+
+    # максимальный DATE_MODIFY из уже загруженного: с него докачиваются изменения
+    watermark = models.CharField(max_length=32, blank=True)
+    full_at = models.DateTimeField(null=True, blank=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+    # пришло событие ONCRMDEALADD/UPDATE — при следующем открытии докачать
+    stale = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["portal", "user"], name="dealsnapshot_portal_user"),
+        ]
+
+    def __str__(self):
+        return f"{self.portal}/{self.user}: {self.watermark}"
+
+
+class OpenDeal(models.Model):
+    """Открытая сделка из копии пользователя с уже подставленными подписями справочников."""
+    portal = models.CharField(max_length=255)
+    user = models.CharField(max_length=64, blank=True)
+    deal_id = models.PositiveIntegerField()
+
+    title = models.CharField(max_length=512, blank=True)
+    opportunity = models.CharField(max_length=32, blank=True)
+    currency_id = models.CharField(max_length=16, blank=True)
+    stage_id = models.CharField(max_length=64, blank=True)
+    type_id = models.CharField(max_length=64, blank=True)
+    priority = models.CharField(max_length=64, blank=True)
+    begindate = models.CharField(max_length=32, blank=True)
+    closedate = models.CharField(max_length=32, blank=True)
+    # даты Bitrix как есть (ISO с одним смещением портала) — сортируются строкой
+    date_create = models.CharField(max_length=32, blank=True)
+    date_modify = models.CharField(max_length=32, blank=True)
+
+    type_h = models.CharField(max_length=255, blank=True)
+    stage_h = models.CharField(max_length=255, blank=True)
+    currency_h = models.CharField(max_length=255, blank=True)
+    priority_h = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["portal", "user", "deal_id"], name="opendeal_portal_user_deal"),
+        ]
+        indexes = [
+            models.Index(fields=["portal", "user", "-date_create", "-deal_id"], name="opendeal_user_created"),
+            # события ONCRMDEALDELETE удаляют сделку из копий всех пользователей
+            models.Index(fields=["portal", "deal_id"], name="opendeal_portal_deal_id"),
+        ]
+
+    def __str__(self):
+        return f"{self.portal}/{self.user} #{self.deal_id}: {self.title}"
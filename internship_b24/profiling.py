@@ -0,0 +1,291 @@
+"""
+Профилирование REST-вызовов Bitrix24 в рамках одного HTTP-запроса.
+
+RestProfilerMiddleware заводит RequestProfile на запрос; обёртки над
+call_list_method / call_api_method / _bx24_call / AsyncBitrixClient.call
+складывают в него каждый REST-вызов. Итог уходит в заголовок Server-Timing,
+в оверлей base.html (context processor) и, если задан BITRIX_PROFILER_LOG,
+в JSONL-лог для `manage.py bx_profile_report`.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 50
+
+
+@dataclass
+class RestCall:
+    method: str
+    params_hash: str
+    latency_ms: float
+    pages: int = 1
+    bytes: int = 0
+    ok: bool = True
+
+
+@dataclass
+class RequestProfile:
+    path: str
+    view: str = ""
+    started: float = field(default_factory=time.perf_counter)
+    wall_ms: float = 0.0
+    calls: List[RestCall] = field(default_factory=list)
+
+    @property
+    def rest_ms(self) -> float:
+        return round(sum(c.latency_ms for c in self.calls), 1)
+
+    @property
+    def total_pages(self) -> int:
+        return sum(c.pages for c in self.calls)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(c.bytes for c in self.calls)
+
+    def by_method(self) -> List[Dict[str, Any]]:
+        """Агрегат по методам: повторяющиеся вызовы (N+1) сразу видны."""
+        agg: Dict[str, Dict[str, Any]] = {}
+        for c in self.calls:
+            a = agg.setdefault(c.method, {"method": c.method, "count": 0, "ms": 0.0, "pages": 0, "bytes": 0})
+            a["count"] += 1
+            a["ms"] += c.latency_ms
+            a["pages"] += c.pages
+            a["bytes"] += c.bytes
+        for a in agg.values():
+            a["ms"] = round(a["ms"], 1)
+        return sorted(agg.values(), key=lambda a: -a["ms"])
+
+    def as_dict(self) -> dict:
+        return {
+            "path": self.path,
+            "view": self.view,
+            "wall_ms": self.wall_ms,
+            "rest_ms": self.rest_ms,
+            "calls": [asdict(c) for c in self.calls],
+        }
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("bx_request_profile", default=None)
+# вложенный вызов (call_list_method -> call_api_method) учитываем как страницу внешнего
+_outer: ContextVar[Optional[RestCall]] = ContextVar("bx_outer_call", default=None)
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current.get()
+
+
+def _params_hash(params: Any) -> str:
+    try:
+        raw = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    except (TypeError, ValueError):
+        raw = repr(params)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:10]
+
+
+def _size(result: Any) -> int:
+    try:
+        return len(json.dumps(result, ensure_ascii=False, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _pages(result: Any) -> int:
+    if isinstance(result, list):
+        return max(1, -(-len(result) // PAGE_SIZE))
+    return 1
+
+
+class _Tracker:
+    """
+    Общая логика замера одного вызова (sync и async).
+    Работает, если есть активный профиль запроса или слушатели (метрики).
+    """
+
+    def __init__(self, method: str, params: Any):
+        self.profile = _current.get()
+        self.parent = _outer.get()
+        self.call = RestCall(
+            method=method,
+            params_hash=_params_hash(params) if self.profile is not None else "",
+            latency_ms=0.0,
+            pages=0,
+        )
+        self._token = _outer.set(self.call) if self.parent is None else None
+        self._t0 = time.perf_counter()
+
+    def finish(self, result: Any, ok: bool) -> None:
+        if self.parent is not None:
+            # вложенный вызов: страница внешнего
+            self.parent.pages += 1
+            if self.profile is not None and ok:
+                self.parent.bytes += _size(result)
+            return
+        _outer.reset(self._token)
+        self.call.latency_ms = round((time.perf_counter() - self._t0) * 1000, 1)
+        self.call.ok = ok
+        if not self.call.pages:
+            self.call.pages = _pages(result)
+        if self.profile is not None:
+            if not self.call.bytes and ok:
+                self.call.bytes = _size(result)
+            self.profile.calls.append(self.call)
+        _notify(self.call)
+
+
+def _active() -> bool:
+    return _current.get() is not None or bool(_listeners)
+
+
+# слушатели завершённых вызовов (например, метрики)
+_listeners: List[Callable[[RestCall], None]] = []
+
+
+def add_call_listener(fn: Callable[[RestCall], None]) -> None:
+    _listeners.append(fn)
+
+
+def _notify(call: RestCall) -> None:
+    for fn in _listeners:
+        try:
+            fn(call)
+        except Exception:
+            logger.exception("REST call listener failed")
+
+
+def profile_rest_call(method_arg: int = 0, params_arg: int = 1):
+    """
+    Декоратор для функций вида f(method, params, ...):
+    method/params берутся из позиционных аргументов по индексам.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _active():
+                return fn(*args, **kwargs)
+            method = args[method_arg] if len(args) > method_arg else kwargs.get("api_method") or kwargs.get("method")
+            params = args[params_arg] if len(args) > params_arg else (kwargs.get("params") or kwargs.get("fields"))
+            tracker = _Tracker(str(method), params)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                tracker.finish(None, ok=False)
+                raise
+            tracker.finish(result, ok=result is not None)
+            return result
+        return wrapper
+    return decorator
+
+
+def profile_rest_call_async(fn):
+    """То же для async-методов вида self.call(method, params)."""
+    @wraps(fn)
+    async def wrapper(self, method, params=None, *args, **kwargs):
+        if not _active():
+            return await fn(self, method, params, *args, **kwargs)
+        tracker = _Tracker(method, params)
+        try:
+            result = await fn(self, method, params, *args, **kwargs)
+        except Exception:
+            tracker.finish(None, ok=False)
+            raise
+        tracker.finish(result, ok=True)
+        return result
+    return wrapper
+
+
+def instrument_token_class(cls) -> None:
+    """Оборачивает call_list_method / call_api_method класса токена (один раз)."""
+    if getattr(cls, "_bx_profiled", False):
+        return
+    # self — позиция 0, метод — 1, параметры — 2
+    for name in ("call_list_method", "call_api_method"):
+        original = getattr(cls, name, None)
+        if original is not None:
+            setattr(cls, name, profile_rest_call(method_arg=1, params_arg=2)(original))
+    cls._bx_profiled = True
+
+
+def install() -> None:
+    """Вызывается из AppConfig.ready()."""
+    if not (getattr(settings, "BITRIX_PROFILER", False) or getattr(settings, "METRICS_ENABLED", False)):
+        return
+    try:
+        from integration_utils.bitrix24.models import BitrixUserToken
+    except ImportError:
+        logger.warning("BitrixUserToken not found, REST profiling of user tokens is disabled")
+    else:
+        instrument_token_class(BitrixUserToken)
+
+
+# --------- Server-Timing, оверлей, лог ---------
+
+def server_timing(profile: RequestProfile) -> str:
+    parts = [
+        f'app;dur={profile.wall_ms}',
+        f'bx;dur={profile.rest_ms};desc="{len(profile.calls)} REST, {profile.total_pages} pages"',
+    ]
+    for i, m in enumerate(profile.by_method()[:10]):
+        parts.append(f'bx{i};dur={m["ms"]};desc="{m["method"]} x{m["count"]}"')
+    return ", ".join(parts)
+
+
+_log_lock = threading.Lock()
+
+
+def _write_log(profile: RequestProfile) -> None:
+    path = getattr(settings, "BITRIX_PROFILER_LOG", None)
+    if not path:
+        return
+    line = json.dumps(profile.as_dict(), ensure_ascii=False)
+    try:
+        with _log_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError:
+        logger.warning("cannot write REST profile log to %s", path)
+
+
+class RestProfilerMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, "BITRIX_PROFILER", False)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        profile = RequestProfile(path=request.path)
+        request.bx_profile = profile
+        token = _current.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        match = getattr(request, "resolver_match", None)
+        profile.view = (match.view_name if match else "") or request.path
+        profile.wall_ms = round((time.perf_counter() - profile.started) * 1000, 1)
+
+        response["Server-Timing"] = server_timing(profile)
+        _write_log(profile)
+        return response
+
+
+def rest_profile(request):
+    """Context processor: профиль для оверлея в base.html."""
+    if not getattr(settings, "BITRIX_PROFILER_OVERLAY", False):
+        return {}
+    return {"bx_profile": getattr(request, "bx_profile", None)}
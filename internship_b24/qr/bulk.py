@@ -0,0 +1,406 @@
+"""
+Массовая генерация QR-ссылок: раздел каталога или список ID товаров.
+
+1. Товары забираются batch-ами: по ID — crm.product.list с фильтром
+   ID = [до 50 ID] на команду, по разделу — постранично (fetch_product_list);
+   картинки — catalog.productImage.list по команде на товар, тоже batch.
+2. ProductLink создаются одним bulk_create.
+3. QR рисуются (qr/render.py) в пуле процессов (QR_BULK_WORKERS, один на
+   воркер, spawn) и сразу уходят в ответ: ZIP с PNG и links.csv или
+   PDF-лист этикеток A4. Если клиент оборвал загрузку, ещё не начатые
+   задачи пула отменяются.
+
+PDF пишется своим кодом: QR — векторные прямоугольники, подпись (название,
+ID, цена) — картинкой, нарисованной TrueType-шрифтом с кириллицей
+(QR_LABEL_FONT). Если такого шрифта нет, подпись пишется стандартным
+Helvetica без встраивания — в нём нет кириллицы, поэтому тогда на этикетке
+только ID и цена; названия — в links.csv из ZIP.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import zlib
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence
+
+from django.conf import settings
+from django.utils import timezone
+
+from internship_b24.bx_batch import RestBatch
+from internship_b24.qr import catalog
+from internship_b24.qr.models import ProductLink
+from internship_b24.qr.render import CAPTION_SCALE, render_pdf_label, render_png
+from internship_b24.qr.services import ProductInfo, product_info
+
+logger = logging.getLogger(__name__)
+
+ID_CHUNK = 50
+_SELECT = ["ID", "NAME", "PRICE", "CURRENCY_ID", "DESCRIPTION"]
+FORMATS = ("zip", "pdf")
+# где искать шрифт с кириллицей, если QR_LABEL_FONT не задан
+_FONT_CANDIDATES = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf",
+)
+
+# A4 в пунктах, сетка этикеток 3 x 5
+_PAGE_W, _PAGE_H = 595.28, 841.89
+_COLS, _ROWS = 3, 5
+_MARGIN = 24.0
+_QR_SIZE = 110.0
+_FONT_SIZE = 9
+_CAPTION_PAD = 4.0
+
+# число процессов -> пул; живут, пока жив воркер
+_pools: dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+class BulkQRError(Exception):
+    pass
+
+
+def _workers() -> int:
+    return getattr(settings, "QR_BULK_WORKERS", None) or os.cpu_count() or 1
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Пул один на процесс (и на число процессов), spawn: fork из многопоточного
+    веб-воркера копирует чужие захваченные блокировки, а новый пул на
+    запрос — это ещё и запуск процессов каждый раз.
+    """
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return pool
+
+
+def _label_font() -> Optional[str]:
+    """TrueType-шрифт с кириллицей для подписей PDF или None (тогда Helvetica)."""
+    configured = getattr(settings, "QR_LABEL_FONT", None)
+    if configured:
+        return configured
+    for path in _FONT_CANDIDATES:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _max_products() -> int:
+    return getattr(settings, "QR_BULK_MAX_PRODUCTS", 10000)
+
+
+# --------- товары ---------
+
+def fetch_products_by_ids(ids: Sequence[int]) -> List[dict]:
+    """Товары по ID в порядке ids; отсутствующие в Bitrix пропускаются."""
+    with RestBatch(catalog._call) as batch:
+        pages = [
+            batch.add("crm.product.list", {
+                "select": _SELECT,
+                "filter": {"ID": [str(i) for i in ids[start:start + ID_CHUNK]]},
+            })
+            for start in range(0, len(ids), ID_CHUNK)
+        ]
+    found = {}
+    for page in pages:
+        if not page.ok:
+            raise BulkQRError(f"crm.product.list: {page.error}")
+        for item in page.result() or []:
+            found[int(item["ID"])] = item
+    return [found[i] for i in ids if i in found]
+
+
+def fetch_section_products(section_id: int) -> List[dict]:
+    try:
+        return catalog.fetch_product_list({"SECTION_ID": section_id}, _SELECT)
+    except catalog.CatalogSyncError as e:
+        raise BulkQRError(str(e))
+
+
+def fetch_images(ids: Sequence[int]) -> dict[int, str]:
+    """
+    ID товара -> URL первой картинки (как в services._get_product_raw), ""
+    у товара без картинок. Товаров, для которых запрос не удался, в ответе нет.
+    """
+    with RestBatch(catalog._call) as batch:
+        calls = [
+            (pid, batch.add("catalog.productImage.list", {
+                "productId": pid,
+                "select": ["id", "productId", "detailUrl", "downloadUrl"],
+            }))
+            for pid in ids
+        ]
+    images = {}
+    for pid, call in calls:
+        if not call.ok:
+            continue
+        data = call.result()
+        found = data.get("productImages") if isinstance(data, dict) else None
+        images[pid] = (found[0].get("detailUrl") or found[0].get("downloadUrl") or "") if found else ""
+    return images
+
+
+def collect_products(ids: Optional[Sequence[int]] = None, section_id: Optional[int] = None) -> List[ProductInfo]:
+    if ids:
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > _max_products():
+            raise BulkQRError(f"Слишком много товаров: {len(ids)}, максимум {_max_products()}")
+        raw = fetch_products_by_ids(ids)
+    elif section_id is not None:
+        raw = fetch_section_products(section_id)
+    else:
+        raise BulkQRError("Нужен список ID товаров или ID раздела")
+    if len(raw) > _max_products():
+        raise BulkQRError(f"Слишком много товаров: {len(raw)}, максимум {_max_products()}")
+    images = fetch_images([int(item["ID"]) for item in raw])
+    return [product_info(item, images.get(int(item["ID"]), "")) for item in raw]
+
+
+def create_links(products: Iterable[ProductInfo], created_by: str = "") -> List[ProductLink]:
+    # данные только что из Bitrix — копия свежая
+    now = timezone.now()
+    links = [
+        ProductLink(
+            product_id=p.id,
+            title_cached=p.name,
+            img_url_cached=p.image,
+            price_cached=p.price,
+            currency_cached=p.currency,
+            description_cached=p.description,
+            created_by=created_by,
+            refreshed_at=now,
+        )
+        for p in products
+    ]
+    # id — uuid4 по умолчанию, проставляется ещё до записи
+    ProductLink.objects.bulk_create(links, batch_size=500)
+    return links
+
+
+# --------- отрисовка ---------
+
+def _render_chunk(render: Callable, items: list) -> list:
+    return [render(item) for item in items]
+
+
+def _rendered(render: Callable, items: list, workers: Optional[int]) -> Iterator:
+    """
+    render(item) по порядку items; большие пачки — в пуле процессов.
+    Генератор закрыли раньше конца (клиент ушёл) — ещё не начатые пачки
+    отменяются, уже идущие доделываются в пуле без ожидания.
+    """
+    workers = workers or _workers()
+    if workers < 2 or len(items) < 2 * workers:
+        yield from map(render, items)
+        return
+    size = max(1, min(64, len(items) // (workers * 4)))
+    pool = _get_pool(workers)
+    futures = [pool.submit(_render_chunk, render, items[i:i + size]) for i in range(0, len(items), size)]
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+# --------- ZIP ---------
+
+class _Sink(io.RawIOBase):
+    """Несеекаемый приёмник для ZipFile: накопленное забирается через take()."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def stream_zip(links: Sequence[ProductLink], url_for: Callable[[ProductLink], str],
+               workers: Optional[int] = None) -> Iterator[bytes]:
+    """ZIP: <product_id>-<token>.png на ссылку и links.csv с названиями и URL."""
+    urls = [url_for(pl) for pl in links]
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as zf:
+        manifest = io.StringIO()
+        writer = csv.writer(manifest)
+        writer.writerow(["product_id", "title", "price", "currency", "url", "file"])
+        for pl, url, png in zip(links, urls, _rendered(render_png, urls, workers)):
+            name = f"{pl.product_id}-{pl.pk}.png"
+            # PNG уже сжат, второй раз не жмём
+            zf.writestr(name, png)
+            writer.writerow([pl.product_id, pl.title_cached, pl.price_cached, pl.currency_cached, url, name])
+            yield sink.take()
+        zf.writestr("links.csv", manifest.getvalue().encode("utf-8-sig"), compress_type=zipfile.ZIP_DEFLATED)
+    yield sink.take()
+
+
+# --------- PDF ---------
+
+def _pdf_text(value: str) -> bytes:
+    ascii_only = value.encode("ascii", "ignore").decode("ascii")
+    escaped = ascii_only.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return f"({escaped})".encode("ascii")
+
+
+_CELL_W = (_PAGE_W - 2 * _MARGIN) / _COLS
+_CELL_H = (_PAGE_H - 2 * _MARGIN) / _ROWS
+
+
+def _label_details(pl: ProductLink) -> List[str]:
+    price = f"{pl.price_cached} {pl.currency_cached}".strip()
+    return [f"ID {pl.product_id}" + (f" · {price}" if price else "")]
+
+
+def _label_ops(pl: ProductLink, qr_ops: bytes, col: int, row: int, caption: Optional[bytes] = None,
+               caption_size: tuple[int, int] = (0, 0)) -> bytes:
+    """
+    Этикетка в ячейке (col, row). caption — имя картинки-подписи в ресурсах
+    страницы (caption_size — её размер в точках); без неё — ID и цена Helvetica.
+    """
+    cell_x = _MARGIN + col * _CELL_W
+    x = cell_x + (_CELL_W - _QR_SIZE) / 2
+    top = _PAGE_H - _MARGIN - row * _CELL_H
+    y = top - 12 - _QR_SIZE
+    if caption is not None:
+        w, h = (v / CAPTION_SCALE for v in caption_size)
+        text = b"q %.2f 0 0 %.2f %.2f %.2f cm /%s Do Q" % (w, h, cell_x + _CAPTION_PAD, y - 2 - h, caption)
+    else:
+        price = f"{pl.price_cached} {pl.currency_cached}".strip()
+        lines = [_pdf_text(f"ID {pl.product_id}")] + ([_pdf_text(price)] if price else [])
+        text = b" ".join(
+            b"BT /F1 %d Tf %.2f %.2f Td %s Tj ET" % (_FONT_SIZE, x, y - 14 - i * (_FONT_SIZE + 3), line)
+            for i, line in enumerate(lines)
+        )
+    return b"q 1 0 0 1 %.2f %.2f cm %.2f 0 0 %.2f 0 0 cm\n%s\nQ\n%s\n" % (
+        x, y, _QR_SIZE, _QR_SIZE, qr_ops, text
+    )
+
+
+class _PdfWriter:
+    """Последовательная запись объектов PDF с учётом смещений для xref."""
+
+    def __init__(self):
+        self.offsets: dict[int, int] = {}
+        self.pos = 0
+        self.next_num = 1
+
+    def reserve(self) -> int:
+        num = self.next_num
+        self.next_num += 1
+        return num
+
+    def chunk(self, data: bytes) -> bytes:
+        self.pos += len(data)
+        return data
+
+    def obj(self, num: int, body: bytes, stream: Optional[bytes] = None) -> bytes:
+        self.offsets[num] = self.pos
+        if stream is None:
+            data = b"%d 0 obj\n%s\nendobj\n" % (num, body)
+        else:
+            data = b"%d 0 obj\n%s\nstream\n%s\nendstream\nendobj\n" % (num, body, stream)
+        return self.chunk(data)
+
+    def trailer(self, root: int) -> bytes:
+        xref_at = self.pos
+        lines = [b"xref", b"0 %d" % self.next_num, b"0000000000 65535 f "]
+        lines += [b"%010d 00000 n " % self.offsets[n] for n in range(1, self.next_num)]
+        lines += [
+            b"trailer",
+            b"<< /Size %d /Root %d 0 R >>" % (self.next_num, root),
+            b"startxref",
+            b"%d" % xref_at,
+            b"%%EOF",
+        ]
+        return self.chunk(b"\n".join(lines) + b"\n")
+
+
+def stream_pdf(links: Sequence[ProductLink], url_for: Callable[[ProductLink], str],
+               workers: Optional[int] = None) -> Iterator[bytes]:
+    """Лист этикеток A4 (3 x 5 на странице); каждая страница уходит, как только готова."""
+    pdf = _PdfWriter()
+    catalog_num, pages_num, font_num = pdf.reserve(), pdf.reserve(), pdf.reserve()
+    yield pdf.chunk(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    yield pdf.obj(font_num, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+    per_page = _COLS * _ROWS
+    kids: List[int] = []
+    content: List[bytes] = []
+    # картинки-подписи текущей страницы: имя в ресурсах -> номер объекта
+    images: dict[bytes, int] = {}
+
+    def flush_page() -> bytes:
+        stream = zlib.compress(b"".join(content))
+        content.clear()
+        xobjects = b" ".join(b"/%s %d 0 R" % item for item in images.items())
+        images.clear()
+        content_num, page_num = pdf.reserve(), pdf.reserve()
+        kids.append(page_num)
+        return pdf.obj(content_num, b"<< /Length %d /Filter /FlateDecode >>" % len(stream), stream) + pdf.obj(
+            page_num,
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] "
+            b"/Resources << /Font << /F1 %d 0 R >> /XObject << %s >> >> /Contents %d 0 R >>"
+            % (pages_num, _PAGE_W, _PAGE_H, font_num, xobjects, content_num),
+        )
+
+    font = _label_font()
+    if font is None:
+        logger.warning("QR_LABEL_FONT not found, PDF labels go without product names")
+    jobs = [
+        (url_for(pl), pl.title_cached, _label_details(pl), font, _CELL_W - 2 * _CAPTION_PAD, _FONT_SIZE)
+        for pl in links
+    ]
+    for i, (pl, (qr_ops, caption)) in enumerate(zip(links, _rendered(render_pdf_label, jobs, workers))):
+        slot = i % per_page
+        if caption is None:
+            content.append(_label_ops(pl, qr_ops, slot % _COLS, slot // _COLS))
+        else:
+            w, h, pixels = caption
+            name, num = b"C%d" % slot, pdf.reserve()
+            images[name] = num
+            yield pdf.obj(num, b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray "
+                               b"/BitsPerComponent 1 /Filter /FlateDecode /Length %d >>" % (w, h, len(pixels)), pixels)
+            content.append(_label_ops(pl, qr_ops, slot % _COLS, slot // _COLS, name, (w, h)))
+        if slot == per_page - 1:
+            yield flush_page()
+    if content or not kids:
+        yield flush_page()
+
+    yield pdf.obj(pages_num, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), len(kids)
+    ))
+    yield pdf.obj(catalog_num, b"<< /Type /Catalog /Pages %d 0 R >>" % pages_num)
+    yield pdf.trailer(catalog_num)
+
+
+def stream_labels(fmt: str, links: Sequence[ProductLink], url_for: Callable[[ProductLink], str],
+                  workers: Optional[int] = None) -> Iterator[bytes]:
+    if fmt == "pdf":
+        return stream_pdf(links, url_for, workers)
+    if fmt == "zip":
+        return stream_zip(links, url_for, workers)
+    raise BulkQRError(f"Неизвестный формат: {fmt}")
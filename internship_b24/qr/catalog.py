@@ -0,0 +1,414 @@
+"""
+Локальный каталог товаров для автокомплита QR-формы.
+
+Товары из Bitrix24 (ID, название, цена, валюта) копируются в таблицу
+CatalogProduct: `manage.py sync_products` по расписанию докачивает
+изменённые с прошлой синхронизации (CatalogSyncState.watermark — максимум
+DATE_MODIFY, полученный самой синхронизацией), события ONCRMPRODUCT*
+обновляют отдельные товары сразу. Поиск идёт только по индексу в памяти процесса и
+в Bitrix не ходит.
+
+Индекс (ProductSearchIndex) ранжирует так:
+0 — название начинается с запроса;
+1 — каждое слово запроса — начало какого-то слова названия;
+2 — запрос встречается внутри названия (через триграммы).
+Внутри групп 0 и 2 — по алфавиту, в группе 1 — по слову названия,
+совпавшему с самым редким словом запроса. Индекс пересобирается, когда меняется
+таблица (проверка не чаще PRODUCT_INDEX_CHECK_INTERVAL секунд). Новый индекс
+строится без блокировки поиска: пока он собирается, запросы отвечает старый.
+
+Результаты запросов кэшируются в самом индексе (вместе с ним и
+сбрасываются). Если для более короткого префикса запроса найдено меньше
+limit товаров, то есть это все совпадения, более длинный запрос
+отбирается из них без обхода индекса: каждое совпадение длинного запроса
+совпадает и с его префиксом.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from internship_b24 import metrics
+from internship_b24.bx_batch import RestBatch
+from internship_b24.qr import services
+from internship_b24.qr.models import CatalogProduct, CatalogSyncState
+from internship_b24.qr.services import ProductInfo
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 50
+_SELECT = ["ID", "NAME", "PRICE", "CURRENCY_ID", "DATE_MODIFY"]
+_NON_WORD = re.compile(r"[\W_]+")
+# после самого высокого символа — граница диапазона префикса для bisect
+_MAX_CHAR = "\U0010ffff"
+# подстрока ищется по триграммам, короче запросы — только по префиксам
+_MIN_SUBSTRING = 3
+
+
+class CatalogSyncError(Exception):
+    pass
+
+
+def search_key(text: Optional[str]) -> str:
+    """Нижний регистр, ё -> е, слова через один пробел."""
+    return " ".join(t for t in _NON_WORD.split((text or "").lower().replace("ё", "е")) if t)
+
+
+def _trigrams(key: str) -> set[str]:
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+def _price(value) -> str:
+    return "" if value is None or value == "" else str(value)
+
+
+# --------- индекс ---------
+
+class ProductSearchIndex:
+    def __init__(self, products: Iterable[tuple[int, str, str, str]]):
+        """products — (id, name, price, currency) по возрастанию id."""
+        self._ids = array("q")
+        self._names: List[str] = []
+        self._prices: List[str] = []
+        self._currencies: List[str] = []
+        keys: List[str] = []
+        for pid, name, price, currency in products:
+            self._ids.append(pid)
+            self._names.append(name or f"Товар {pid}")
+            self._prices.append(price or "")
+            self._currencies.append(currency or "")
+            keys.append(search_key(name))
+        self._keys = keys
+
+        # ключи целиком и отдельные слова — отсортированы для поиска по префиксу
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._sorted_keys = [keys[i] for i in order]
+        self._sorted_pos = array("l", order)
+
+        words = sorted((w, pos) for pos, key in enumerate(keys) for w in set(key.split()))
+        self._words = [w for w, _ in words]
+        self._word_pos = array("l", (pos for _, pos in words))
+
+        postings: dict[str, array] = {}
+        for pos, key in enumerate(keys):
+            for gram in _trigrams(key):
+                postings.setdefault(gram, array("l")).append(pos)
+        self._postings = postings
+
+        # нормализованный запрос -> (позиции, complete, limit), LRU;
+        # при complete позиции — все совпадения, сколько бы их ни было
+        self._results: OrderedDict[str, tuple[List[int], bool, int]] = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def search(self, query: str, limit: int = 10) -> List[ProductInfo]:
+        return self.lookup(query, limit)[0]
+
+    def lookup(self, query: str, limit: int = 10) -> tuple[List[ProductInfo], bool]:
+        """
+        (товары, complete). complete — найдены все совпадения и запроса, и
+        любого его продолжения (а не первые limit): такой ответ можно сужать
+        дальше, не обращаясь к индексу. Для запросов короче трёх символов
+        всегда False — их продолжения могут совпасть по подстроке.
+        """
+        q = search_key(query)
+        if not q:
+            # пустой запрос — последние товары, как раньше (order ID DESC);
+            # товары в индексе лежат по возрастанию ID
+            last = range(len(self._ids) - 1, max(len(self._ids) - limit, 0) - 1, -1)
+            return [self._info(pos) for pos in last], False
+
+        positions, complete = self._cached(q, limit)
+        return [self._info(pos) for pos in positions], complete
+
+    def _cached(self, q: str, limit: int) -> tuple[List[int], bool]:
+        with self._cache_lock:
+            hit = self._results.get(q)
+            if hit is not None and (hit[1] or hit[2] >= limit):
+                self._results.move_to_end(q)
+                metrics.cache_result("product_search", True)
+                return hit[0][:limit], hit[1] and len(hit[0]) <= limit
+            base = None
+            for end in range(len(q) - 1, 0, -1):
+                prev = self._results.get(q[:end])
+                if prev is not None and prev[1]:
+                    base = prev[0]
+                    break
+        metrics.cache_result("product_search", False)
+
+        if base is not None:
+            # все совпадения q — среди совпадений префикса
+            positions, complete = self._narrow(q, base), True
+        else:
+            positions = self._search(q, limit)
+            complete = len(positions) < limit and len(q) >= _MIN_SUBSTRING
+
+        size = getattr(settings, "PRODUCT_SEARCH_CACHE_SIZE", 1024)
+        with self._cache_lock:
+            self._results[q] = (positions, complete, limit)
+            self._results.move_to_end(q)
+            while len(self._results) > size:
+                self._results.popitem(last=False)
+        return positions[:limit], complete and len(positions) <= limit
+
+    def _search(self, q: str, limit: int) -> List[int]:
+        found: List[int] = []
+        seen: set[int] = set()
+
+        def take(positions: Iterable[int]) -> bool:
+            for pos in positions:
+                if pos not in seen:
+                    seen.add(pos)
+                    found.append(pos)
+                    if len(found) >= limit:
+                        return True
+            return False
+
+        if take(self._by_name_prefix(q)) or take(self._by_word_prefixes(q)):
+            return found
+        if len(q) >= _MIN_SUBSTRING:
+            take(self._by_substring(q, limit - len(found), seen))
+        return found
+
+    def _narrow(self, q: str, positions: Iterable[int]) -> List[int]:
+        """Совпадения q среди positions в том же порядке, что дал бы _search."""
+        tokens = q.split()
+        first = self._anchor(tokens)
+        ranked = []
+        for pos in positions:
+            key = self._keys[pos]
+            if key.startswith(q):
+                ranked.append((0, key, pos))
+                continue
+            words = key.split()
+            if all(any(w.startswith(t) for w in words) for t in tokens):
+                ranked.append((1, min(w for w in words if w.startswith(first)), pos))
+            elif len(q) >= _MIN_SUBSTRING and q in key:
+                ranked.append((2, key, pos))
+        ranked.sort()
+        return [pos for _, _, pos in ranked]
+
+    def _by_name_prefix(self, q: str) -> Iterable[int]:
+        lo = bisect_left(self._sorted_keys, q)
+        hi = bisect_left(self._sorted_keys, q + _MAX_CHAR, lo)
+        # лениво: take() обычно останавливается на первых limit
+        return (self._sorted_pos[i] for i in range(lo, hi))
+
+    def _word_range(self, token: str) -> tuple[int, int]:
+        lo = bisect_left(self._words, token)
+        return lo, bisect_left(self._words, token + _MAX_CHAR, lo)
+
+    def _anchor(self, tokens: List[str]) -> str:
+        """Слово запроса с самым узким диапазоном в словаре — с него и начинаем."""
+        def width(token: str) -> int:
+            lo, hi = self._word_range(token)
+            return hi - lo
+
+        return min(tokens, key=width)
+
+    def _by_word_prefixes(self, q: str) -> Iterable[int]:
+        tokens = q.split()
+        first = self._anchor(tokens)
+        rest = [t for t in tokens if t is not first]
+        lo, hi = self._word_range(first)
+        for i in range(lo, hi):
+            pos = self._word_pos[i]
+            if rest:
+                words = self._keys[pos].split()
+                if not all(any(w.startswith(t) for w in words) for t in rest):
+                    continue
+            yield pos
+
+    def _by_substring(self, q: str, limit: int, seen: set[int]) -> List[int]:
+        grams = sorted((self._postings.get(g) for g in _trigrams(q)), key=lambda p: len(p) if p else 0)
+        if not grams or not grams[0]:
+            return []
+        candidates = [pos for pos in grams[0] if pos not in seen and q in self._keys[pos]]
+        candidates.sort(key=self._keys.__getitem__)
+        return candidates[:limit]
+
+    def _info(self, pos: int) -> ProductInfo:
+        return ProductInfo(
+            id=self._ids[pos],
+            name=self._names[pos],
+            price=self._prices[pos],
+            currency=self._currencies[pos],
+            description="",
+            image="",
+        )
+
+
+_index: Optional[ProductSearchIndex] = None
+_index_version: Optional[tuple] = None
+_index_checked = 0.0
+_index_lock = threading.Lock()
+# пересборку ведёт один поток, остальные тем временем берут старый индекс
+_build_lock = threading.Lock()
+
+
+def _catalog_version() -> tuple:
+    agg = CatalogProduct.objects.aggregate(n=Count("product_id"), synced=Max("synced_at"))
+    return agg["n"], agg["synced"]
+
+
+def get_search_index() -> ProductSearchIndex:
+    """Индекс процесса; пересобирается, если таблица изменилась."""
+    global _index, _index_version, _index_checked
+    interval = getattr(settings, "PRODUCT_INDEX_CHECK_INTERVAL", 5)
+    with _index_lock:
+        current = _index
+        if current is not None and time.monotonic() - _index_checked < interval:
+            return current
+        _index_checked = time.monotonic()
+    version = _catalog_version()
+    if current is not None and version == _index_version:
+        return current
+    # первый индекс ждут все, следующий — только тот, кто его строит
+    if not _build_lock.acquire(blocking=current is None):
+        return current
+    try:
+        with _index_lock:
+            if _index is not None and _index_version == version:
+                return _index
+        index = ProductSearchIndex(
+            CatalogProduct.objects.order_by("product_id").values_list("product_id", "name", "price", "currency")
+        )
+        with _index_lock:
+            _index, _index_version = index, version
+            _index_checked = time.monotonic()
+        return index
+    finally:
+        _build_lock.release()
+
+
+_bootstrap_started = False
+
+
+def search_products(query: str, limit: int = 10) -> tuple[List[ProductInfo], bool]:
+    """
+    Поиск для автокомплита: (товары, complete), см. ProductSearchIndex.lookup.
+    Если каталог ещё ни разу не синхронизирован, запускает полную
+    синхронизацию в фоне и пока отвечает пустым списком с complete=False.
+    """
+    global _bootstrap_started
+    index = get_search_index()
+    if not len(index):
+        if not _bootstrap_started:
+            from internship_b24.jobs import submit_job
+
+            _bootstrap_started = True
+            submit_job("catalog_sync", lambda job: sync_catalog(full=True))
+        return [], False
+    return index.lookup(query, limit)
+
+
+# --------- синхронизация с Bitrix ---------
+
+def _call(method: str, params: dict):
+    # через атрибут модуля: bx_simulator.patch_webhook подменяет services._bx24_call
+    return services._bx24_call(method, params)
+
+
+def fetch_product_list(flt: dict, select: List[str] = _SELECT) -> List[dict]:
+    """
+    Все товары по фильтру crm.product.list (order ID ASC): первая страница
+    обычным вызовом, остальные — batch-ами по 50 страниц.
+    """
+    params = {"select": select, "filter": flt, "order": {"ID": "ASC"}}
+    first = _call("crm.product.list", {**params, "start": 0})
+    if not isinstance(first, dict) or "result" not in first:
+        raise CatalogSyncError("crm.product.list не ответил")
+    items = list(first.get("result") or [])
+    total = int(first.get("total") or len(items))
+
+    with RestBatch(_call) as batch:
+        pages = [
+            batch.add("crm.product.list", {**params, "start": start})
+            for start in range(PAGE_SIZE, total, PAGE_SIZE)
+        ]
+    for page in pages:
+        if not page.ok:
+            raise CatalogSyncError(f"crm.product.list: {page.error}")
+        items.extend(page.result() or [])
+    return items
+
+
+def fetch_products(since: Optional[str] = None) -> List[dict]:
+    """Товары из Bitrix: все или изменённые с since."""
+    return fetch_product_list({">=DATE_MODIFY": since} if since else {})
+
+
+def _to_model(item: dict) -> Optional[CatalogProduct]:
+    try:
+        pid = int(item.get("ID"))
+    except (TypeError, ValueError):
+        return None
+    return CatalogProduct(
+        product_id=pid,
+        name=item.get("NAME") or "",
+        price=_price(item.get("PRICE")),
+        currency=item.get("CURRENCY_ID") or "",
+        date_modify=item.get("DATE_MODIFY") or "",
+        synced_at=timezone.now(),
+    )
+
+
+def upsert_products(items: Iterable[dict]) -> int:
+    objs = [obj for obj in map(_to_model, items) if obj is not None]
+    CatalogProduct.objects.bulk_create(
+        objs,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=["product_id"],
+        update_fields=["name", "price", "currency", "date_modify", "synced_at"],
+    )
+    return len(objs)
+
+
+def sync_catalog(full: bool = False) -> dict:
+    """
+    Докачивает товары, изменённые с прошлой синхронизации.
+    full=True (или синхронизации ещё не было) — весь каталог, заодно удаляет
+    из таблицы товары, которых в Bitrix больше нет.
+    """
+    state, _ = CatalogSyncState.objects.get_or_create(pk=1)
+    since = None if full else (state.watermark or None)
+    items = fetch_products(since)
+    upserted = upsert_products(items)
+
+    marks = [item.get("DATE_MODIFY") for item in items if item.get("DATE_MODIFY")]
+    state.watermark = max(marks + ([since] if since else []), default="")
+    if since is None:
+        state.full_at = timezone.now()
+    state.save()
+
+    deleted = 0
+    if since is None:
+        alive = {obj.product_id for obj in map(_to_model, items) if obj is not None}
+        stale = [pid for pid in CatalogProduct.objects.values_list("product_id", flat=True) if pid not in alive]
+        for start in range(0, len(stale), 500):
+            deleted += CatalogProduct.objects.filter(product_id__in=stale[start:start + 500]).delete()[0]
+    return {"full": since is None, "fetched": len(items), "upserted": upserted, "deleted": deleted}
+
+
+def apply_product_event(event: str, product_id: int) -> None:
+    """ONCRMPRODUCTADD / UPDATE / DELETE -> одна строка каталога."""
+    if event == "ONCRMPRODUCTDELETE":
+        CatalogProduct.objects.filter(product_id=product_id).delete()
+        return
+    data = _call("crm.product.get", {"ID": product_id})
+    product = data.get("result") if isinstance(data, dict) else None
+    if isinstance(product, dict) and product:
+        upsert_products([product])
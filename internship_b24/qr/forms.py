@@ -13,4 +13,37 @@ class QRForm(forms.Form):
         required=True,
         label="ID товара *",
         widget=forms.NumberInput(attrs={"placeholder": "ID товара"})
-    )
\ No newline at end of file
+    )
+
+class QRBulkForm(forms.Form):
+    product_ids = forms.CharField(
+        required=False,
+        label="ID товаров",
+        widget=forms.Textarea(attrs={"rows": 4, "placeholder": "Через запятую, пробел или с новой строки"}),
+    )
+    section_id = forms.IntegerField(
+        required=False,
+        min_value=1,
+        label="ID раздела каталога",
+        widget=forms.NumberInput(attrs={"placeholder": "ID раздела"}),
+    )
+    format = forms.ChoiceField(
+        choices=[("pdf", "PDF — лист этикеток A4"), ("zip", "ZIP — PNG и links.csv")],
+        initial="pdf",
+        label="Формат",
+    )
+
+    def clean_product_ids(self):
+        raw = self.cleaned_data.get("product_ids") or ""
+        ids = []
+        for part in raw.replace(",", " ").split():
+            if not part.isdigit() or int(part) < 1:
+                raise forms.ValidationError(f"Не ID товара: {part}")
+            ids.append(int(part))
+        return ids
+
+    def clean(self):
+        data = super().clean()
+        if not data.get("product_ids") and not data.get("section_id"):
+            raise forms.ValidationError("Укажите ID товаров или ID раздела")
+        return data
@@ -14,6 +14,9 @@ class ProductLink(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.CharField(max_length=128, blank=True)
+    # когда *_cached последний раз сверялись с Bitrix (manage.py refresh_product_links);
+    # пока копия свежая, публичная страница не ходит в Bitrix
+    refreshed_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
 
     class Meta:
@@ -21,3 +24,51 @@ class ProductLink(models.Model):
 
     def __str__(self):
         return f"{self.product_id} -> {self.id}"
+
+
+class CatalogProduct(models.Model):
+    """Локальная копия товара Bitrix24 для автокомплита QR-формы (см. qr/catalog.py)."""
+    product_id = models.PositiveIntegerField(primary_key=True)
+
+    name = models.CharField(max_length=512, blank=True)
+    price = models.CharField(max_length=64, blank=True)
+    currency = models.CharField(max_length=16, blank=True)
+
+    # DATE_MODIFY из Bitrix как есть
+    date_modify = models.CharField(max_length=32, blank=True, db_index=True)
+    synced_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        ordering = ["-product_id"]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.name}"
+
+
+class CatalogSyncState(models.Model):
+    """
+    Докуда докачан каталог (одна строка, pk=1). Двигает только sync_catalog:
+    события ONCRMPRODUCT* пишут свежий DATE_MODIFY отдельных товаров, и
+    максимум по таблице пропустил бы изменения, которые до них не дошли.
+    """
+    watermark = models.CharField(max_length=32, blank=True)
+    full_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.watermark or "-"
+
+
+class ProductLinkStats(models.Model):
+    """Сканирования QR-ссылки за день. Пишется пачками из буфера процесса (qr/scans.py)."""
+    link = models.ForeignKey(ProductLink, on_delete=models.CASCADE, related_name="stats")
+    day = models.DateField(db_index=True)
+    scans = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["-day", "-scans"]
+        constraints = [
+            models.UniqueConstraint(fields=["link", "day"], name="productlinkstats_link_day"),
+        ]
+
+    def __str__(self):
+        return f"{self.link_id} {self.day}: {self.scans}"
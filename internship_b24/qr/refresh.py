@@ -0,0 +1,112 @@
+"""
+Фоновое обновление *_cached полей ProductLink.
+
+`manage.py refresh_product_links` (по расписанию) обходит ссылки
+пачками product_id, забирает товары и картинки batch-ами (как массовая
+генерация, qr/bulk.py), переписывает через bulk_update только изменившиеся
+строки и проставляет refreshed_at ссылкам найденных товаров.
+
+refreshed_at ставится только ссылкам, чья отметка не изменилась с момента,
+когда пачка была прочитана (до запроса в Bitrix): если тем временем пришло
+событие и mark_stale() сбросил отметку, ссылка остаётся устаревшей до
+следующего прохода. Товар, картинку которого получить не удалось, сохраняет
+прежнюю картинку и тоже не отмечается.
+
+Публичная страница доверяет копии моложе PRODUCT_LINK_FRESH_TTL и в
+Bitrix не ходит; устаревшие, ещё не обновлённые и сброшенные событием
+ONCRMPRODUCTUPDATE ссылки по-прежнему смотрят живые данные.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import timedelta
+from typing import Iterator, List, Optional, Sequence
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from internship_b24.qr.bulk import fetch_images, fetch_products_by_ids
+from internship_b24.qr.models import ProductLink
+from internship_b24.qr.services import product_info
+
+CHUNK = 500
+_CACHED_FIELDS = ["title_cached", "img_url_cached", "price_cached", "currency_cached", "description_cached"]
+
+
+def fresh_ttl() -> timedelta:
+    return timedelta(seconds=getattr(settings, "PRODUCT_LINK_FRESH_TTL", 15 * 60))
+
+
+def is_fresh(pl: ProductLink) -> bool:
+    return pl.refreshed_at is not None and timezone.now() - pl.refreshed_at < fresh_ttl()
+
+
+def _links(link_ids: Optional[Sequence]):
+    qs = ProductLink.objects.all()
+    return qs if link_ids is None else qs.filter(pk__in=list(link_ids))
+
+
+def _product_ids(older_than: Optional[timedelta], link_ids: Optional[Sequence]) -> Iterator[List[int]]:
+    qs = _links(link_ids)
+    if older_than is not None:
+        qs = qs.filter(Q(refreshed_at__isnull=True) | Q(refreshed_at__lt=timezone.now() - older_than))
+    ids = list(qs.order_by("product_id").values_list("product_id", flat=True).distinct())
+    for start in range(0, len(ids), CHUNK):
+        yield ids[start:start + CHUNK]
+
+
+def refresh_links(older_than: Optional[timedelta] = None, link_ids: Optional[Sequence] = None) -> dict:
+    """
+    Сверяет ссылки с Bitrix. older_than — только товары, у которых есть
+    ссылка без refreshed_at или старше older_than; link_ids — только эти ссылки.
+    """
+    stats = {"products": 0, "missing": 0, "links": 0, "changed": 0}
+    for ids in _product_ids(older_than, link_ids):
+        # ссылки читаем до Bitrix: их refreshed_at — условие для отметки ниже
+        links = list(
+            _links(link_ids).filter(product_id__in=ids).only("id", "product_id", "refreshed_at", *_CACHED_FIELDS)
+        )
+        raw = fetch_products_by_ids(ids)
+        images = fetch_images([int(item["ID"]) for item in raw])
+        live = {int(item["ID"]): item for item in raw}
+        stats["products"] += len(ids)
+        stats["missing"] += len(ids) - len(live)
+
+        changed = []
+        # прочитанный refreshed_at -> ссылки, которые можно отметить
+        verified = defaultdict(list)
+        for pl in links:
+            item = live.get(pl.product_id)
+            if item is None:
+                continue
+            image = images.get(pl.product_id)
+            p = product_info(item, pl.img_url_cached if image is None else image)
+            values = {
+                "title_cached": p.name,
+                "img_url_cached": p.image,
+                "price_cached": p.price,
+                "currency_cached": p.currency,
+                "description_cached": p.description,
+            }
+            if any(getattr(pl, f) != v for f, v in values.items()):
+                for f, v in values.items():
+                    setattr(pl, f, v)
+                changed.append(pl)
+            if image is not None:
+                verified[pl.refreshed_at].append(pl.pk)
+        ProductLink.objects.bulk_update(changed, _CACHED_FIELDS, batch_size=500)
+        # отметка — одним UPDATE на группу с одинаковой прежней отметкой, а не построчно
+        now = timezone.now()
+        for seen, pks in verified.items():
+            for start in range(0, len(pks), CHUNK):
+                stats["links"] += ProductLink.objects.filter(
+                    pk__in=pks[start:start + CHUNK], refreshed_at=seen
+                ).update(refreshed_at=now)
+        stats["changed"] += len(changed)
+    return stats
+
+
+def mark_stale(product_id: int) -> None:
+    """Товар изменился в Bitrix: его ссылки снова смотрят живые данные до следующего обновления."""
+    ProductLink.objects.filter(product_id=product_id, refreshed_at__isnull=False).update(refreshed_at=None)
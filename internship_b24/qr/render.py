@@ -0,0 +1,121 @@
+"""
+Отрисовка QR и подписей этикеток для qr/bulk.py.
+
+Функции выполняются в процессах пула (spawn), поэтому модуль не трогает
+Django: ни настроек, ни моделей — всё нужное приходит аргументами.
+"""
+from __future__ import annotations
+
+import io
+import zlib
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+import qrcode
+from PIL import Image, ImageDraw, ImageFont
+
+_PNG_BOX = 10
+# точек подписи на пункт PDF (~288 dpi): подпись 1-битная, без
+# сглаживания, и мелкий кегль читается только при таком разрешении
+CAPTION_SCALE = 4
+
+
+def _qr_matrix(url: str, border: int = 0) -> List[List[bool]]:
+    qr = qrcode.QRCode(border=border, error_correction=qrcode.constants.ERROR_CORRECT_M)
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def render_png(url: str) -> bytes:
+    """PNG как у qrcode.make (модуль 10 px, поле 4 модуля), но из матрицы одним вызовом PIL."""
+    matrix = _qr_matrix(url, border=4)
+    n = len(matrix)
+    pixels = bytes(0 if dark else 255 for row in matrix for dark in row)
+    img = Image.frombytes("L", (n, n), pixels).resize((n * _PNG_BOX, n * _PNG_BOX), Image.NEAREST).convert("1")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def render_pdf_qr(url: str) -> bytes:
+    """
+    Операторы PDF, рисующие QR в квадрате 1 x 1 (масштаб и место задаёт
+    страница): соседние тёмные модули строки сливаются в один прямоугольник.
+    """
+    matrix = _qr_matrix(url)
+    n = len(matrix)
+    ops = [f"{1 / n:.6f} 0 0 {1 / n:.6f} 0 0 cm".encode()]
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < n:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < n and row[x]:
+                x += 1
+            ops.append(b"%d %d %d 1 re" % (start, n - 1 - y, x - start))
+    ops.append(b"f")
+    return b"\n".join(ops)
+
+
+# --------- подпись ---------
+
+@lru_cache(maxsize=4)
+def _font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(path, size)
+
+
+def _fit(draw: ImageDraw.ImageDraw, text: str, font, width: int) -> str:
+    """text, обрезанный с многоточием до ширины width."""
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > width:
+        text = text[:-1]
+    return text.rstrip() + "…"
+
+
+def _wrap(draw: ImageDraw.ImageDraw, text: str, font, width: int, max_lines: int) -> List[str]:
+    lines: List[str] = []
+    words = text.split()
+    while words and len(lines) < max_lines:
+        line = words.pop(0)
+        while words and draw.textlength(f"{line} {words[0]}", font=font) <= width:
+            line = f"{line} {words.pop(0)}"
+        lines.append(line)
+    if words:
+        lines[-1] = _fit(draw, f"{lines[-1]} {' '.join(words)}", font, width)
+    return [_fit(draw, line, font, width) for line in lines]
+
+
+def render_caption(title: str, details: Sequence[str], font_path: str,
+                   width_pt: float, font_size: int, name_lines: int = 2) -> Tuple[int, int, bytes]:
+    """
+    Подпись этикетки картинкой: название (до name_lines строк) и строки
+    details, по центру. Возвращает (ширина, высота, пиксели DeviceGray по
+    1 биту, строки добиты до байта, 1 — белый; сжаты zlib). Кириллица
+    рисуется шрифтом font_path, в PDF шрифт не встраивается.
+    """
+    font = _font(font_path, font_size * CAPTION_SCALE)
+    step = (font_size + 3) * CAPTION_SCALE
+    width = int(width_pt * CAPTION_SCALE)
+    draw = ImageDraw.Draw(Image.new("L", (1, 1)))
+    lines = (_wrap(draw, title, font, width, name_lines) if title else []) + [
+        _fit(draw, line, font, width) for line in details if line
+    ]
+    # под последней строкой интервал не нужен
+    img = Image.new("L", (width, max(1, len(lines)) * step - 2 * CAPTION_SCALE), 255)
+    draw = ImageDraw.Draw(img)
+    for i, line in enumerate(lines):
+        draw.text(((width - draw.textlength(line, font=font)) / 2, i * step), line, font=font, fill=0)
+    # порог без дизеринга: серые края букв иначе рассыпаются точками
+    img = img.convert("1", dither=Image.Dither.NONE)
+    return img.width, img.height, zlib.compress(img.tobytes())
+
+
+def render_pdf_label(job: Tuple[str, str, Sequence[str], Optional[str], float, int]):
+    """(url, название, строки, шрифт, ширина подписи, кегль) -> (операторы QR, подпись или None)."""
+    url, title, details, font_path, width_pt, font_size = job
+    caption = render_caption(title, details, font_path, width_pt, font_size) if font_path else None
+    return render_pdf_qr(url), caption
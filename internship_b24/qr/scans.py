@@ -0,0 +1,183 @@
+"""
+Счётчики сканирований QR-ссылок с отложенной записью.
+
+record_scan() только увеличивает счётчик в памяти процесса: публичная
+страница ничего не пишет в БД. Фоновый поток раз в
+QR_SCAN_FLUSH_INTERVAL секунд (и при выходе процесса) забирает накопленное
+и добавляет к ProductLinkStats: недостающие строки (ссылка, день)
+создаются одним bulk_create, затем один UPDATE на день прибавляет
+scans = scans + n сразу ко всем ссылкам. Прибавление делает сама БД,
+поэтому воркеры не затирают счётчики друг друга.
+
+Поток, как и запрос, закрывает своё соединение с БД до и после записи
+(close_old_connections): упавшее или устаревшее соединение не тянется в
+следующую попытку. Если запись не удаётся, счётчики остаются в буфере, но
+не больше QR_SCAN_MAX_PENDING пар (ссылка, день): новые пары сверх этого
+отбрасываются с предупреждением в логе.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, IntegerField, When
+from django.utils import timezone
+
+from internship_b24.qr.models import ProductLink, ProductLinkStats
+
+logger = logging.getLogger(__name__)
+
+_CHUNK = 500
+
+_lock = threading.Lock()
+_pending: Counter = Counter()
+# сканирования, не попавшие в переполненный буфер, с прошлого предупреждения
+_dropped = 0
+_flusher: Optional[threading.Thread] = None
+_flusher_pid: Optional[int] = None
+_stop = threading.Event()
+
+
+def _interval() -> float:
+    return getattr(settings, "QR_SCAN_FLUSH_INTERVAL", 5)
+
+
+def _max_pending() -> int:
+    return getattr(settings, "QR_SCAN_MAX_PENDING", 100_000)
+
+
+def _today() -> date:
+    # localdate() требует USE_TZ; без него now() и так локальное
+    return timezone.localdate() if settings.USE_TZ else date.today()
+
+
+def record_scan(link_id) -> None:
+    global _dropped
+    key = (link_id, _today())
+    with _lock:
+        if key in _pending or len(_pending) < _max_pending():
+            _pending[key] += 1
+        else:
+            _dropped += 1
+    _ensure_flusher()
+
+
+def _ensure_flusher() -> None:
+    global _flusher, _flusher_pid
+    # после fork поток родителя в дочернем процессе не работает — заводим свой
+    if _flusher is not None and _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher is not None and _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+        _flusher = threading.Thread(target=_run, name="qr-scan-flusher", daemon=True)
+        _flusher.start()
+
+
+def _run() -> None:
+    while not _stop.wait(_interval()):
+        close_old_connections()
+        try:
+            flush()
+        except Exception:
+            logger.exception("Не удалось записать счётчики сканирований QR")
+        finally:
+            close_old_connections()
+
+
+def flush() -> int:
+    """Записывает накопленное в ProductLinkStats; возвращает число сканирований."""
+    global _pending, _dropped
+    with _lock:
+        taken, _pending = _pending, Counter()
+        dropped, _dropped = _dropped, 0
+    if dropped:
+        logger.warning("Буфер сканирований QR переполнен, потеряно сканирований: %d", dropped)
+    if not taken:
+        return 0
+    try:
+        _write(taken)
+    except Exception:
+        # вернуть в буфер: запишется следующей попыткой, но не сверх предела
+        with _lock:
+            for key, n in taken.items():
+                if key in _pending or len(_pending) < _max_pending():
+                    _pending[key] += n
+                else:
+                    _dropped += n
+        raise
+    return sum(taken.values())
+
+
+def _write(taken: Dict[Tuple[object, date], int]) -> None:
+    # ссылку могли удалить, пока счётчик лежал в буфере
+    alive = set(ProductLink.objects.filter(pk__in={link_id for link_id, _ in taken}).values_list("pk", flat=True))
+    taken = {key: n for key, n in taken.items() if key[0] in alive}
+    by_day: Dict[date, Dict[object, int]] = defaultdict(dict)
+    for (link_id, day), n in taken.items():
+        by_day[day][link_id] = n
+
+    with transaction.atomic():
+        ProductLinkStats.objects.bulk_create(
+            [ProductLinkStats(link_id=link_id, day=day, scans=0) for link_id, day in taken],
+            batch_size=_CHUNK,
+            ignore_conflicts=True,
+        )
+        for day, counts in by_day.items():
+            items = list(counts.items())
+            for start in range(0, len(items), _CHUNK):
+                chunk = items[start:start + _CHUNK]
+                ProductLinkStats.objects.filter(day=day, link_id__in=[link_id for link_id, _ in chunk]).update(
+                    scans=F("scans") + Case(
+                        *(When(link_id=link_id, then=n) for link_id, n in chunk),
+                        output_field=IntegerField(),
+                    )
+                )
+
+
+def _flush_at_exit() -> None:
+    _stop.set()
+    try:
+        flush()
+    except Exception:
+        logger.exception("Не удалось записать счётчики сканирований QR при выходе")
+
+
+atexit.register(_flush_at_exit)
+
+
+# --------- отчёт ---------
+
+def scan_report(days: int = 14, limit: int = 200) -> dict:
+    """
+    Сводка для страницы статистики: дни (от новых к старым) и до limit
+    ссылок с наибольшим числом сканирований за период.
+    """
+    today = _today()
+    day_list = [today - timedelta(days=i) for i in range(days)]
+    rows = (
+        ProductLinkStats.objects
+        .filter(day__gte=day_list[-1])
+        .values_list("link_id", "link__product_id", "link__title_cached", "day", "scans")
+    )
+    links: Dict[object, dict] = {}
+    for link_id, product_id, title, day, scans in rows:
+        link = links.setdefault(link_id, {
+            "link_id": link_id, "product_id": product_id, "title": title, "total": 0, "by_day": {},
+        })
+        link["by_day"][day] = scans
+        link["total"] += scans
+
+    top = sorted(links.values(), key=lambda link: -link["total"])[:limit]
+    for link in top:
+        link["cells"] = [link["by_day"].get(day, 0) for day in day_list]
+    totals = [sum(link["by_day"].get(day, 0) for link in links.values()) for day in day_list]
+    return {"days": day_list, "links": top, "day_totals": totals, "total": sum(totals)}
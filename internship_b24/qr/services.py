@@ -1,10 +1,13 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Optional, List, Tuple
+from typing import Optional, Tuple
 import logging
 import requests
 from django.conf import settings
 
+from internship_b24.bx_batch import RestBatch
+from internship_b24.profiling import profile_rest_call
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,6 +22,7 @@ class ProductInfo:
 
 
 # функция вызова Bitrix24
+@profile_rest_call()
 def _bx24_call(method: str, params: dict) -> Optional[dict]:
     """
     Универсальный REST-вызов к Bitrix24 через входящий вебхук.
@@ -46,24 +50,28 @@ def _get_product_raw(product_id: int) -> Tuple[Optional[dict], Optional[str]]:
     Возвращает (product_dict, image_url) или (None, None)
     product_dict = результат crm.product.get
     image_url    = detailUrl из catalog.productImage.list
+    Оба метода уходят одним batch-запросом.
     """
-    # 1. crm.product.get
-    data = _bx24_call("crm.product.get", {"ID": product_id})
-    product = data.get("result", {}) if isinstance(data, dict) else {}
-    if not product:
+    with RestBatch(_bx24_call) as batch:
+        # 1. crm.product.get
+        c_product = batch.add("crm.product.get", {"ID": product_id})
+        # 2. catalog.productImage.list (получить detailUrl картинки)
+        c_images = batch.add("catalog.productImage.list", {
+            "productId": product_id,
+            "select": [
+                "id", "name", "productId", "type", "createTime",
+                "downloadUrl", "detailUrl"
+            ]
+        })
+
+    product = c_product.result()
+    if not isinstance(product, dict) or not product:
         return None, None
 
-    # 2. catalog.productImage.list (получить detailUrl картинки)
     img_url = ""
-    data_img = _bx24_call("catalog.productImage.list", {
-        "productId": product_id,
-        "select": [
-            "id", "name", "productId", "type", "createTime",
-            "downloadUrl", "detailUrl"
-        ]
-    })
+    data_img = c_images.result()
     if isinstance(data_img, dict):
-        images = data_img.get("result", {}).get("productImages", [])
+        images = data_img.get("productImages", [])
         if images:
             # берём первую
             img_url = images[0].get("detailUrl", "") or images[0].get("downloadUrl", "") or ""
@@ -80,6 +88,13 @@ def get_product_by_id(product_id: int) -> Optional[ProductInfo]:
     if not product_raw:
         return None
 
+    return product_info(product_raw, image_url, product_id)
+
+
+def product_info(product_raw: dict, image_url: str = "", product_id: Optional[int] = None) -> ProductInfo:
+    """ProductInfo из ответа crm.product.get / строки crm.product.list."""
+    if product_id is None:
+        product_id = int(product_raw.get("ID"))
     name = product_raw.get("NAME") or f"Товар {product_id}"
     price_val = product_raw.get("PRICE")
     currency = product_raw.get("CURRENCY_ID") or ""
@@ -99,43 +114,3 @@ def get_product_by_id(product_id: int) -> Optional[ProductInfo]:
         description=description,
         image=image_url or "",
     )
-
-
-def search_products_by_name(query: str, limit: int = 10) -> List[ProductInfo]:
-    """
-    Для автокомплита. Берём crm.product.list по %NAME.
-    Возвращаем список ProductInfo c урезанными полями.
-    Картинку тут не тянем, только имя/цену.
-    """
-    q = (query or "").strip()
-
-    data = _bx24_call("crm.product.list", {
-        "filter": {"%NAME": q} if q else {},
-        "select": ["ID", "NAME", "PRICE", "CURRENCY_ID"],
-        "order": {"ID": "DESC"},
-        "start": -1,
-    })
-
-    results = []
-    if isinstance(data, dict) and "result" in data:
-        for r in data["result"][:limit]:
-            pid = int(r["ID"])
-            name = r.get("NAME") or f"Товар {pid}"
-            price_val = r.get("PRICE")
-            currency = r.get("CURRENCY_ID") or ""
-
-            if price_val is None or price_val == "":
-                price = ""
-            else:
-                price = str(price_val)
-
-            results.append(ProductInfo(
-                id=pid,
-                name=name,
-                price=price,
-                currency=currency,
-                description="",
-                image="",  # не тянем тут
-            ))
-
-    return results
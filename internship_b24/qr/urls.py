@@ -5,6 +5,9 @@ app_name = "qr"
 
 urlpatterns = [
     path("", views.qr_form_view, name="qr_form"),
+    path("bulk/", views.qr_bulk_view, name="qr_bulk"),
+    path("stats/", views.qr_stats_view, name="qr_stats"),
     path("success/<uuid:token>/", views.qr_success_view, name="qr_success"),
     path("api/product-search", views.api_product_search, name="api_product_search"),
+    path("api/product-event", views.product_event_view, name="product_event"),
 ]
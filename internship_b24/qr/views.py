@@ -1,16 +1,27 @@
 import base64
 from io import BytesIO
 
-from django.http import JsonResponse, Http404
+from django.conf import settings
+from django.http import JsonResponse, Http404, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
-from django.views.decorators.http import require_http_methods, require_GET
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods, require_GET, require_POST
 
 import qrcode
 
-from .forms import QRForm
+from internship_b24 import metrics
+from internship_b24.bx_auth import main_auth
+from internship_b24.bx_events import parse_event
+from .catalog import apply_product_event, search_products
+from .bulk import BulkQRError, collect_products, create_links, stream_labels
+from .forms import QRBulkForm, QRForm
 from .models import ProductLink
-from .services import get_product_by_id, search_products_by_name
+from .refresh import is_fresh, mark_stale
+from .scans import record_scan, scan_report
+from .services import get_product_by_id
 
 
 def _build_public_url(request, token) -> str:
@@ -46,12 +57,39 @@ def qr_form_view(request):
                 currency_cached=product.currency or "",
                 description_cached=product.description or "",
                 created_by=str(request.user) if request.user.is_authenticated else "",
+                refreshed_at=timezone.now(),
             )
             return redirect("internship_b24:qr:qr_success", token=str(pl.id))
 
     return render(request, "qr/qr_form.html", ctx)
 
 
+@require_http_methods(["GET", "POST"])
+def qr_bulk_view(request):
+    """Ссылки и QR для списка товаров или раздела: ZIP или PDF, отдаётся потоком."""
+    form = QRBulkForm(request.POST or None)
+    if request.method == "POST" and form.is_valid():
+        try:
+            products = collect_products(form.cleaned_data["product_ids"], form.cleaned_data["section_id"])
+        except BulkQRError as e:
+            form.add_error(None, str(e))
+        else:
+            if not products:
+                form.add_error(None, "Товары не найдены в Битрикс24")
+            else:
+                links = create_links(
+                    products, created_by=str(request.user) if request.user.is_authenticated else ""
+                )
+                fmt = form.cleaned_data["format"]
+                response = StreamingHttpResponse(
+                    stream_labels(fmt, links, lambda pl: _build_public_url(request, pl.pk)),
+                    content_type="application/pdf" if fmt == "pdf" else "application/zip",
+                )
+                response["Content-Disposition"] = f'attachment; filename="qr_labels.{fmt}"'
+                return response
+
+    return render(request, "qr/qr_bulk.html", {"form": form})
+
 
 def qr_success_view(request, token: str):
     pl = get_object_or_404(ProductLink, pk=token)
@@ -76,7 +114,13 @@ def qr_success_view(request, token: str):
 def product_public_view(request, token: str):
     pl = get_object_or_404(ProductLink, pk=token)
 
-    live = get_product_by_id(pl.product_id)
+    if is_fresh(pl):
+        # копию недавно сверили с Bitrix (refresh_product_links) — без сети
+        live = None
+        metrics.qr_public_hits.inc(source="refreshed")
+    else:
+        live = get_product_by_id(pl.product_id)
+        metrics.qr_public_hits.inc(source="live" if live else "cached")
 
     if live:
         title = live.name or pl.title_cached
@@ -100,14 +144,30 @@ def product_public_view(request, token: str):
         "product_id": pl.product_id,
         "link_id": pl.pk,
     }
+    # только счётчик в памяти, в БД пишет фоновый поток
+    record_scan(pl.pk)
     return render(request, "qr/product_public.html", ctx)
 
 
+@main_auth(on_cookies=True)
+@require_GET
+def qr_stats_view(request):
+    """Сканирования QR-ссылок по дням за последние days дней (по умолчанию 14)."""
+    try:
+        days = min(max(int(request.GET.get("days", 14)), 1), 90)
+    except ValueError:
+        days = 14
+    ctx = scan_report(days)
+    ctx["days_param"] = days
+    return render(request, "qr/qr_stats.html", ctx)
+
+
 
 @require_GET
 def api_product_search(request):
     q = request.GET.get("q", "")
-    products = search_products_by_name(q)
+    # только локальный каталог: на каждое нажатие клавиши в Bitrix не ходим
+    products, complete = search_products(q)
 
     data = [
         {
@@ -119,4 +179,23 @@ def api_product_search(request):
         for p in products
     ]
 
-    return JsonResponse({"results": data})
+    response = JsonResponse({"results": data, "complete": complete})
+    # каталог меняется редко: повтор того же запроса браузер берёт из своего кэша
+    patch_cache_control(response, private=True, max_age=getattr(settings, "PRODUCT_SEARCH_BROWSER_TTL", 60))
+    return response
+
+
+_PRODUCT_EVENTS = ("ONCRMPRODUCTADD", "ONCRMPRODUCTUPDATE", "ONCRMPRODUCTDELETE")
+
+
+@csrf_exempt
+@require_POST
+def product_event_view(request):
+    """Обработчик событий ONCRMPRODUCT* (event.bind): обновляет локальный каталог."""
+    event = parse_event(request)
+    if event is None:
+        return JsonResponse({"error": "forbidden"}, status=403)
+    if event.name in _PRODUCT_EVENTS and event.entity_id:
+        apply_product_event(event.name, event.entity_id)
+        mark_stale(event.entity_id)
+    return JsonResponse({"ok": True})
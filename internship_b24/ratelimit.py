@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Tuple
+
+from django.conf import settings
+
+
+class RateLimiter:
+    """
+    Token bucket: rate токенов в секунду, ёмкость burst.
+    Потокобезопасен — один экземпляр делят все потоки процесса,
+    которые ходят в один и тот же портал.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Неблокирующий вариант: False, если токенов сейчас нет."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Блокирует, пока не наберётся tokens. Возвращает время ожидания, с."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def _default_limits() -> Tuple[float, int]:
+    # лимит Bitrix24 по умолчанию: 2 запроса в секунду, «запас» до 50
+    rate, burst = getattr(settings, "BITRIX_RATE_LIMIT", (2.0, 50))
+    return rate, burst
+
+
+def get_rate_limiter(key: str) -> RateLimiter:
+    """Общий лимитер на ключ (обычно — домен портала)."""
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = RateLimiter(*_default_limits())
+        return limiter
+
+
+def portal_key(but) -> str:
+    return getattr(but, "domain", None) or settings.APP_SETTINGS.portal_domain
@@ -1,13 +1,67 @@
 from html import unescape
 
+from django.conf import settings
+from django.core.cache import cache
+
+from .bx_batch import RestBatch
+from .ratelimit import portal_key
+
 UF_PRIORITY_CODE = 'UF_CRM_1760383363428'
 
+# справочники для load_manuals: ключ batch -> (метод, параметры)
+MANUALS_CALLS = {
+    'fields':     ('crm.deal.fields', None),
+    'stages':     ('crm.status.entity.items', {'entityId': 'DEAL_STAGE'}),
+    'types':      ('crm.status.entity.items', {'entityId': 'DEAL_TYPE'}),
+    'currencies': ('crm.currency.list', None),
+}
+
+DEALS_TOP_SELECT = [
+    'ID', 'TITLE', 'OPPORTUNITY', 'CURRENCY_ID',
+    'STAGE_ID', 'TYPE_ID', 'BEGINDATE', 'CLOSEDATE',
+    'DATE_CREATE', UF_PRIORITY_CODE
+]
+
+
+def _batched_list(but, call, method, fields=None):
+    """
+    Результат списочного метода из batch. Если batch вернул не всё
+    (есть next) или упал — догружаем обычным call_list_method.
+    """
+    if call.ok and not call.next:
+        return call.result()
+    return but.call_list_method(method, fields=fields) if fields else but.call_list_method(method)
+
+
 def load_manuals(but):
-    deal_fields = but.call_list_method('crm.deal.fields')
-    stages      = but.call_list_method('crm.status.entity.items', fields={'entityId': 'DEAL_STAGE'})
-    deal_types  = but.call_list_method('crm.status.entity.items', fields={'entityId': 'DEAL_TYPE'})
-    currencies  = but.call_list_method('crm.currency.list')
+    # четыре независимых справочника — одним batch-запросом
+    with RestBatch.for_token(but) as batch:
+        calls = {key: batch.add(method, params) for key, (method, params) in MANUALS_CALLS.items()}
+
+    deal_fields, stages, deal_types, currencies = (
+        _batched_list(but, calls[key], method, params)
+        for key, (method, params) in MANUALS_CALLS.items()
+    )
+
+    return deal_fields, build_manuals(deal_fields, stages, deal_types, currencies)
 
+
+def get_manuals(but, force=False):
+    """
+    load_manuals с кэшем на портал (DEAL_MANUALS_TTL секунд): справочники
+    меняются редко, а нужны на каждой форме и таблице сделок.
+    """
+    key = f'deal_manuals:{portal_key(but)}'
+    cached = None if force else cache.get(key)
+    if cached is not None:
+        return cached
+    result = load_manuals(but)
+    cache.set(key, result, getattr(settings, 'DEAL_MANUALS_TTL', 600))
+    return result
+
+
+def build_manuals(deal_fields, stages, deal_types, currencies) -> dict:
+    """Справочники «код -> подпись» из сырых ответов Bitrix."""
     manuals = {
         'STAGE_ID':    {e['STATUS_ID']: e['NAME'] for e in stages},
         'TYPE_ID':     {e['STATUS_ID']: e['NAME'] for e in deal_types},
@@ -19,14 +73,54 @@ def load_manuals(but):
             manuals[code] = {i['ID']: i['VALUE'] for i in meta['items']}
             manuals[f'{code}__label'] = meta.get('formLabel') or meta.get('title') or code
 
-    return deal_fields, manuals
+    return manuals
+
+
+class DealHumanizer:
+    """
+    Подписи для строк сделок, собранные один раз из справочников
+    (build_manuals): тип, стадия, валюта и все списочные UF_CRM_* поля.
+    Строки не меняет — возвращает новые словари, поэтому закэшированные
+    ответы можно отдавать сразу нескольким запросам.
+
+    Поля в результате: TYPE_ID_H, STAGE_ID_H, CURRENCY_H, <UF_CRM_...>_H
+    (только для полей, которые есть в строке) и UF_PRIORITY_H.
+    """
+
+    __slots__ = ('row',)
+
+    def __init__(self, manuals: dict):
+        type_label = manuals.get('TYPE_ID', {}).get
+        stage_label = manuals.get('STAGE_ID', {}).get
+        currency_label = manuals.get('CURRENCY_ID', {}).get
+        lists = tuple(
+            (code, f'{code}_H', labels.get)
+            for code, labels in manuals.items()
+            if code.startswith('UF_CRM_') and isinstance(labels, dict)
+        )
+        priority_target = f'{UF_PRIORITY_CODE}_H'
+
+        # все справочники — в замыкании: на строку только get по плоским dict
+        def row(row: dict) -> dict:
+            out = dict(row)
+            value = row.get('TYPE_ID')
+            out['TYPE_ID_H'] = type_label(value, value)
+            value = row.get('STAGE_ID')
+            out['STAGE_ID_H'] = stage_label(value, value)
+            value = row.get('CURRENCY_ID')
+            out['CURRENCY_H'] = currency_label(value, value)
+            for code, target, label in lists:
+                if code in row:
+                    value = row[code]
+                    # множественное поле приходит списком ID
+                    out[target] = (
+                        ', '.join(str(label(v, v)) for v in value) if value.__class__ is list else label(value)
+                    )
+            out['UF_PRIORITY_H'] = out.get(priority_target)
+            return out
 
+        self.row = row
 
-def humanize_deal_row(row: dict, manuals: dict) -> dict:
-    """Подменяет машинные коды читаемыми подписями в одной строке сделки."""
-    row['TYPE_ID_H']   = manuals['TYPE_ID'].get(row.get('TYPE_ID'), row.get('TYPE_ID'))
-    row['STAGE_ID_H']  = manuals['STAGE_ID'].get(row.get('STAGE_ID'), row.get('STAGE_ID'))
-    row['CURRENCY_H']  = manuals['CURRENCY_ID'].get(row.get('CURRENCY_ID'), row.get('CURRENCY_ID'))
-    row['UF_PRIORITY_H'] = manuals.get(UF_PRIORITY_CODE, {}).get(row.get(UF_PRIORITY_CODE)) \
-                           if UF_PRIORITY_CODE in row else None
-    return row
+    def rows(self, rows) -> list:
+        row = self.row
+        return [row(r) for r in rows]
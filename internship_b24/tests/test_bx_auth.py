@@ -0,0 +1,226 @@
+import threading
+import time
+from unittest import mock
+
+from django.http import HttpResponse, HttpResponseForbidden
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from internship_b24 import bx_auth
+
+AUTH_DELAY = 0.2
+
+
+class FakeToken:
+    is_active = True
+
+    def __init__(self, value):
+        self.pk = value
+        self.value = value
+
+
+class FakeMainAuth:
+    """Подмена main_auth из integration_utils: считает разрешения, токен — из cookie."""
+
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, **auth_kwargs):
+        def decorator(view):
+            def wrapper(request, *args, **kwargs):
+                with self.lock:
+                    self.calls += 1
+                time.sleep(AUTH_DELAY)
+                value = request.COOKIES.get("b24app_auth_token")
+                if value in (None, "bad"):
+                    return HttpResponseForbidden()
+                request.bitrix_user_token = FakeToken(value)
+                request.bitrix_user = f"user-{value}"
+                return view(request, *args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+
+def _view(request):
+    return HttpResponse(request.bitrix_user_token.value)
+
+
+@override_settings(BITRIX_AUTH_CACHE_TTL=60, BITRIX_AUTH_CACHE_SIZE=1024, BITRIX_AUTH_COOKIES=None)
+class MainAuthCacheTests(SimpleTestCase):
+    def setUp(self):
+        bx_auth.clear()
+        self.addCleanup(bx_auth.clear)
+        self.addCleanup(bx_auth._refreshed.clear)
+        self.fake = FakeMainAuth()
+        with mock.patch.object(bx_auth, "_main_auth", self.fake):
+            self.view = bx_auth.main_auth(on_cookies=True)(_view)
+        self.factory = RequestFactory()
+
+    def request(self, **cookies):
+        request = self.factory.get("/")
+        request.COOKIES.update(cookies)
+        return request
+
+    def run_parallel(self, requests):
+        barrier = threading.Barrier(len(requests))
+        responses = [None] * len(requests)
+
+        def run(i):
+            barrier.wait()
+            responses[i] = self.view(requests[i])
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(requests))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return responses
+
+    def test_parallel_requests_share_one_resolution(self):
+        responses = self.run_parallel([self.request(b24app_auth_token="t1") for _ in range(8)])
+
+        self.assertEqual(self.fake.calls, 1)
+        self.assertEqual([r.content for r in responses], [b"t1"] * 8)
+
+    def test_cached_attributes_are_set_on_request(self):
+        self.view(self.request(b24app_auth_token="t1"))
+        request = self.request(b24app_auth_token="t1")
+        self.view(request)
+
+        self.assertEqual(self.fake.calls, 1)
+        self.assertEqual(request.bitrix_user, "user-t1")
+
+    def test_different_tokens_resolve_separately(self):
+        responses = self.run_parallel([self.request(b24app_auth_token=f"t{i % 2}") for i in range(6)])
+
+        self.assertEqual(self.fake.calls, 2)
+        self.assertEqual(sorted(r.content for r in responses), [b"t0"] * 3 + [b"t1"] * 3)
+
+    def test_unrelated_cookies_do_not_split_cache(self):
+        self.view(self.request(b24app_auth_token="t1", _ga="a"))
+        self.view(self.request(b24app_auth_token="t1", _ga="b"))
+
+        self.assertEqual(self.fake.calls, 1)
+
+    def test_denied_is_not_cached(self):
+        for _ in range(2):
+            self.assertEqual(self.view(self.request(b24app_auth_token="bad")).status_code, 403)
+
+        self.assertEqual(self.fake.calls, 2)
+
+    def test_request_without_auth_cookies_skips_cache(self):
+        for _ in range(2):
+            self.assertEqual(self.view(self.request(_ga="a")).status_code, 403)
+
+        self.assertEqual(self.fake.calls, 2)
+
+    def test_auth_cookies_are_learned_from_main_auth(self):
+        self.view(self.request(b24app_auth_token="t1", _ga="a"))
+
+        self.assertEqual(bx_auth._learned, frozenset({"b24app_auth_token"}))
+
+    def test_missing_auth_cookies_are_logged_once(self):
+        self.view(self.request(b24app_auth_token="t1"))
+
+        with self.assertLogs(bx_auth.logger, "WARNING") as logs:
+            self.view(self.request(_ga="a"))
+            self.view(self.request(_ga="b"))
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("b24app_auth_token", logs.output[0])
+
+    @override_settings(BITRIX_AUTH_COOKIES=("b24_user",))
+    def test_configured_cookies_override_learned(self):
+        self.view(self.request(b24app_auth_token="t1", b24_user="u1"))
+        self.view(self.request(b24app_auth_token="t1", b24_user="u2"))
+
+        self.assertEqual(self.fake.calls, 2)
+
+    def test_each_request_gets_own_token(self):
+        first, second = self.request(b24app_auth_token="t1"), self.request(b24app_auth_token="t1")
+        self.view(first)
+        self.view(second)
+
+        self.assertEqual(self.fake.calls, 1)
+        self.assertIsNot(first.bitrix_user_token, second.bitrix_user_token)
+        self.assertEqual(second.bitrix_user_token.value, "t1")
+
+    def test_refreshed_token_is_not_served_from_cache(self):
+        self.view(self.request(b24app_auth_token="t1"))
+        bx_auth._refreshed["t1"] = (1, "refreshed")
+        self.view(self.request(b24app_auth_token="t1"))
+        self.view(self.request(b24app_auth_token="t1"))
+
+        self.assertEqual(self.fake.calls, 2)
+
+
+class CoordinateRefreshTests(SimpleTestCase):
+    def make_token_class(self):
+        class Token:
+            refreshes = 0
+            reloads = 0
+
+            def __init__(self, pk):
+                self.pk = pk
+
+            def refresh(self):
+                type(self).refreshes += 1
+                time.sleep(AUTH_DELAY)
+                return "refreshed"
+
+            def refresh_from_db(self):
+                type(self).reloads += 1
+
+        bx_auth.coordinate_refresh(Token)
+        self.addCleanup(bx_auth._refreshed.clear)
+        self.addCleanup(bx_auth._refresh_locks.clear)
+        return Token
+
+    def test_parallel_refresh_of_one_token_reuses_result(self):
+        Token = self.make_token_class()
+        barrier = threading.Barrier(5)
+        results = []
+
+        def run():
+            token = Token(pk=1)
+            barrier.wait()
+            results.append(token.refresh())
+
+        threads = [threading.Thread(target=run) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(Token.refreshes, 1)
+        self.assertEqual(Token.reloads, 4)
+        self.assertEqual(results, ["refreshed"] * 5)
+
+    def test_later_refresh_goes_to_bitrix_again(self):
+        Token = self.make_token_class()
+
+        Token(pk=1).refresh()
+        Token(pk=1).refresh()
+
+        self.assertEqual(Token.refreshes, 2)
+        self.assertEqual(Token.reloads, 0)
+
+    def test_different_tokens_refresh_independently(self):
+        Token = self.make_token_class()
+        threads = [threading.Thread(target=Token(pk=pk).refresh) for pk in (1, 2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(Token.refreshes, 2)
+
+    def test_class_is_wrapped_once(self):
+        Token = self.make_token_class()
+        refresh = Token.refresh
+
+        bx_auth.coordinate_refresh(Token)
+
+        self.assertIs(Token.refresh, refresh)
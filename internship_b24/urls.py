@@ -1,23 +1,32 @@
 from django.urls import path, include
 from . import views
 from internship_b24.qr import views as qr_views
+from internship_b24.metrics import metrics_view
 
 app_name = "internship_b24"
 
 urlpatterns = [
     path("", views.index, name="index"),
 
+    path("deals/", views.deals_list, name="deals_list"),
     path("deals/top10/", views.deals_top10, name="deals_top10"),
+    path("deals/top10/async/", views.deals_top10_async, name="deals_top10_async"),
     path("deals/create/", views.deal_create, name="deal_create"),
+    path("deals/event/", views.deal_event_view, name="deal_event"),
 
     path("module2/", qr_views.qr_form_view, name="module2"),
     path("qr/", include(("internship_b24.qr.urls", "qr"), namespace="qr")),
     path("product/", include(("internship_b24.qr.public_urls", "qr_public"), namespace="qr_public")),
 
+    path("employees/", include(("internship_b24.employees.urls", "employees"), namespace="employees")),
+    path("map/", include(("internship_b24.map.urls", "map"), namespace="map")),
+    path("contacts/", include(("internship_b24.contacts.urls", "contacts"), namespace="contacts")),
+
     path("module3/", views.module3, name="module3"),
     path("module4/", views.module4, name="module4"),
     path("module5/", views.module5, name="module5"),
     path("oauth/bitrix/", views.oauth_bitrix, name="oauth_bitrix"),
+    path("metrics", metrics_view, name="metrics"),
 
 
 ]
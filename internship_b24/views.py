@@ -1,10 +1,24 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
 from django import forms
+from django.conf import settings
 from django.shortcuts import render, redirect
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.clickjacking import xframe_options_exempt
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
-from integration_utils.bitrix24.bitrix_user_auth.main_auth import main_auth
-from .services import load_manuals, humanize_deal_row, UF_PRIORITY_CODE
+from .bx_auth import main_auth
+from .aio import PAGE_SIZE, AsyncBitrixClient, async_main_auth
+from .bx_events import parse_event
+from .deals_list import SORT_FIELDS, DealsQuery, get_deals_page, invalidate_pages
+from .deals_snapshot import apply_deal_event, remember_new_deal, top_deals
+from .ratelimit import portal_key
+from .services import (
+    get_manuals, build_manuals, DealHumanizer,
+    UF_PRIORITY_CODE, MANUALS_CALLS, DEALS_TOP_SELECT,
+)
 
 
 class NewDealForm(forms.Form):
@@ -40,6 +54,11 @@ class NewDealForm(forms.Form):
         self.fields['currency_id'].choices = with_placeholder(m.get('CURRENCY_ID', {}))
         self.fields['uf_priority'].choices = with_placeholder(m.get(UF_PRIORITY_CODE, {}))
 
+    def has_stale_choice(self):
+        """Ошибка только в селектах: значения нет среди вариантов из справочников."""
+        choice_fields = {'type_id', 'currency_id', 'uf_priority'}
+        return bool(self.errors) and set(self.errors) <= choice_fields
+
 
 
 @main_auth(on_start=True, set_cookie=True)
@@ -49,43 +68,166 @@ def index(request):
     return render(request, "index.html")
 
 
+def _top_params(request):
+    """?n=, ?stage=, ?type=, ?priority= страницы топа: (n, stage, type_id, priority)."""
+    default_n = getattr(settings, 'DEALS_TOP_N', 10)
+    try:
+        n = int(request.GET.get('n') or default_n)
+    except ValueError:
+        n = default_n
+    n = max(1, min(n, getattr(settings, 'DEALS_TOP_MAX_N', 100)))
+    return (
+        n,
+        request.GET.get('stage') or '',
+        request.GET.get('type') or '',
+        request.GET.get('priority') or '',
+    )
+
+
+def _top_context(rows, manuals, n, stage, type_id, priority):
+    """Контекст deals_top10.html: строки, текущие фильтры и варианты для формы."""
+    return {
+        'rows': rows,
+        'n': n,
+        'stage': stage,
+        'type_id': type_id,
+        'priority': priority,
+        'stages': manuals.get('STAGE_ID', {}).items(),
+        'types': manuals.get('TYPE_ID', {}).items(),
+        'priorities': manuals.get(UF_PRIORITY_CODE, {}).items(),
+        'uf_priority_label': manuals.get(f'{UF_PRIORITY_CODE}__label', 'Приоритет'),
+    }
+
+
 @main_auth(on_cookies=True)
 def deals_top10(request):
     """
-    Таблица «10 последних активных сделок».
+    Таблица последних активных сделок.
     Авторизация — по токену из cookies, который нам положил main_auth на главной.
+    Строки берутся из локальной копии (deals_snapshot); ?n=, ?stage=, ?type=,
+    ?priority= — размер и фильтры, ?refresh=1 — докачать изменения сейчас.
     """
     but = request.bitrix_user_token
-    deal_fields, manuals = load_manuals(but)
+    force = bool(request.GET.get('refresh'))
+    n, stage, type_id, priority = _top_params(request)
 
-    rows = but.call_list_method('crm.deal.list', fields={
-        'select': [
-            'ID', 'TITLE', 'OPPORTUNITY', 'CURRENCY_ID',
-            'STAGE_ID', 'TYPE_ID', 'BEGINDATE', 'CLOSEDATE',
-            'DATE_CREATE', UF_PRIORITY_CODE
-        ],
-        'filter': {'CLOSED': 'N'},
-        'order': {'DATE_CREATE': 'DESC'},
-    })[:10]
+    _, manuals = get_manuals(but)
+    rows = top_deals(but, n=n, stage=stage, type_id=type_id, priority=priority, force=force)
 
-    rows = [humanize_deal_row(r, manuals) for r in rows]
+    return render(request, "deals_top10.html", _top_context(rows, manuals, n, stage, type_id, priority))
 
-    return render(request, "deals_top10.html", {
-        'rows': rows,
+
+@csrf_exempt
+@require_POST
+def deal_event_view(request):
+    """Обработчик событий ONCRMDEAL* (event.bind): помечает/правит локальную копию сделок."""
+    event = parse_event(request)
+    if event is None:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    apply_deal_event(event)
+    if event.domain:
+        invalidate_pages(event.domain)
+    return JsonResponse({'ok': True})
+
+
+@main_auth(on_cookies=True)
+def deals_list(request):
+    """
+    Все открытые сделки постранично: ?page=, ?sort=, ?dir=asc|desc и фильтры
+    ?stage=, ?type=, ?currency=, ?priority= уходят в crm.deal.list как есть.
+    """
+    but = request.bitrix_user_token
+    query = DealsQuery.from_params(request.GET)
+    _, manuals = get_manuals(but)
+    page = get_deals_page(but, query)
+
+    columns = [
+        ('id', 'ID'), ('title', 'Название'), (None, 'Тип'), ('opportunity', 'Сумма'),
+        (None, 'Валюта'), ('stage', 'Стадия'), ('begindate', 'Дата начала'),
+        ('closedate', 'Дата завершения'), (None, manuals.get(f'{UF_PRIORITY_CODE}__label', 'Приоритет')),
+    ]
+    headers = [
+        {
+            'title': title,
+            'url': '?' + query.querystring(
+                page=1, sort=sort, desc=not query.desc if sort == query.sort else False,
+            ) if sort in SORT_FIELDS else '',
+            'active': sort == query.sort,
+        }
+        for sort, title in columns
+    ]
+
+    return render(request, "deals_list.html", {
+        'rows': DealHumanizer(manuals).rows(page['rows']),
+        'headers': headers,
+        'query': query,
+        'total': page['total'],
+        'pages': page['pages'],
+        'prev_url': '?' + query.querystring(page=query.page - 1) if query.page > 1 else '',
+        'next_url': '?' + query.querystring(page=query.page + 1) if query.page < page['pages'] else '',
+        'stages': manuals.get('STAGE_ID', {}).items(),
+        'types': manuals.get('TYPE_ID', {}).items(),
+        'currencies': manuals.get('CURRENCY_ID', {}).items(),
+        'priorities': manuals.get(UF_PRIORITY_CODE, {}).items(),
         'uf_priority_label': manuals.get(f'{UF_PRIORITY_CODE}__label', 'Приоритет'),
     })
 
 
+@async_main_auth(on_cookies=True)
+async def deals_top10_async(request):
+    """
+    Async-вариант deals_top10 с теми же ?n= и фильтрами, но прямо из Bitrix:
+    справочники (одним batch) и нужные n строк страницы crm.deal.list
+    запрашиваются одновременно.
+    """
+    client = AsyncBitrixClient(request.bitrix_user_token)
+    n, stage, type_id, priority = _top_params(request)
+    flt = {'CLOSED': 'N'}
+    for field, value in (('STAGE_ID', stage), ('TYPE_ID', type_id), (UF_PRIORITY_CODE, priority)):
+        if value:
+            flt[field] = value
+
+    raw_manuals, *pages = await asyncio.gather(
+        client.batch(MANUALS_CALLS),
+        *(
+            client.call_method('crm.deal.list', {
+                'select': DEALS_TOP_SELECT,
+                'filter': flt,
+                'order': {'DATE_CREATE': 'DESC'},
+                'start': start,
+            })
+            for start in range(0, n, PAGE_SIZE)
+        ),
+    )
+    manuals = build_manuals(
+        raw_manuals.get('fields') or {},
+        raw_manuals.get('stages') or [],
+        raw_manuals.get('types') or [],
+        raw_manuals.get('currencies') or [],
+    )
+
+    deals = [deal for page in pages for deal in page or []]
+    rows = DealHumanizer(manuals).rows(deals[:n])
+
+    return await sync_to_async(render)(
+        request, "deals_top10.html", _top_context(rows, manuals, n, stage, type_id, priority),
+    )
+
+
 @main_auth(on_cookies=True)
 def deal_create(request):
     """
     Страница с формой создания сделки (GET) и обработка создания (POST).
     """
     but = request.bitrix_user_token
-    _, manuals = load_manuals(but)
+    _, manuals = get_manuals(but)
 
     if request.method == 'POST':
         form = NewDealForm(request.POST, manuals=manuals)
+        if not form.is_valid() and form.has_stale_choice():
+            # в закэшированных справочниках может не быть только что добавленного значения
+            _, manuals = get_manuals(but, force=True)
+            form = NewDealForm(request.POST, manuals=manuals)
         if form.is_valid():
             cd = form.cleaned_data
             fields = {
@@ -101,7 +243,8 @@ def deal_create(request):
                 fields['CONTACT_ID'] = cd['contact_id']
 
             new_id = but.call_list_method('crm.deal.add', fields={'fields': fields})
-            _ = but.call_list_method('crm.deal.get', fields={'id': new_id})
+            remember_new_deal(but, new_id, fields, manuals)
+            invalidate_pages(portal_key(but))
 
             return redirect('internship_b24:deals_top10')
     else: